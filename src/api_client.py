@@ -1,49 +1,196 @@
+import hashlib
+import queue
 import requests
+import sqlite3
+import threading
 import time
-from typing import Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 from datetime import datetime, timedelta
+from email.utils import parsedate_to_datetime
 import logging
+import json_codec
 from config import (
     API_KEY, API_BASE_URL, API_RATE_LIMIT_REQUESTS,
-    API_RATE_LIMIT_WINDOW_SECONDS, API_RETRY_MAX_ATTEMPTS,
-    API_RETRY_DELAY_SECONDS
+    API_RATE_LIMIT_WINDOW_SECONDS, API_RATE_LIMIT_STATE_PATH, API_RETRY_MAX_ATTEMPTS,
+    API_RETRY_DELAY_SECONDS, VIN_DECODE_WORKERS, PAGE_FETCH_WORKERS,
+    VIN_CACHE_MISS_TTL_HOURS, VIN_CACHE_FAILURE_TTL_HOURS,
+    INCREMENTAL_SORT, INCREMENTAL_STOP_AFTER_KNOWN_PAGES, CRAWL_SHARD_WORKERS, SQUISH_VIN_SHARING
 )
+from crawl_planner import shard_label
 
 logger = logging.getLogger(__name__)
 
+LISTINGS_PER_PAGE = 20
+
 
 class RateLimiter:
-    """Simple rate limiter to respect API limits."""
+    """
+    Token-bucket rate limiter to respect API limits.
+
+    The bucket holds up to max_requests tokens and refills at
+    max_requests / window_seconds tokens per second, so acquiring is O(1).
+    When shared_state_path is set, the bucket lives in a small SQLite file and
+    every process on the host draws from the same budget.
+    """
     
-    def __init__(self, max_requests: int, window_seconds: int):
+    def __init__(self, max_requests: int, window_seconds: int, shared_state_path: Optional[str] = None,
+                 name: str = "auto.dev"):
         self.max_requests = max_requests
         self.window_seconds = window_seconds
-        self.requests = []
+        self.capacity = float(max_requests)
+        self.refill_rate = max_requests / float(window_seconds)  # tokens per second
+        self.name = name
+        self.shared_state_path = shared_state_path or None
+        
+        # In-process bucket state: (tokens, updated_at, blocked_until)
+        self._state = (self.capacity, time.time(), 0.0)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        
+        if self.shared_state_path:
+            conn = self._shared_connection()
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+                    name TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    blocked_until REAL NOT NULL DEFAULT 0
+                )
+            """)
+            conn.execute(
+                "INSERT OR IGNORE INTO rate_limit_buckets (name, tokens, updated_at, blocked_until) VALUES (?, ?, ?, 0)",
+                (self.name, self.capacity, time.time())
+            )
     
     def wait_if_needed(self):
-        """Wait if we've hit the rate limit."""
-        now = datetime.now()
-        # Remove old requests outside the window
-        self.requests = [
-            req_time for req_time in self.requests 
-            if (now - req_time).total_seconds() < self.window_seconds
-        ]
-        
-        if len(self.requests) >= self.max_requests:
-            # Calculate how long to wait
-            oldest_request = min(self.requests)
-            wait_time = self.window_seconds - (now - oldest_request).total_seconds()
-            if wait_time > 0:
-                logger.info(f"Rate limit reached. Waiting {wait_time:.1f} seconds...")
-                time.sleep(wait_time + 0.1)  # Add small buffer
-        
-        self.requests.append(now)
+        """Wait until a request token is available, then consume it."""
+        while True:
+            wait_time = self._update(self._take_token)
+            if wait_time <= 0:
+                return
+            if wait_time >= 1:
+                logger.info("Rate limit reached. Waiting %.1f seconds...", wait_time)
+            time.sleep(wait_time)
+    
+    acquire = wait_if_needed
+    
+    def pause(self, seconds: float):
+        """Block all requests (in every sharing process) for the given number of seconds."""
+        until = time.time() + seconds
+        self._update(lambda state, now: ((state[0], state[1], max(state[2], until)), 0))
+    
+    def update_from_response(self, status_code: int, headers) -> Optional[float]:
+        """
+        Adapt the bucket to server feedback: Retry-After and X-RateLimit-*/RateLimit-*
+        headers. Returns the pause applied in seconds, if any.
+        """
+        retry_after = self._parse_retry_after(headers.get("Retry-After"))
+        remaining = self._parse_number(headers.get("X-RateLimit-Remaining", headers.get("RateLimit-Remaining")))
+        reset = self._parse_reset(headers.get("X-RateLimit-Reset", headers.get("RateLimit-Reset")))
+        
+        if status_code == 429 and retry_after is None:
+            retry_after = reset if reset is not None else 60.0
+        
+        if remaining is not None:
+            # Never believe we have more tokens than the server says we do
+            self._update(lambda state, now: ((min(state[0], remaining), state[1], state[2]), 0))
+            if remaining < 1 and reset is not None and retry_after is None:
+                retry_after = reset
+        
+        if retry_after is not None and retry_after > 0:
+            self.pause(retry_after)
+            return retry_after
+        return None
+    
+    def _take_token(self, state: Tuple[float, float, float], now: float):
+        """Refill and try to take one token. Returns (new_state, seconds_to_wait)."""
+        tokens, updated_at, blocked_until = state
+        if now < blocked_until:
+            return state, blocked_until - now
+        
+        tokens = min(self.capacity, tokens + (now - updated_at) * self.refill_rate)
+        if tokens >= 1:
+            return (tokens - 1, now, blocked_until), 0
+        return (tokens, now, blocked_until), (1 - tokens) / self.refill_rate
+    
+    def _update(self, func):
+        """Apply func(state, now) -> (new_state, result) atomically and return result."""
+        with self._lock:
+            if not self.shared_state_path:
+                self._state, result = func(self._state, time.time())
+                return result
+            
+            conn = self._shared_connection()
+            conn.execute("BEGIN IMMEDIATE")  # Locks out other processes until commit
+            try:
+                row = conn.execute(
+                    "SELECT tokens, updated_at, blocked_until FROM rate_limit_buckets WHERE name = ?",
+                    (self.name,)
+                ).fetchone()
+                state = tuple(row) if row else (self.capacity, time.time(), 0.0)
+                new_state, result = func(state, time.time())
+                conn.execute(
+                    "INSERT OR REPLACE INTO rate_limit_buckets (name, tokens, updated_at, blocked_until) VALUES (?, ?, ?, ?)",
+                    (self.name,) + tuple(new_state)
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            return result
+    
+    def _shared_connection(self) -> sqlite3.Connection:
+        """One autocommit connection per thread to the shared state file."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.shared_state_path, timeout=30, isolation_level=None)
+            self._local.conn = conn
+        return conn
+    
+    @staticmethod
+    def _parse_number(value) -> Optional[float]:
+        try:
+            return float(value) if value is not None else None
+        except (TypeError, ValueError):
+            return None
+    
+    @classmethod
+    def _parse_retry_after(cls, value) -> Optional[float]:
+        """Retry-After is either delay-seconds or an HTTP date."""
+        if value is None:
+            return None
+        seconds = cls._parse_number(value)
+        if seconds is not None:
+            return seconds
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return max(0.0, retry_at.timestamp() - time.time())
+    
+    @classmethod
+    def _parse_reset(cls, value) -> Optional[float]:
+        """Reset headers are either seconds-until-reset or an epoch timestamp."""
+        reset = cls._parse_number(value)
+        if reset is None:
+            return None
+        if reset > 1_000_000_000:
+            reset -= time.time()
+        return max(0.0, reset)
 
 
 class AutoDevAPI:
     """Client for Auto.dev API."""
     
-    def __init__(self):
+    def __init__(self, cache=None, offline_decoder=None, replay=None):
+        """
+        cache: optional object providing get_cached_vin_decode/cache_vin_decode
+        (normally the Database) used to avoid re-decoding known VINs.
+        offline_decoder: optional OfflineVINDecoder tried before calling the API.
+        replay: optional ResponseReplay answering every request instead of the API.
+        Set archive to a ResponseArchive to record every response.
+        """
         self.session = requests.Session()
         self.session.headers.update({
             "Authorization": f"Bearer {API_KEY}",
@@ -51,14 +198,41 @@ class AutoDevAPI:
         })
         self.rate_limiter = RateLimiter(
             API_RATE_LIMIT_REQUESTS, 
-            API_RATE_LIMIT_WINDOW_SECONDS
+            API_RATE_LIMIT_WINDOW_SECONDS,
+            shared_state_path=API_RATE_LIMIT_STATE_PATH
         )
         self.api_calls_count = 0
+        self.vin_cache = cache
+        self.offline_decoder = offline_decoder
+        self.replay = replay
+        self.archive = None
+        self.vin_cache_hits = 0
+        self.squish_decodes_shared = 0
+        self.offline_decodes = 0
+        self.page_latencies = {}
+        self._count_lock = threading.Lock()
     
     def _make_request(self, method: str, endpoint: str, params: Optional[Dict] = None, 
                      data: Optional[Dict] = None) -> Optional[Dict]:
         """Make an API request with rate limiting and retry logic."""
+        return self._request(method, endpoint, params=params, data=data)[0]
+    
+    def _request(self, method: str, endpoint: str, params: Optional[Dict] = None,
+                 data: Optional[Dict] = None) -> Tuple[Optional[Dict], Optional[int]]:
+        """Make an API request. Returns (json_body, last_status_code)."""
+        if self.replay:
+            return self.replay.response(method, endpoint, params)
+        
+        body, status_code = self._request_live(method, endpoint, params=params, data=data)
+        if self.archive:
+            self.archive.record(method, endpoint, params, status_code, body)
+        return body, status_code
+    
+    def _request_live(self, method: str, endpoint: str, params: Optional[Dict] = None,
+                      data: Optional[Dict] = None) -> Tuple[Optional[Dict], Optional[int]]:
+        """Send the request with rate limiting and retries."""
         url = f"{API_BASE_URL}{endpoint}"
+        status_code = None
         
         for attempt in range(API_RETRY_MAX_ATTEMPTS):
             try:
@@ -74,44 +248,55 @@ class AutoDevAPI:
                     timeout=30
                 )
                 
-                self.api_calls_count += 1
+                with self._count_lock:
+                    self.api_calls_count += 1
+                status_code = response.status_code
+                
+                # Let the limiter adapt to Retry-After / rate-limit headers
+                pause = self.rate_limiter.update_from_response(status_code, response.headers)
                 
                 # Handle different status codes
                 if response.status_code == 200:
-                    return response.json()
+                    return json_codec.loads(response.content), status_code
                 elif response.status_code == 429:  # Rate limited
-                    retry_after = int(response.headers.get('Retry-After', 60))
-                    logger.warning(f"API rate limited. Waiting {retry_after} seconds...")
-                    time.sleep(retry_after)
+                    # The limiter is paused, so the next wait_if_needed() sleeps it out
+                    logger.warning(f"API rate limited. Waiting {pause or 0:.0f} seconds...")
                     continue
                 elif response.status_code == 401:
                     logger.error("Authentication failed. Check your API key.")
-                    return None
+                    return None, status_code
+                elif response.status_code in (400, 404, 422):
+                    # Rejected request (e.g. undecodable VIN) - retrying won't help
+                    logger.warning(f"API rejected request: {response.status_code} - {url}")
+                    return None, status_code
                 else:
                     logger.error(f"API request failed: {response.status_code} - {response.text}")
                     
                     if attempt < API_RETRY_MAX_ATTEMPTS - 1:
                         time.sleep(API_RETRY_DELAY_SECONDS)
                         continue
-                    return None
+                    return None, status_code
                     
             except requests.RequestException as e:
                 logger.error(f"Request error: {str(e)}")
                 if attempt < API_RETRY_MAX_ATTEMPTS - 1:
                     time.sleep(API_RETRY_DELAY_SECONDS)
                     continue
-                return None
+                return None, status_code
         
-        return None
+        return None, status_code
     
-    def get_4runner_listings(self, page: int = 1, per_page: int = 20) -> Optional[Dict]:
-        """Get Toyota 4Runner listings from the API."""
+    def get_4runner_listings(self, page: int = 1, per_page: int = LISTINGS_PER_PAGE,
+                             sort: Optional[str] = None, filters: Optional[Dict] = None) -> Optional[Dict]:
+        """Get Toyota 4Runner listings from the API. filters override the configured year/location params."""
         params = {
             "make": "Toyota",
             "model": "4Runner",
             "page": page,
             "per_page": per_page
         }
+        if sort:
+            params["sort_filter"] = sort
         
         # Add year filter if configured
         from config import TARGET_YEARS, SEARCH_ZIP_CODE, SEARCH_LATITUDE, SEARCH_LONGITUDE
@@ -130,61 +315,418 @@ class AutoDevAPI:
             params["lat"] = float(SEARCH_LATITUDE)
             params["lon"] = float(SEARCH_LONGITUDE)
         
-        logger.info(f"Fetching 4Runner listings page {page} with params: {params}")
+        if filters:
+            if "zip" in filters:
+                params.pop("lat", None)
+                params.pop("lon", None)
+            params.update(filters)
+        
+        logger.debug("Fetching 4Runner listings page %d with params: %s", page, params)
         result = self._make_request("GET", "/listings", params=params)
-        if result:
-            logger.info(f"API Response keys: {list(result.keys()) if result else 'None'}")
-            logger.info(f"Total count in response: {result.get('totalCount', 'Not found')}")
-            # Log first few records if any
+        if result and logger.isEnabledFor(logging.DEBUG):
             records = result.get('records', [])
-            if records:
-                logger.info(f"Found {len(records)} records on this page")
-                logger.info(f"First record: Year={records[0].get('year')}, VIN={records[0].get('vin')}")
+            logger.debug("Listings page %d: totalCount=%s, %d records, first VIN=%s", page,
+                         result.get('totalCount', 'Not found'), len(records),
+                         records[0].get('vin') if records else None)
         return result
     
-    def get_all_4runner_listings(self) -> List[Dict]:
-        """Get all Toyota 4Runner listings, handling pagination."""
+    def get_listing(self, listing_id) -> Tuple[str, Optional[Dict]]:
+        """
+        Re-fetch one known listing by its auto.dev id (one request, no paging).
+        Returns (status, record): 'active', 'removed' (410 or flagged inactive),
+        'not_found' (404 - the listing may have been relisted under a new id) or
+        'failure' (anything else). Callers fall back to find_listing_by_vin for both
+        of the last two.
+        """
+        body, status_code = self._request("GET", f"/listings/{listing_id}")
+        if body:
+            return ("removed" if body.get("active") is False else "active"), body
+        if status_code == 410:
+            return "removed", None
+        if status_code == 404:
+            return "not_found", None
+        return "failure", None
+
+    def find_listing_by_vin(self, vin: str, year: Optional[int] = None) -> Tuple[str, Optional[Dict]]:
+        """
+        Fallback for get_listing: one search page filtered to the VIN (and model year).
+        Returns (status, record): 'active', 'not_found' or 'failure'. A search that
+        misses the VIN is not proof the listing is gone, so it is never 'removed'.
+        """
+        filters = {"vin": vin}
+        if year:
+            filters.update(year_min=year, year_max=year)
+        result = self.get_4runner_listings(page=1, filters=filters)
+        if result is None:
+            return "failure", None
+        for record in result.get("records", []):
+            if record.get("vin") == vin:
+                return "active", record
+        return "not_found", None
+
+    def get_all_4runner_listings(self, parallel: Optional[bool] = None) -> List[Dict]:
+        """
+        Get all Toyota 4Runner listings, handling pagination.
+        
+        With parallel fetching (default when PAGE_FETCH_WORKERS > 1), page 1 is
+        fetched first to learn totalCount and the remaining pages are fetched
+        concurrently under the shared rate limiter. Listings are de-duplicated by VIN.
+        """
+        all_listings = list(self.iter_4runner_listings(parallel=parallel))
+        logger.info(f"Total listings fetched: {len(all_listings)}")
+        return all_listings
+    
+    def iter_4runner_listings(self, parallel: Optional[bool] = None) -> Iterator[Dict]:
+        """Generator variant of get_all_4runner_listings yielding listings as pages arrive."""
+        for listings in self.iter_4runner_listing_pages(parallel=parallel):
+            yield from listings
+    
+    def iter_4runner_listing_pages(self, parallel: Optional[bool] = None,
+                                   shards: Optional[List[Dict]] = None) -> Iterator[List[Dict]]:
+        """
+        Yield each page of listings (de-duplicated by VIN) as soon as it arrives.
+        In parallel mode the remaining pages are already in flight while the caller
+        processes page 1, and are yielded in completion order.
+        
+        With shards (see crawl_planner.plan_shards) each shard is paged on its own
+        worker thread and the pages are merged with VIN de-duplication across shards.
+        """
+        if parallel is None:
+            parallel = PAGE_FETCH_WORKERS > 1
+        
+        self.page_latencies = {}
+        
+        if shards:
+            yield from self._iter_sharded_listing_pages(shards)
+            return
+        
+        seen_vins = set()
+        
+        page, response, latency = self._fetch_listings_page(1)
+        if not response:
+            logger.error("Failed to fetch page 1")
+            return
+        
+        listings = response.get("records", response.get("listings", []))
+        total_count = response.get("totalCount", 0)
+        total_pages = (total_count + LISTINGS_PER_PAGE - 1) // LISTINGS_PER_PAGE if total_count > 0 else 1
+        logger.info("Fetched page 1/%d - %d listings in %.2fs (Total: %d)", total_pages, len(listings), latency,
+                    total_count, extra={"event": "page.fetched"})
+        
+        remaining_pages = iter(())
+        if total_pages > 1 and len(listings) >= LISTINGS_PER_PAGE:
+            if parallel:
+                remaining_pages = self._start_remaining_pages_parallel(total_pages)
+            else:
+                remaining_pages = self._iter_remaining_pages_serial(total_pages)
+        
+        yield self._dedupe_by_vin(listings, seen_vins)
+        for listings in remaining_pages:
+            yield self._dedupe_by_vin(listings, seen_vins)
+        
+        if self.page_latencies:
+            latencies = list(self.page_latencies.values())
+            logger.info(
+                f"Page latency: avg {sum(latencies) / len(latencies):.2f}s, "
+                f"max {max(latencies):.2f}s over {len(latencies)} pages"
+            )
+    
+    def get_new_4runner_listings(self, is_known: Callable[[Dict], bool], previous_state: Optional[Dict] = None,
+                                 stop_after_known_pages: int = INCREMENTAL_STOP_AFTER_KNOWN_PAGES
+                                 ) -> Tuple[List[Dict], Dict]:
+        """
+        Incremental crawl: page newest-first and stop once the results are old news.
+        
+        is_known(listing) should return True for listings already stored and unchanged.
+        Paging stops after stop_after_known_pages consecutive pages of known listings.
+        If page 1 has the same totalCount and fingerprint as previous_state, nothing
+        else is fetched.
+        
+        Returns (listings, crawl_state); crawl_state['unchanged'] is True when skipped.
+        """
+        self.page_latencies = {}
+        seen_vins = set()
         all_listings = []
-        page = 1
+        
+        page, response, latency = self._fetch_listings_page(1, sort=INCREMENTAL_SORT)
+        if not response:
+            logger.error("Failed to fetch page 1")
+            return all_listings, {"unchanged": False, "failed": True}
+        
+        listings = response.get("records", response.get("listings", []))
+        total_count = response.get("totalCount", 0)
+        state = {
+            "total_count": total_count,
+            "fingerprint": self.listings_fingerprint(listings),
+            "unchanged": False
+        }
+        
+        if (previous_state and previous_state.get("total_count") == state["total_count"]
+                and previous_state.get("fingerprint") == state["fingerprint"]):
+            logger.info(f"First page unchanged since last run (Total: {total_count}) - skipping crawl")
+            state["unchanged"] = True
+            return all_listings, state
+        
+        total_pages = (total_count + LISTINGS_PER_PAGE - 1) // LISTINGS_PER_PAGE if total_count > 0 else 1
+        known_pages = 0
         
         while True:
-            response = self.get_4runner_listings(page=page)
+            all_listings.extend(self._dedupe_by_vin(listings, seen_vins))
+            logger.info("Fetched page %d/%d - %d listings in %.2fs", page, total_pages, len(listings), latency,
+                        extra={"event": "page.fetched"})
+            
+            if listings and all(is_known(listing) for listing in listings):
+                known_pages += 1
+            else:
+                known_pages = 0
             
+            if known_pages >= stop_after_known_pages:
+                logger.info(f"Reached {known_pages} consecutive pages of known listings - stopping at page {page}")
+                break
+            if page >= total_pages or len(listings) < LISTINGS_PER_PAGE:
+                break
+            
+            page, response, latency = self._fetch_listings_page(page + 1, sort=INCREMENTAL_SORT)
             if not response:
                 logger.error(f"Failed to fetch page {page}")
                 break
-            
-            # Auto.dev API uses 'records' instead of 'listings'
             listings = response.get("records", response.get("listings", []))
             if not listings:
                 break
+        
+        logger.info(f"Incremental crawl fetched {len(all_listings)} listings from {page} of {total_pages} pages")
+        return all_listings, state
+    
+    @staticmethod
+    def listings_fingerprint(listings: List[Dict]) -> str:
+        """Stable hash of the VIN/price/mileage of a page of listings."""
+        digest = hashlib.sha1()
+        for listing in listings:
+            digest.update(f"{listing.get('vin')}|{listing.get('price')}|{listing.get('mileage')}\n".encode())
+        return digest.hexdigest()
+    
+    def _fetch_listings_page(self, page: int, sort: Optional[str] = None,
+                             filters: Optional[Dict] = None) -> Tuple[int, Optional[Dict], float]:
+        """Fetch one listings page. Returns (page, response, latency_seconds)."""
+        started = time.monotonic()
+        response = self.get_4runner_listings(page=page, per_page=LISTINGS_PER_PAGE, sort=sort, filters=filters)
+        latency = time.monotonic() - started
+        self.page_latencies[(shard_label(filters), page) if filters else page] = latency
+        return page, response, latency
+    
+    def _iter_remaining_pages_serial(self, total_pages: int, filters: Optional[Dict] = None) -> Iterator[List[Dict]]:
+        """Walk pages 2..total_pages one at a time."""
+        for page in range(2, total_pages + 1):
+            time.sleep(1)  # Be nice to the API
             
-            all_listings.extend(listings)
+            page, response, latency = self._fetch_listings_page(page, filters=filters)
+            if not response:
+                logger.error(f"Failed to fetch page {page}")
+                break
             
-            # Check if there are more pages based on total count
-            total_count = response.get("totalCount", 0)
-            per_page = 20  # We request 20 per page
-            total_pages = (total_count + per_page - 1) // per_page if total_count > 0 else 1
+            # Auto.dev API uses 'records' instead of 'listings'
+            listings = response.get("records", response.get("listings", []))
+            if not listings:
+                break
             
-            logger.info(f"Fetched page {page}/{total_pages} - {len(listings)} listings (Total: {total_count})")
+            logger.info("Fetched page %d/%d - %d listings in %.2fs", page, total_pages, len(listings), latency,
+                        extra={"event": "page.fetched"})
+            yield listings
             
-            if page >= total_pages or len(listings) < per_page:
+            if len(listings) < LISTINGS_PER_PAGE:
                 break
-            
-            page += 1
-            time.sleep(1)  # Be nice to the API
+    
+    def _start_remaining_pages_parallel(self, total_pages: int) -> Iterator[List[Dict]]:
+        """Submit pages 2..total_pages to a thread pool now; the returned generator yields them as they finish."""
+        pages = list(range(2, total_pages + 1))
+        workers = max(1, min(PAGE_FETCH_WORKERS, len(pages)))
+        logger.info(f"Fetching {len(pages)} remaining pages with {workers} workers")
         
-        logger.info(f"Total listings fetched: {len(all_listings)}")
-        return all_listings
+        executor = ThreadPoolExecutor(max_workers=workers)
+        futures = [executor.submit(self._fetch_listings_page, page) for page in pages]
+        
+        def drain():
+            try:
+                for future in as_completed(futures):
+                    page, response, latency = future.result()
+                    if not response:
+                        logger.error(f"Failed to fetch page {page}")
+                        continue
+                    listings = response.get("records", response.get("listings", []))
+                    logger.info("Fetched page %d/%d - %d listings in %.2fs", page, total_pages, len(listings),
+                                latency, extra={"event": "page.fetched"})
+                    yield listings
+            finally:
+                # Don't keep fetching if the consumer stops early (shutdown's
+                # cancel_futures needs Python 3.9)
+                for future in futures:
+                    future.cancel()
+                executor.shutdown(wait=False)
+        
+        return drain()
+    
+    def _iter_shard_pages(self, shard: Dict) -> Iterator[List[Dict]]:
+        """Page through one shard serially."""
+        label = shard_label(shard)
+        page, response, latency = self._fetch_listings_page(1, filters=shard)
+        if not response:
+            logger.error(f"Shard {label}: failed to fetch page 1")
+            return
+        
+        listings = response.get("records", response.get("listings", []))
+        total_count = response.get("totalCount", 0)
+        total_pages = (total_count + LISTINGS_PER_PAGE - 1) // LISTINGS_PER_PAGE if total_count > 0 else 1
+        logger.info(f"Shard {label}: page 1/{total_pages} - {len(listings)} listings in {latency:.2f}s "
+                    f"(Total: {total_count})")
+        yield listings
+        
+        if total_pages > 1 and len(listings) >= LISTINGS_PER_PAGE:
+            yield from self._iter_remaining_pages_serial(total_pages, filters=shard)
+    
+    def _iter_sharded_listing_pages(self, shards: List[Dict]) -> Iterator[List[Dict]]:
+        """Crawl shards concurrently and yield their pages, VIN de-duplicated, in arrival order."""
+        workers = max(1, min(CRAWL_SHARD_WORKERS, len(shards)))
+        logger.info(f"Crawling {len(shards)} shards with {workers} workers")
+        
+        pages = queue.Queue()
+        stop = threading.Event()
+        done = object()
+        
+        def crawl(shard):
+            try:
+                for listings in self._iter_shard_pages(shard):
+                    if stop.is_set():
+                        return
+                    pages.put(listings)
+            except Exception as e:
+                logger.error(f"Shard {shard_label(shard)} failed: {e}")
+            finally:
+                pages.put(done)
+        
+        executor = ThreadPoolExecutor(max_workers=workers)
+        futures = [executor.submit(crawl, shard) for shard in shards]
+        
+        seen_vins = set()
+        fetched = 0
+        finished = 0
+        try:
+            while finished < len(shards):
+                listings = pages.get()
+                if listings is done:
+                    finished += 1
+                    continue
+                fetched += len(listings)
+                unique = self._dedupe_by_vin(listings, seen_vins)
+                if unique:
+                    yield unique
+        finally:
+            # Don't keep crawling if the consumer stops early
+            stop.set()
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+        
+        logger.info(f"Sharded crawl: {fetched} listings fetched, {len(seen_vins)} unique VINs "
+                    f"across {len(shards)} shards")
+    
+    @staticmethod
+    def _dedupe_by_vin(listings: List[Dict], seen_vins: set) -> List[Dict]:
+        """Drop listings whose VIN was already returned on an earlier page."""
+        unique = []
+        for listing in listings:
+            vin = listing.get("vin")
+            if vin:
+                if vin in seen_vins:
+                    continue
+                seen_vins.add(vin)
+            unique.append(listing)
+        return unique
     
     def decode_vin(self, vin: str) -> Optional[Dict]:
         """Decode a VIN to get detailed vehicle information."""
+        return self._decode_vin_entry(vin)[1]
+    
+    def _decode_vin_entry(self, vin: str, retry_failures: bool = False) -> Tuple[str, Optional[Dict]]:
+        """
+        Decode a VIN, consulting the cache, the offline decoder and squish VIN
+        decodes before the API.
+        Returns (status, data) where status is 'hit', 'miss' (VIN rejected) or 'failure'.
+        With retry_failures, cached transient failures are retried instead of returned.
+        """
         if not vin or len(vin) != 17:
             logger.warning(f"Invalid VIN: {vin}")
-            return None
+            return "miss", None
+        
+        if self.vin_cache:
+            cached = self.vin_cache.get_cached_vin_decode(vin)
+            if cached and not (retry_failures and cached["status"] == "failure"):
+                logger.debug("VIN decode cache %s: %s", cached["status"], vin)
+                with self._count_lock:
+                    self.vin_cache_hits += 1
+                return cached["status"], cached["data"]
+            
+        if self.offline_decoder:
+            data = self.offline_decoder.decode(vin)
+            if data:
+                logger.debug("VIN decoded offline: %s", vin)
+                with self._count_lock:
+                    self.offline_decodes += 1
+                return "hit", data
+        
+        # A replay answers from the archive (exact VIN first, then the same squish VIN)
+        if self.vin_cache and not self.replay:
+            if SQUISH_VIN_SHARING:
+                shared = self.vin_cache.get_squish_vin_decode(vin)
+                if shared:
+                    logger.debug("VIN %s shares squish VIN with %s - reusing decode", vin, shared["source_vin"])
+                    data = dict(shared["data"])
+                    if "vin" in data:
+                        data["vin"] = vin
+                    with self._count_lock:
+                        self.squish_decodes_shared += 1
+                    self.vin_cache.cache_vin_decode(vin, "hit", data)
+                    return "hit", data
+        
+        logger.debug("Decoding VIN: %s", vin)
+        data, status_code = self._request("GET", f"/vin/{vin}")
+        
+        if self.replay and status_code is None:
+            # Not in the archived run - that says nothing about the VIN, so don't
+            # cache it or report a failure that would be retried
+            return "miss", None
+        
+        if data:
+            status, ttl_hours = "hit", None
+        elif status_code in (400, 404, 422):
+            status, ttl_hours = "miss", VIN_CACHE_MISS_TTL_HOURS
+        else:
+            status, ttl_hours = "failure", VIN_CACHE_FAILURE_TTL_HOURS
         
-        logger.debug(f"Decoding VIN: {vin}")
-        return self._make_request("GET", f"/vin/{vin}")
+        if self.vin_cache:
+            self.vin_cache.cache_vin_decode(vin, status, data, ttl_hours=ttl_hours)
+        return status, data
+    
+    def decode_vins(self, vins: List[str], max_workers: Optional[int] = None) -> List[Optional[Dict]]:
+        """Decode several VINs concurrently. Results are returned in input order."""
+        return [data for _, data in self.decode_vins_with_status(vins, max_workers=max_workers)]
+    
+    def decode_vins_with_status(self, vins: List[str], max_workers: Optional[int] = None,
+                                retry_failures: bool = False) -> List[Tuple[str, Optional[Dict]]]:
+        """Like decode_vins, but returns (status, data) pairs - see _decode_vin_entry."""
+        if not vins:
+            return []
+        
+        def decode(vin):
+            return self._decode_vin_entry(vin, retry_failures=retry_failures)
+        
+        workers = max(1, min(max_workers or VIN_DECODE_WORKERS, len(vins)))
+        if workers == 1:
+            return [decode(vin) for vin in vins]
+        
+        logger.info(f"Decoding {len(vins)} VINs with {workers} workers")
+        # The shared rate limiter still gates every request made by the pool
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(decode, vins))
     
     def get_api_calls_count(self) -> int:
         """Get the total number of API calls made."""
@@ -192,4 +734,7 @@ class AutoDevAPI:
     
     def reset_api_calls_count(self):
         """Reset the API calls counter."""
-        self.api_calls_count = 0
\ No newline at end of file
+        self.api_calls_count = 0
+        self.vin_cache_hits = 0
+        self.squish_decodes_shared = 0
+        self.offline_decodes = 0
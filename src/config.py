@@ -8,25 +8,61 @@ load_dotenv(env_path)
 
 # API Configuration
 API_KEY = os.getenv("AUTO_DEV_API_KEY", "your_auto_dev_api_key")
-API_BASE_URL = "https://auto.dev/api"
+# Override to point at a local stand-in (see tests/fake_auto_dev.py)
+API_BASE_URL = os.getenv("API_BASE_URL", "https://auto.dev/api")
 
 # Database Configuration - store in project root
-PROJECT_ROOT = Path(__file__).parent.parent
+PROJECT_ROOT = Path(__file__).resolve().parent.parent  # resolved - tests/ scripts import it as ../config.py
 DATABASE_PATH = os.getenv("DATABASE_PATH", str(PROJECT_ROOT / "4runner_tracker.db"))
 
 # Search Configuration
 SEARCH_INTERVAL_MINUTES = int(os.getenv("SEARCH_INTERVAL_MINUTES", "60"))
+# Scheduler daemon (scheduler.py) - the interval adapts between these bounds, aiming
+# for about SCHEDULER_TARGET_NEW_PER_RUN new listings per run, with +/- jitter
+SCHEDULER_MIN_INTERVAL_MINUTES = float(os.getenv("SCHEDULER_MIN_INTERVAL_MINUTES", "15"))
+SCHEDULER_MAX_INTERVAL_MINUTES = float(os.getenv("SCHEDULER_MAX_INTERVAL_MINUTES", "240"))
+SCHEDULER_TARGET_NEW_PER_RUN = float(os.getenv("SCHEDULER_TARGET_NEW_PER_RUN", "2"))
+SCHEDULER_JITTER = float(os.getenv("SCHEDULER_JITTER", "0.1"))
+# Lock file preventing overlapping searches (scheduler, web /refresh, other processes)
+CRAWL_LOCK_PATH = os.getenv("CRAWL_LOCK_PATH", str(PROJECT_ROOT / ".crawl.lock"))
+# How often the daemon re-checks watched listings (price/status) between crawls; 0 disables
+WATCHED_REFRESH_INTERVAL_MINUTES = float(os.getenv("WATCHED_REFRESH_INTERVAL_MINUTES", "10"))
 SEARCH_RADIUS_MILES = os.getenv("SEARCH_RADIUS_MILES", None)
 TARGET_YEARS = {
     "min": int(os.getenv("TARGET_YEAR_MIN", "1984")),
     "max": int(os.getenv("TARGET_YEAR_MAX", "2002"))
 }
 
+# Incremental crawl - page newest-first and stop after N pages of known, unchanged listings
+INCREMENTAL_CRAWL = os.getenv("INCREMENTAL_CRAWL", "false").lower() == "true"
+INCREMENTAL_SORT = os.getenv("INCREMENTAL_SORT", "createdAt:desc")
+INCREMENTAL_STOP_AFTER_KNOWN_PAGES = int(os.getenv("INCREMENTAL_STOP_AFTER_KNOWN_PAGES", "2"))
+
+# Crawl sharding - split the search by model year and/or origin zip and page the
+# shards concurrently. CRAWL_SHARD_BY is empty (single crawl), "year", "zip" or "year,zip".
+CRAWL_SHARD_BY = os.getenv("CRAWL_SHARD_BY", "")
+CRAWL_YEARS_PER_SHARD = int(os.getenv("CRAWL_YEARS_PER_SHARD", "1"))
+CRAWL_ORIGIN_ZIPS = [z.strip() for z in os.getenv("CRAWL_ORIGIN_ZIPS", "").split(",") if z.strip()]
+CRAWL_SHARD_WORKERS = int(os.getenv("CRAWL_SHARD_WORKERS", "4"))
+
+# Known listings whose content is unchanged only get last_seen rewritten this often
+LAST_SEEN_TOUCH_HOURS = float(os.getenv("LAST_SEEN_TOUCH_HOURS", "12"))
+
+# Index of already-stored VINs: "set" (fastest), "sorted" (compact) or "bloom" (smallest)
+SEEN_VIN_INDEX_BACKEND = os.getenv("SEEN_VIN_INDEX_BACKEND", "set")
+
 # Location Configuration
 SEARCH_ZIP_CODE = os.getenv("SEARCH_ZIP_CODE", None)
 SEARCH_LATITUDE = os.getenv("SEARCH_LATITUDE", None)
 SEARCH_LONGITUDE = os.getenv("SEARCH_LONGITUDE", None)
 
+# Logging - text or json output, optional file, and per-event sampling of chatty
+# per-listing lines ("event=rate" pairs; 0.1 keeps 1 in 10, 0 drops them)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+LOG_FILE = os.getenv("LOG_FILE", "")
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "listing.new=0.1,listing.research=0.1")
+
 # Notification Configuration
 NOTIFICATION_METHODS = os.getenv("NOTIFICATION_METHODS", "email,slack").split(",")
 EMAIL_TO = os.getenv("EMAIL_TO", "")
@@ -39,9 +75,57 @@ SLACK_WEBHOOK_URL = os.getenv("SLACK_WEBHOOK_URL", "")
 # API Rate Limiting
 API_RATE_LIMIT_REQUESTS = int(os.getenv("API_RATE_LIMIT_REQUESTS", "100"))
 API_RATE_LIMIT_WINDOW_SECONDS = int(os.getenv("API_RATE_LIMIT_WINDOW_SECONDS", "60"))
+# SQLite file holding the shared token bucket so all processes on this host share
+# one budget. Set to an empty string to keep the limit per-process.
+API_RATE_LIMIT_STATE_PATH = os.getenv("API_RATE_LIMIT_STATE_PATH", str(PROJECT_ROOT / "rate_limit_state.db"))
 API_RETRY_MAX_ATTEMPTS = int(os.getenv("API_RETRY_MAX_ATTEMPTS", "3"))
 API_RETRY_DELAY_SECONDS = int(os.getenv("API_RETRY_DELAY_SECONDS", "5"))
 
+# VIN decode cache - how long to remember VINs the API rejected or failed on
+VIN_CACHE_MISS_TTL_HOURS = float(os.getenv("VIN_CACHE_MISS_TTL_HOURS", "720"))
+VIN_CACHE_FAILURE_TTL_HOURS = float(os.getenv("VIN_CACHE_FAILURE_TTL_HOURS", "6"))
+# Local VIN decode database (see vin_offline_decoder.py), consulted before the API
+# when the file exists. Set to an empty string to disable.
+VIN_OFFLINE_DB_PATH = os.getenv("VIN_OFFLINE_DB_PATH", str(PROJECT_ROOT / "vin_offline.db"))
+# Reuse the decode of a stored VIN with the same squish VIN (positions 1-8, 10-11)
+SQUISH_VIN_SHARING = os.getenv("SQUISH_VIN_SHARING", "true").lower() == "true"
+# VIN transmission rule file, and how often long-running processes check it for changes (0 = never)
+VIN_PATTERNS_PATH = os.getenv("VIN_PATTERNS_PATH", str(PROJECT_ROOT / "src" / "vin_patterns.json"))
+VIN_PATTERNS_RELOAD_SECONDS = float(os.getenv("VIN_PATTERNS_RELOAD_SECONDS", "30"))
+# Learn pattern confidences from decode outcomes: a (model_code, year) with at least
+# PATTERN_LEARNING_MIN_OBSERVATIONS decodes gets a learned confidence, and one with
+# PATTERN_SKIP_DECODE_MIN_OBSERVATIONS decodes and no counterexample is no longer decoded
+PATTERN_LEARNING_ENABLED = os.getenv("PATTERN_LEARNING_ENABLED", "true").lower() == "true"
+PATTERN_LEARNING_MIN_OBSERVATIONS = int(os.getenv("PATTERN_LEARNING_MIN_OBSERVATIONS", "20"))
+PATTERN_SKIP_DECODE_MIN_OBSERVATIONS = int(os.getenv("PATTERN_SKIP_DECODE_MIN_OBSERVATIONS", "50"))
+
+# Archive of raw API responses (compressed JSONL segments per run, see response_archive.py).
+# Off unless enabled; only the newest API_ARCHIVE_KEEP_RUNS runs are kept (0 keeps all)
+API_ARCHIVE_ENABLED = os.getenv("API_ARCHIVE_ENABLED", "false").lower() == "true"
+API_ARCHIVE_DIR = os.getenv("API_ARCHIVE_DIR", str(PROJECT_ROOT / "api_archive"))
+API_ARCHIVE_KEEP_RUNS = int(os.getenv("API_ARCHIVE_KEEP_RUNS", "20"))
+API_ARCHIVE_COMPRESSION = os.getenv("API_ARCHIVE_COMPRESSION", "gzip")  # gzip or zstd
+API_ARCHIVE_SEGMENT_RECORDS = int(os.getenv("API_ARCHIVE_SEGMENT_RECORDS", "1000"))
+
+# JSON backend: auto (orjson, then msgspec, then stdlib), orjson, msgspec or json
+JSON_CODEC = os.getenv("JSON_CODEC", "auto")
+
+# Concurrency
+VIN_DECODE_WORKERS = int(os.getenv("VIN_DECODE_WORKERS", "4"))
+PAGE_FETCH_WORKERS = int(os.getenv("PAGE_FETCH_WORKERS", "4"))  # 1 = fetch pages serially
+
+# Decode work queue
+DECODE_QUEUE_BATCH_SIZE = int(os.getenv("DECODE_QUEUE_BATCH_SIZE", "20"))
+DECODE_TASK_LEASE_SECONDS = int(os.getenv("DECODE_TASK_LEASE_SECONDS", "300"))
+DECODE_TASK_MAX_ATTEMPTS = int(os.getenv("DECODE_TASK_MAX_ATTEMPTS", "5"))
+DECODE_TASK_RETRY_DELAY_SECONDS = int(os.getenv("DECODE_TASK_RETRY_DELAY_SECONDS", "300"))
+
+# Daily API budget (0 = unlimited). Once fewer than AUTOMATIC_DECODE_BUDGET_RESERVE calls
+# remain, pattern-confirmed automatics are no longer decoded.
+API_DAILY_CALL_BUDGET = int(os.getenv("API_DAILY_CALL_BUDGET", "0"))
+AUTOMATIC_DECODE_BUDGET_RESERVE = int(os.getenv("AUTOMATIC_DECODE_BUDGET_RESERVE", "100"))
+DECODE_CONFIRMED_AUTOMATICS = os.getenv("DECODE_CONFIRMED_AUTOMATICS", "true").lower() == "true"
+
 # Vehicle Configuration - User's specific vehicle
 VEHICLE_SPECS = {
     "make": os.getenv("VEHICLE_MAKE", "Toyota"),
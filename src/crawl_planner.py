@@ -0,0 +1,74 @@
+"""
+Split the listings search into independent shards (model-year ranges and/or
+search origins) so they can be paged concurrently and cover several regions.
+"""
+import logging
+from typing import Dict, List, Optional
+
+from config import (
+    TARGET_YEARS, CRAWL_SHARD_BY, CRAWL_YEARS_PER_SHARD, CRAWL_ORIGIN_ZIPS,
+    SEARCH_ZIP_CODE, SEARCH_RADIUS_MILES
+)
+
+logger = logging.getLogger(__name__)
+
+SHARD_DIMENSIONS = ("year", "zip")
+
+
+def plan_shards(shard_by: Optional[str] = None, years_per_shard: Optional[int] = None,
+                origin_zips: Optional[List[str]] = None) -> List[Dict]:
+    """
+    Build the list of shards for a crawl.
+
+    shard_by is a comma-separated subset of SHARD_DIMENSIONS ("year", "zip",
+    "year,zip"); each shard is a dict of listing query parameters that override
+    the defaults in AutoDevAPI.get_4runner_listings. Returns [] when sharding is
+    off, meaning a single unsharded crawl.
+    """
+    if shard_by is None:
+        shard_by = CRAWL_SHARD_BY
+    if years_per_shard is None:
+        years_per_shard = CRAWL_YEARS_PER_SHARD
+    if origin_zips is None:
+        origin_zips = CRAWL_ORIGIN_ZIPS
+
+    dimensions = [d.strip() for d in shard_by.split(",") if d.strip()]
+    unknown = [d for d in dimensions if d not in SHARD_DIMENSIONS]
+    if unknown:
+        raise ValueError(f"Unknown crawl shard dimension(s): {', '.join(unknown)}")
+    if not dimensions:
+        return []
+
+    shards = [{}]
+
+    if "year" in dimensions:
+        step = max(1, years_per_shard)
+        year_ranges = [
+            (start, min(start + step - 1, TARGET_YEARS["max"]))
+            for start in range(TARGET_YEARS["min"], TARGET_YEARS["max"] + 1, step)
+        ]
+        shards = [dict(shard, year_min=low, year_max=high) for shard in shards for low, high in year_ranges]
+
+    if "zip" in dimensions:
+        zips = origin_zips or ([SEARCH_ZIP_CODE] if SEARCH_ZIP_CODE else [])
+        if not zips:
+            logger.warning("Crawl sharding by zip requested but no CRAWL_ORIGIN_ZIPS configured")
+        else:
+            origin = {"radius": int(SEARCH_RADIUS_MILES)} if SEARCH_RADIUS_MILES else {}
+            shards = [dict(shard, zip=zip_code, **origin) for shard in shards for zip_code in zips]
+
+    logger.info(f"Planned {len(shards)} crawl shards by {', '.join(dimensions)}")
+    return shards
+
+
+def shard_label(shard: Dict) -> str:
+    """Short human-readable name for a shard, used in logs and latency stats."""
+    parts = []
+    if "year_min" in shard:
+        if shard["year_min"] == shard["year_max"]:
+            parts.append(str(shard["year_min"]))
+        else:
+            parts.append(f"{shard['year_min']}-{shard['year_max']}")
+    if "zip" in shard:
+        parts.append(shard["zip"])
+    return "/".join(parts) or "all"
@@ -1,20 +1,114 @@
 import sqlite3
-from datetime import datetime
+from datetime import datetime, timedelta
+import hashlib
 import json
-from typing import List, Dict, Optional, Tuple
-from config import DATABASE_PATH
+import json_codec
+import threading
+from typing import Iterable, Iterator, List, Dict, Optional, Tuple
+from config import DATABASE_PATH, LAST_SEEN_TOUCH_HOURS
+
+
+# Columns written by upsert_listing / bulk_upsert_listings, in bind order
+LISTING_COLUMNS = (
+    "vin", "year", "price", "mileage", "city", "state", "dealer_name",
+    "transmission_type", "transmission_speeds", "engine_info",
+    "drivetrain", "trim", "first_seen", "last_seen", "is_manual",
+    "vin_pattern_confidence", "vin_analysis_reason", "manual_source",
+    "needs_research", "api_transmission_type", "decode_source", "model_code", "is_first_gen",
+    "raw_listing_data", "raw_vin_data", "exterior_color", "interior_color",
+    "distance_from_origin", "created_at", "color_options",
+    "listing_source", "craigslist_url", "craigslist_region", "craigslist_id",
+    "listing_hash"
+)
+
+# Never overwritten when a listing is seen again
+INSERT_ONLY_COLUMNS = ("vin", "first_seen")
+
+UPSERT_LISTING_SQL = """
+    INSERT INTO listings ({columns}) VALUES ({placeholders})
+    ON CONFLICT(vin) DO UPDATE SET {updates}
+""".format(
+    columns=", ".join(LISTING_COLUMNS),
+    placeholders=", ".join("?" * len(LISTING_COLUMNS)),
+    updates=", ".join(
+        f"{column} = excluded.{column}"
+        for column in LISTING_COLUMNS if column not in INSERT_ONLY_COLUMNS
+    )
+)
+
+
+# Only the mutable fields of a listing we already know about. A missing or
+# unparseable (0) price/mileage keeps the stored one rather than faking a change.
+REFRESH_LISTING_SQL = """
+    UPDATE listings SET
+        previous_price = CASE WHEN NULLIF(:price, 0) IS NOT NULL AND price IS NOT :price
+                              THEN price ELSE previous_price END,
+        price = COALESCE(NULLIF(:price, 0), price),
+        mileage = COALESCE(NULLIF(:mileage, 0), mileage),
+        last_seen = :now,
+        raw_listing_data = CASE WHEN listing_hash IS :listing_hash THEN raw_listing_data ELSE :raw_listing_data END,
+        listing_hash = :listing_hash,
+        listing_status = 'active',
+        status_checked_at = :now
+    WHERE vin = :vin
+      AND (listing_hash IS NOT :listing_hash OR last_seen IS NULL OR last_seen < :touch_before
+           OR listing_status IS NOT 'active')
+"""
+
+# Watched listings the API reports as gone
+MARK_REMOVED_SQL = """
+    UPDATE listings SET listing_status = 'removed', status_checked_at = :now
+    WHERE vin = :vin AND listing_status IS NOT 'removed'
+"""
+
+
+def squish_vin(vin: str) -> str:
+    """VIN positions 1-8 and 10-11 - identical for identically configured vehicles."""
+    return vin[:8] + vin[9:11]
+
+
+def listing_content_hash(raw_listing: Optional[Dict]) -> Optional[str]:
+    """
+    Stable hash of a raw API listing (ignoring our own vin_analysis annotation).
+    Hashes a canonical stdlib JSON form, so switching the json_codec backend
+    doesn't change every stored hash.
+    """
+    if not raw_listing:
+        return None
+    content = {key: value for key, value in raw_listing.items() if key != "vin_analysis"}
+    canonical = json.dumps(content, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(canonical.encode()).hexdigest()
 
 
 class Database:
-    def __init__(self, db_path: str = DATABASE_PATH):
+    def __init__(self, db_path: str = DATABASE_PATH, persistent_connections: bool = False):
+        """
+        persistent_connections keeps one connection per thread open for the life of
+        this object (for long-running processes) instead of connecting per call.
+        """
         self.db_path = db_path
+        self.persistent_connections = persistent_connections
+        self._local = threading.local()
         self.initialize_database()
 
     def get_connection(self) -> sqlite3.Connection:
+        if self.persistent_connections:
+            conn = getattr(self._local, "conn", None)
+            if conn is None:
+                conn = self._local.conn = self._connect()
+            return conn
+        return self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
         conn = sqlite3.connect(self.db_path)
         conn.row_factory = sqlite3.Row
         return conn
 
+    def _release_connection(self, conn: sqlite3.Connection):
+        """Close a connection from get_connection() unless it is a kept-open one."""
+        if not self.persistent_connections:
+            conn.close()
+
     def initialize_database(self):
         """Create tables if they don't exist."""
         with self.get_connection() as conn:
@@ -47,6 +141,7 @@ class Database:
                     manual_source TEXT,
                     needs_research BOOLEAN DEFAULT FALSE,
                     api_transmission_type TEXT,
+                    decode_source TEXT,  -- 'api' or 'offline' for listings with a VIN decode
                     model_code TEXT,
                     is_first_gen BOOLEAN DEFAULT FALSE,
 
@@ -71,7 +166,18 @@ class Database:
                     listing_source TEXT DEFAULT 'auto.dev',
                     craigslist_url TEXT,
                     craigslist_region TEXT,
-                    craigslist_id TEXT
+                    craigslist_id TEXT,
+
+                    -- Change tracking
+                    listing_hash TEXT,
+                    previous_price INTEGER,
+
+                    -- Seconds between page fetch and storage for new manual finds
+                    time_to_alert_seconds REAL,
+
+                    -- 'active' or 'removed' (gone from the API), checked by crawls and watched refreshes
+                    listing_status TEXT DEFAULT 'active',
+                    status_checked_at DATETIME
                 )
             """)
 
@@ -93,7 +199,88 @@ class Database:
                 )
             """)
 
+            # VIN decode cache - a VIN always decodes the same way, so successful
+            # decodes never expire. Negative results ('miss' for VINs the API
+            # rejects, 'failure' for transient errors) carry an expiry.
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS vin_decode_cache (
+                    vin TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    decode_data TEXT,
+                    fetched_at DATETIME,
+                    expires_at DATETIME
+                )
+            """)
+
+            # Decodes keyed by squish VIN (positions 1-8 and 10-11), which fix
+            # the engine, transmission and trim. Lets identically configured
+            # VINs share one decode.
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS squish_vin_decodes (
+                    squish_vin TEXT PRIMARY KEY,
+                    source_vin TEXT,
+                    decode_data TEXT,
+                    updated_at DATETIME
+                )
+            """)
+            cursor.execute("SELECT 1 FROM squish_vin_decodes LIMIT 1")
+            if cursor.fetchone() is None:
+                self._backfill_squish_vin_decodes(cursor)
+
+            # Last first-page probe per crawl, used to skip unchanged incremental crawls
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS crawl_state (
+                    name TEXT PRIMARY KEY,
+                    total_count INTEGER,
+                    fingerprint TEXT,
+                    updated_at DATETIME
+                )
+            """)
+
+            # Durable queue of VIN decode work. Workers lease tasks so a crash
+            # (expired lease) or several processes never lose or double-run work.
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS decode_tasks (
+                    id INTEGER PRIMARY KEY,
+                    vin TEXT UNIQUE,
+                    state TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER DEFAULT 0,
+                    next_retry_at DATETIME,
+                    lease_owner TEXT,
+                    lease_expires_at DATETIME,
+                    payload TEXT,
+                    last_error TEXT,
+                    priority INTEGER DEFAULT 50,
+                    created_at DATETIME,
+                    updated_at DATETIME
+                )
+            """)
+            cursor.execute("PRAGMA table_info(decode_tasks)")
+            if 'priority' not in {row[1] for row in cursor.fetchall()}:
+                cursor.execute("ALTER TABLE decode_tasks ADD COLUMN priority INTEGER DEFAULT 50")
+
+            # Per-day API call ledger, shared by every process using this database
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS api_call_ledger (
+                    day TEXT PRIMARY KEY,
+                    calls INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+
+            # Decode outcomes per VIN pattern, aggregated from listings for pattern learning
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS pattern_observations (
+                    model_code TEXT NOT NULL,
+                    year INTEGER NOT NULL,
+                    manual_count INTEGER NOT NULL DEFAULT 0,
+                    automatic_count INTEGER NOT NULL DEFAULT 0,
+                    updated_at DATETIME,
+                    PRIMARY KEY (model_code, year)
+                )
+            """)
+
             # Create indexes for performance
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_decode_tasks_state ON decode_tasks(state, priority, id)")
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_vin ON listings(vin)")
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_is_manual ON listings(is_manual)")
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_notified ON listings(notified)")
@@ -158,139 +345,184 @@ class Database:
         if 'craigslist_id' not in existing_columns:
             cursor.execute("ALTER TABLE listings ADD COLUMN craigslist_id TEXT")
 
+        if 'listing_hash' not in existing_columns:
+            cursor.execute("ALTER TABLE listings ADD COLUMN listing_hash TEXT")
+
+        if 'previous_price' not in existing_columns:
+            cursor.execute("ALTER TABLE listings ADD COLUMN previous_price INTEGER")
+
+        if 'time_to_alert_seconds' not in existing_columns:
+            cursor.execute("ALTER TABLE listings ADD COLUMN time_to_alert_seconds REAL")
+
+        if 'listing_status' not in existing_columns:
+            cursor.execute("ALTER TABLE listings ADD COLUMN listing_status TEXT DEFAULT 'active'")
+
+        if 'status_checked_at' not in existing_columns:
+            cursor.execute("ALTER TABLE listings ADD COLUMN status_checked_at DATETIME")
+
+        if 'decode_source' not in existing_columns:
+            cursor.execute("ALTER TABLE listings ADD COLUMN decode_source TEXT")
+            # Counted every listing before decode sources were stored; recreated empty below
+            cursor.execute("DROP TABLE IF EXISTS pattern_observations")
+
     def upsert_listing(self, listing_data: Dict) -> bool:
         """Insert or update a listing. Returns True if new listing."""
+        return bool(self.bulk_upsert_listings([listing_data])["new"])
+
+    def bulk_upsert_listings(self, listings: Iterable[Dict], batch_size: int = 500) -> Dict[str, List[str]]:
+        """
+        Insert or update many listings using one connection and one transaction per batch.
+        Returns {'new': [vins inserted], 'updated': [vins that already existed]}.
+        """
+        result = {"new": [], "updated": []}
+        conn = self.get_connection()
+        try:
+            batch = []
+            for listing_data in listings:
+                batch.append(listing_data)
+                if len(batch) >= batch_size:
+                    self._upsert_listing_batch(conn, batch, result)
+                    batch = []
+            if batch:
+                self._upsert_listing_batch(conn, batch, result)
+        finally:
+            self._release_connection(conn)
+        return result
+
+    def _upsert_listing_batch(self, conn: sqlite3.Connection, batch: List[Dict], result: Dict):
+        now = datetime.now().isoformat()
+        # The last occurrence of a VIN in the batch wins
+        rows = {listing_data['vin']: self._listing_row(listing_data, now) for listing_data in batch}
+        vins = list(rows)
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            existing = set()
+            for i in range(0, len(vins), 900):  # Stay under SQLite's bound-variable limit
+                chunk = vins[i:i + 900]
+                cursor = conn.execute(
+                    f"SELECT vin FROM listings WHERE vin IN ({', '.join('?' * len(chunk))})", chunk
+                )
+                existing.update(row[0] for row in cursor)
+            conn.executemany(UPSERT_LISTING_SQL, rows.values())
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        for vin in vins:
+            result["updated" if vin in existing else "new"].append(vin)
+
+    @staticmethod
+    def _listing_row(listing_data: Dict, now: str) -> Tuple:
+        """Bind values for LISTING_COLUMNS."""
+        return (
+            listing_data['vin'],
+            listing_data.get('year'),
+            listing_data.get('price'),
+            listing_data.get('mileage'),
+            listing_data.get('city'),
+            listing_data.get('state'),
+            listing_data.get('dealer_name'),
+            listing_data.get('transmission_type'),
+            listing_data.get('transmission_speeds'),
+            listing_data.get('engine_info'),
+            listing_data.get('drivetrain'),
+            listing_data.get('trim'),
+            now,
+            now,
+            listing_data.get('is_manual', False),
+            listing_data.get('vin_pattern_confidence'),
+            listing_data.get('vin_analysis_reason'),
+            listing_data.get('manual_source'),
+            listing_data.get('needs_research', False),
+            listing_data.get('api_transmission_type'),
+            listing_data.get('decode_source'),
+            listing_data.get('model_code'),
+            listing_data.get('is_first_gen', False),
+            json_codec.dumps(listing_data.get('raw_listing_data', {})),
+            json_codec.dumps(listing_data.get('raw_vin_data', {})),
+            listing_data.get('exterior_color'),
+            listing_data.get('interior_color'),
+            listing_data.get('distance_from_origin'),
+            listing_data.get('created_at'),
+            listing_data.get('color_options'),
+            listing_data.get('listing_source', 'auto.dev'),
+            listing_data.get('craigslist_url'),
+            listing_data.get('craigslist_region'),
+            listing_data.get('craigslist_id'),
+            listing_content_hash(listing_data.get('raw_listing_data'))
+        )
+
+    def refresh_listings(self, listings: Iterable[Dict], touch_after_hours: float = LAST_SEEN_TOUCH_HOURS) -> int:
+        """
+        Update price/mileage/last_seen of already-stored listings in one batched statement,
+        without touching decode or analysis fields. Each item needs 'vin', 'price',
+        'mileage' and 'raw_listing_data'. Rows whose listing content hash is unchanged
+        are skipped unless last_seen is older than touch_after_hours.
+        Returns the number of rows written.
+        """
+        params = self._refresh_params(listings, touch_after_hours)
+        if not params:
+            return 0
+
         with self.get_connection() as conn:
-            cursor = conn.cursor()
+            before = conn.total_changes
+            conn.executemany(REFRESH_LISTING_SQL, params)
+            conn.commit()
+            return conn.total_changes - before
 
-            # Check if VIN already exists
-            cursor.execute("SELECT id FROM listings WHERE vin = ?", (listing_data['vin'],))
-            existing = cursor.fetchone()
-
-            now = datetime.now().isoformat()
-
-            if existing:
-                # Update existing listing
-                cursor.execute("""
-                    UPDATE listings SET
-                        year = ?,
-                        price = ?,
-                        mileage = ?,
-                        city = ?,
-                        state = ?,
-                        dealer_name = ?,
-                        transmission_type = ?,
-                        transmission_speeds = ?,
-                        engine_info = ?,
-                        drivetrain = ?,
-                        trim = ?,
-                        last_seen = ?,
-                        is_manual = ?,
-                        vin_pattern_confidence = ?,
-                        vin_analysis_reason = ?,
-                        manual_source = ?,
-                        needs_research = ?,
-                        api_transmission_type = ?,
-                        model_code = ?,
-                        is_first_gen = ?,
-                        raw_listing_data = ?,
-                        raw_vin_data = ?,
-                        exterior_color = ?,
-                        interior_color = ?,
-                        distance_from_origin = ?,
-                        created_at = ?,
-                        color_options = ?,
-                        listing_source = ?,
-                        craigslist_url = ?,
-                        craigslist_region = ?,
-                        craigslist_id = ?
-                    WHERE vin = ?
-                """, (
-                    listing_data.get('year'),
-                    listing_data.get('price'),
-                    listing_data.get('mileage'),
-                    listing_data.get('city'),
-                    listing_data.get('state'),
-                    listing_data.get('dealer_name'),
-                    listing_data.get('transmission_type'),
-                    listing_data.get('transmission_speeds'),
-                    listing_data.get('engine_info'),
-                    listing_data.get('drivetrain'),
-                    listing_data.get('trim'),
-                    now,
-                    listing_data.get('is_manual', False),
-                    listing_data.get('vin_pattern_confidence'),
-                    listing_data.get('vin_analysis_reason'),
-                    listing_data.get('manual_source'),
-                    listing_data.get('needs_research', False),
-                    listing_data.get('api_transmission_type'),
-                    listing_data.get('model_code'),
-                    listing_data.get('is_first_gen', False),
-                    json.dumps(listing_data.get('raw_listing_data', {})),
-                    json.dumps(listing_data.get('raw_vin_data', {})),
-                    listing_data.get('exterior_color'),
-                    listing_data.get('interior_color'),
-                    listing_data.get('distance_from_origin'),
-                    listing_data.get('created_at'),
-                    listing_data.get('color_options'),
-                    listing_data.get('listing_source', 'auto.dev'),
-                    listing_data.get('craigslist_url'),
-                    listing_data.get('craigslist_region'),
-                    listing_data.get('craigslist_id'),
-                    listing_data['vin']
-                ))
-                conn.commit()
-                return False
-            else:
-                # Insert new listing
-                cursor.execute("""
-                    INSERT INTO listings (
-                        vin, year, price, mileage, city, state, dealer_name,
-                        transmission_type, transmission_speeds, engine_info,
-                        drivetrain, trim, first_seen, last_seen, is_manual,
-                        vin_pattern_confidence, vin_analysis_reason, manual_source,
-                        needs_research, api_transmission_type, model_code, is_first_gen,
-                        raw_listing_data, raw_vin_data, exterior_color, interior_color,
-                        distance_from_origin, created_at, color_options,
-                        listing_source, craigslist_url, craigslist_region, craigslist_id
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    listing_data['vin'],
-                    listing_data.get('year'),
-                    listing_data.get('price'),
-                    listing_data.get('mileage'),
-                    listing_data.get('city'),
-                    listing_data.get('state'),
-                    listing_data.get('dealer_name'),
-                    listing_data.get('transmission_type'),
-                    listing_data.get('transmission_speeds'),
-                    listing_data.get('engine_info'),
-                    listing_data.get('drivetrain'),
-                    listing_data.get('trim'),
-                    now,
-                    now,
-                    listing_data.get('is_manual', False),
-                    listing_data.get('vin_pattern_confidence'),
-                    listing_data.get('vin_analysis_reason'),
-                    listing_data.get('manual_source'),
-                    listing_data.get('needs_research', False),
-                    listing_data.get('api_transmission_type'),
-                    listing_data.get('model_code'),
-                    listing_data.get('is_first_gen', False),
-                    json.dumps(listing_data.get('raw_listing_data', {})),
-                    json.dumps(listing_data.get('raw_vin_data', {})),
-                    listing_data.get('exterior_color'),
-                    listing_data.get('interior_color'),
-                    listing_data.get('distance_from_origin'),
-                    listing_data.get('created_at'),
-                    listing_data.get('color_options'),
-                    listing_data.get('listing_source', 'auto.dev'),
-                    listing_data.get('craigslist_url'),
-                    listing_data.get('craigslist_region'),
-                    listing_data.get('craigslist_id')
-                ))
+    @staticmethod
+    def _refresh_params(listings: Iterable[Dict], touch_after_hours: float) -> List[Dict]:
+        now = datetime.now()
+        return [
+            {
+                "vin": listing_data["vin"],
+                "price": listing_data.get("price"),
+                "mileage": listing_data.get("mileage"),
+                "raw_listing_data": json_codec.dumps(listing_data.get("raw_listing_data", {})),
+                "listing_hash": listing_content_hash(listing_data.get("raw_listing_data")),
+                "now": now.isoformat(),
+                "touch_before": (now - timedelta(hours=touch_after_hours)).isoformat()
+            }
+            for listing_data in listings
+        ]
+
+    def apply_watched_refresh(self, listings: List[Dict], removed_vins: List[str]) -> Dict[str, int]:
+        """
+        Write a watched-listing refresh in one transaction: listings (as for refresh_listings)
+        are marked active with their current price/mileage, removed_vins are marked removed.
+        Returns {'price_changes': n, 'removed': n}.
+        """
+        params = self._refresh_params(listings, touch_after_hours=0)
+        now = datetime.now().isoformat()
+        conn = self.get_connection()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                old_prices = {}
+                vins = [item["vin"] for item in params]
+                if vins:
+                    cursor = conn.execute(
+                        f"SELECT vin, price FROM listings WHERE vin IN ({', '.join('?' * len(vins))})", vins
+                    )
+                    old_prices = {row[0]: row[1] for row in cursor}
+                conn.executemany(REFRESH_LISTING_SQL, params)
+                before = conn.total_changes
+                conn.executemany(MARK_REMOVED_SQL, [{"vin": vin, "now": now} for vin in removed_vins])
+                removed = conn.total_changes - before
                 conn.commit()
-                return True
+            except Exception:
+                conn.rollback()
+                raise
+        finally:
+            self._release_connection(conn)
+
+        price_changes = sum(
+            1 for item in params
+            if item["vin"] in old_prices and item["price"] and old_prices[item["vin"]] != item["price"]
+        )
+        return {"price_changes": price_changes, "removed": removed}
 
     def get_unnotified_manual_listings(self) -> List[Dict]:
         """Get all manual transmission listings that haven't been notified yet."""
@@ -335,10 +567,313 @@ class Database:
                 stats.get('manual_candidates', 0),
                 stats.get('api_calls_made', 0),
                 stats.get('api_calls_saved', 0),
-                json.dumps(stats.get('errors', []))
+                json_codec.dumps(stats.get('errors', []))
             ))
             conn.commit()
 
+    def get_cached_vin_decode(self, vin: str) -> Optional[Dict]:
+        """Look up a cached VIN decode. Returns {'status', 'data'} or None on a cache miss."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT status, decode_data, expires_at FROM vin_decode_cache WHERE vin = ?",
+                (vin,)
+            )
+            row = cursor.fetchone()
+
+            if row:
+                if row['expires_at'] and row['expires_at'] <= datetime.now().isoformat():
+                    return None
+                data = json_codec.loads(row['decode_data']) if row['decode_data'] else None
+                return {'status': row['status'], 'data': data}
+
+            # Fall back to decode data already stored with a listing
+            cursor.execute(
+                "SELECT raw_vin_data FROM listings WHERE vin = ? AND raw_vin_data NOT IN ('', '{}', 'null')",
+                (vin,)
+            )
+            row = cursor.fetchone()
+            if not row or not row['raw_vin_data']:
+                return None
+
+            data = json_codec.loads(row['raw_vin_data'])
+            self._store_vin_decode(cursor, vin, 'hit', data, None)
+            conn.commit()
+            return {'status': 'hit', 'data': data}
+
+    def cache_vin_decode(self, vin: str, status: str, data: Optional[Dict] = None,
+                         ttl_hours: Optional[float] = None):
+        """Store a VIN decode result. Entries without a TTL never expire."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            self._store_vin_decode(cursor, vin, status, data, ttl_hours)
+            conn.commit()
+
+    def _store_vin_decode(self, cursor, vin: str, status: str, data: Optional[Dict],
+                          ttl_hours: Optional[float]):
+        now = datetime.now()
+        expires_at = (now + timedelta(hours=ttl_hours)).isoformat() if ttl_hours else None
+        cursor.execute("""
+            INSERT OR REPLACE INTO vin_decode_cache (vin, status, decode_data, fetched_at, expires_at)
+            VALUES (?, ?, ?, ?, ?)
+        """, (
+            vin,
+            status,
+            json_codec.dumps(data) if data is not None else None,
+            now.isoformat(),
+            expires_at
+        ))
+        if status == 'hit' and data and len(vin) == 17:
+            cursor.execute("""
+                INSERT OR IGNORE INTO squish_vin_decodes (squish_vin, source_vin, decode_data, updated_at)
+                VALUES (?, ?, ?, ?)
+            """, (squish_vin(vin), vin, json_codec.dumps(data), now.isoformat()))
+
+    def get_squish_vin_decode(self, vin: str) -> Optional[Dict]:
+        """Decode data of a VIN with the same squish VIN, or None. Returns {'source_vin', 'data'}."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT source_vin, decode_data FROM squish_vin_decodes WHERE squish_vin = ?",
+                (squish_vin(vin),)
+            )
+            row = cursor.fetchone()
+            if not row:
+                return None
+            return {'source_vin': row['source_vin'], 'data': json_codec.loads(row['decode_data'])}
+
+    def _backfill_squish_vin_decodes(self, cursor):
+        """Seed the squish VIN table from decodes already stored with listings or in the cache."""
+        now = datetime.now().isoformat()
+        cursor.execute("""
+            INSERT OR IGNORE INTO squish_vin_decodes (squish_vin, source_vin, decode_data, updated_at)
+            SELECT substr(vin, 1, 8) || substr(vin, 10, 2), vin, raw_vin_data, ?
+            FROM listings
+            WHERE length(vin) = 17 AND raw_vin_data NOT IN ('', '{}', 'null')
+        """, (now,))
+        cursor.execute("""
+            INSERT OR IGNORE INTO squish_vin_decodes (squish_vin, source_vin, decode_data, updated_at)
+            SELECT substr(vin, 1, 8) || substr(vin, 10, 2), vin, decode_data, ?
+            FROM vin_decode_cache
+            WHERE status = 'hit' AND length(vin) = 17 AND decode_data IS NOT NULL
+        """, (now,))
+
+    def import_vin_decode_cache(self, source_db_path: str) -> int:
+        """Copy cached VIN decodes (and stored listing decodes) from another database file."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("ATTACH DATABASE ? AS source", (source_db_path,))
+            try:
+                cursor.execute("SELECT name FROM source.sqlite_master WHERE type = 'table'")
+                source_tables = {row[0] for row in cursor.fetchall()}
+
+                before = conn.total_changes
+                if 'vin_decode_cache' in source_tables:
+                    cursor.execute("""
+                        INSERT OR IGNORE INTO vin_decode_cache
+                        SELECT vin, status, decode_data, fetched_at, expires_at
+                        FROM source.vin_decode_cache
+                    """)
+                if 'listings' in source_tables:
+                    cursor.execute("""
+                        INSERT OR IGNORE INTO vin_decode_cache (vin, status, decode_data, fetched_at)
+                        SELECT vin, 'hit', raw_vin_data, last_seen
+                        FROM source.listings
+                        WHERE raw_vin_data IS NOT NULL AND raw_vin_data NOT IN ('', '{}', 'null')
+                    """)
+                imported = conn.total_changes - before
+                conn.commit()
+            finally:
+                cursor.execute("DETACH DATABASE source")
+            return imported
+
+    def enqueue_decode_tasks(self, tasks: Iterable[Dict]) -> int:
+        """
+        Queue decode work. Each task is {'vin', 'payload', 'priority'} (lower runs first);
+        VINs already queued are ignored.
+        """
+        now = datetime.now().isoformat()
+        rows = [
+            (task['vin'], json_codec.dumps(task.get('payload', {})), task.get('priority', 50), now, now)
+            for task in tasks
+        ]
+        if not rows:
+            return 0
+
+        with self.get_connection() as conn:
+            before = conn.total_changes
+            conn.executemany("""
+                INSERT INTO decode_tasks (vin, state, payload, priority, created_at, updated_at)
+                VALUES (?, 'pending', ?, ?, ?, ?)
+                ON CONFLICT(vin) DO NOTHING
+            """, rows)
+            conn.commit()
+            return conn.total_changes - before
+
+    def lease_decode_tasks(self, owner: str, limit: int, lease_seconds: int,
+                           max_priority: Optional[int] = None) -> List[Dict]:
+        """
+        Atomically claim up to `limit` runnable tasks, highest priority (lowest number)
+        first: pending ones that are due, plus leased ones whose lease expired (their
+        worker died). Tasks with priority above max_priority are left queued.
+        """
+        now = datetime.now()
+        conn = self.get_connection()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            cursor = conn.execute("""
+                SELECT * FROM decode_tasks
+                WHERE ((state = 'pending' AND (next_retry_at IS NULL OR next_retry_at <= :now))
+                       OR (state = 'leased' AND lease_expires_at < :now))
+                  AND (:max_priority IS NULL OR priority <= :max_priority)
+                ORDER BY priority, id
+                LIMIT :limit
+            """, {"now": now.isoformat(), "limit": limit, "max_priority": max_priority})
+            tasks = [dict(row) for row in cursor.fetchall()]
+
+            lease_expires_at = (now + timedelta(seconds=lease_seconds)).isoformat()
+            conn.executemany("""
+                UPDATE decode_tasks
+                SET state = 'leased', lease_owner = ?, lease_expires_at = ?,
+                    attempts = attempts + 1, updated_at = ?
+                WHERE id = ?
+            """, [(owner, lease_expires_at, now.isoformat(), task['id']) for task in tasks])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._release_connection(conn)
+
+        for task in tasks:
+            task['attempts'] += 1
+            task['payload'] = json_codec.loads(task['payload']) if task['payload'] else {}
+        return tasks
+
+    def complete_decode_tasks(self, task_ids: List[int]):
+        """Remove finished tasks from the queue."""
+        with self.get_connection() as conn:
+            conn.executemany("DELETE FROM decode_tasks WHERE id = ?", [(task_id,) for task_id in task_ids])
+            conn.commit()
+
+    def retry_decode_task(self, task_id: int, error: str, retry_delay_seconds: float):
+        """Release a leased task back to the queue, due again after retry_delay_seconds."""
+        now = datetime.now()
+        with self.get_connection() as conn:
+            conn.execute("""
+                UPDATE decode_tasks
+                SET state = 'pending', lease_owner = NULL, lease_expires_at = NULL,
+                    next_retry_at = ?, last_error = ?, updated_at = ?
+                WHERE id = ?
+            """, ((now + timedelta(seconds=retry_delay_seconds)).isoformat(), error, now.isoformat(), task_id))
+            conn.commit()
+
+    def count_decode_tasks(self) -> Dict[str, int]:
+        """Number of queued decode tasks per state."""
+        with self.get_connection() as conn:
+            cursor = conn.execute("SELECT state, COUNT(*) FROM decode_tasks GROUP BY state")
+            return {row[0]: row[1] for row in cursor.fetchall()}
+
+    def record_api_calls(self, calls: int, day: Optional[str] = None):
+        """Add calls to the per-day API budget ledger."""
+        if calls <= 0:
+            return
+        day = day or datetime.now().date().isoformat()
+        with self.get_connection() as conn:
+            conn.execute("""
+                INSERT INTO api_call_ledger (day, calls) VALUES (?, ?)
+                ON CONFLICT(day) DO UPDATE SET calls = calls + excluded.calls
+            """, (day, calls))
+            conn.commit()
+
+    def get_api_calls_for_day(self, day: Optional[str] = None) -> int:
+        """API calls recorded in the ledger for a day (default today)."""
+        day = day or datetime.now().date().isoformat()
+        with self.get_connection() as conn:
+            row = conn.execute("SELECT calls FROM api_call_ledger WHERE day = ?", (day,)).fetchone()
+            return row[0] if row else 0
+
+    def refresh_pattern_observations(self) -> List[Dict]:
+        """
+        Recount manual/automatic decode outcomes per (model_code, year) from listings
+        with an API transmission type, and return the counts. Each squish VIN counts
+        once - cached and squish-shared decodes repeat one API answer - and offline
+        decodes are left out.
+        """
+        conn = self.get_connection()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("DELETE FROM pattern_observations")
+                conn.execute("""
+                    INSERT INTO pattern_observations (model_code, year, manual_count, automatic_count, updated_at)
+                    SELECT model_code, year,
+                           COUNT(DISTINCT CASE WHEN api_transmission_type LIKE '%MANUAL%' THEN squish END),
+                           COUNT(DISTINCT CASE WHEN api_transmission_type NOT LIKE '%MANUAL%' THEN squish END),
+                           ?
+                    FROM (
+                        SELECT model_code, year, api_transmission_type,
+                               substr(vin, 1, 8) || substr(vin, 10, 2) AS squish
+                        FROM listings
+                        WHERE model_code IS NOT NULL AND year IS NOT NULL
+                          AND api_transmission_type IS NOT NULL AND api_transmission_type != ''
+                          AND decode_source IS NOT 'offline'
+                    )
+                    GROUP BY model_code, year
+                """, (datetime.now().isoformat(),))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            rows = conn.execute(
+                "SELECT model_code, year, manual_count, automatic_count FROM pattern_observations"
+            ).fetchall()
+        finally:
+            self._release_connection(conn)
+        return [dict(row) for row in rows]
+
+    def get_pattern_observations(self) -> List[Dict]:
+        """Decode outcome counts per (model_code, year) as of the last refresh_pattern_observations."""
+        with self.get_connection() as conn:
+            rows = conn.execute(
+                "SELECT model_code, year, manual_count, automatic_count FROM pattern_observations"
+            ).fetchall()
+            return [dict(row) for row in rows]
+
+    def set_time_to_alert(self, seconds_by_vin: Dict[str, float]):
+        """Record how long new finds waited between page fetch and storage."""
+        with self.get_connection() as conn:
+            conn.executemany(
+                "UPDATE listings SET time_to_alert_seconds = ? WHERE vin = ?",
+                [(seconds, vin) for vin, seconds in seconds_by_vin.items()]
+            )
+            conn.commit()
+
+    def get_crawl_state(self, name: str) -> Optional[Dict]:
+        """Get the stored first-page probe for a crawl."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM crawl_state WHERE name = ?", (name,))
+            row = cursor.fetchone()
+            return dict(row) if row else None
+
+    def save_crawl_state(self, name: str, total_count: int, fingerprint: str):
+        """Store the first-page probe for a crawl."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT OR REPLACE INTO crawl_state (name, total_count, fingerprint, updated_at)
+                VALUES (?, ?, ?, ?)
+            """, (name, total_count, fingerprint, datetime.now().isoformat()))
+            conn.commit()
+
+    def get_listing_snapshots(self) -> Dict[str, Tuple[int, int]]:
+        """Get {vin: (price, mileage)} for every stored listing."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT vin, price, mileage FROM listings")
+            return {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+
     def get_processed_vins(self) -> set:
         """Get set of all VINs already in database."""
         with self.get_connection() as conn:
@@ -346,6 +881,40 @@ class Database:
             cursor.execute("SELECT vin FROM listings")
             return {row[0] for row in cursor.fetchall()}
 
+    def iter_processed_vins(self) -> Iterator[str]:
+        """Stream all VINs in the database without building a list."""
+        conn = self._connect()  # own connection - the cursor stays open while the caller iterates
+        try:
+            for row in conn.execute("SELECT vin FROM listings WHERE vin IS NOT NULL"):
+                yield row[0]
+        finally:
+            conn.close()
+
+    def count_listings(self) -> int:
+        """Number of stored listings."""
+        with self.get_connection() as conn:
+            return conn.execute("SELECT COUNT(*) FROM listings").fetchone()[0]
+
+    def vin_exists(self, vin: str) -> bool:
+        """Check whether a single VIN is stored (uses the vin index)."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1 FROM listings WHERE vin = ? LIMIT 1", (vin,))
+            return cursor.fetchone() is not None
+
+    def existing_vins(self, vins: Iterable[str]) -> set:
+        """The subset of vins that are stored, in one query per 900 VINs."""
+        vins = list(set(vins))
+        existing = set()
+        with self.get_connection() as conn:
+            for i in range(0, len(vins), 900):  # Stay under SQLite's bound-variable limit
+                chunk = vins[i:i + 900]
+                cursor = conn.execute(
+                    f"SELECT vin FROM listings WHERE vin IN ({', '.join('?' * len(chunk))})", chunk
+                )
+                existing.update(row[0] for row in cursor)
+        return existing
+
     def get_manual_listings_summary(self) -> List[Dict]:
         """Get summary of all manual transmission listings."""
         with self.get_connection() as conn:
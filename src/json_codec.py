@@ -0,0 +1,78 @@
+"""
+Single JSON codec for the hot paths (API responses, raw listing/VIN columns,
+web views). Uses orjson or msgspec when installed and falls back to the
+standard library; JSON_CODEC picks one explicitly.
+
+dumps() always returns compact str output, so values stored in TEXT columns
+look the same whichever backend wrote them.
+"""
+import json
+import logging
+from typing import Callable, Dict, Tuple
+
+from config import JSON_CODEC
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+# Raised by loads() for malformed input, whatever the backend
+DecodeError = ValueError
+
+
+def available_backends() -> Dict[str, bool]:
+    return {"orjson": orjson is not None, "msgspec": msgspec is not None, "json": True}
+
+
+def make_codec(backend: str) -> Tuple[Callable, Callable]:
+    """(dumps, loads) for one backend. dumps(obj, sort_keys=False) -> str."""
+    if backend == "orjson":
+        options = orjson.OPT_NON_STR_KEYS
+
+        def dumps(obj, sort_keys: bool = False) -> str:
+            option = options | orjson.OPT_SORT_KEYS if sort_keys else options
+            return orjson.dumps(obj, default=str, option=option).decode()
+
+        return dumps, orjson.loads
+
+    if backend == "msgspec":
+        encoder = msgspec.json.Encoder(enc_hook=str)
+        sorted_encoder = msgspec.json.Encoder(enc_hook=str, order="sorted")
+        decoder = msgspec.json.Decoder()
+
+        def dumps(obj, sort_keys: bool = False) -> str:
+            return (sorted_encoder if sort_keys else encoder).encode(obj).decode()
+
+        def loads(data):
+            try:
+                return decoder.decode(data)
+            except msgspec.DecodeError as e:
+                raise DecodeError(str(e)) from e
+
+        return dumps, loads
+
+    def dumps(obj, sort_keys: bool = False) -> str:
+        return json.dumps(obj, sort_keys=sort_keys, default=str, separators=(",", ":"), ensure_ascii=False)
+
+    return dumps, json.loads
+
+
+def _select_backend(requested: str) -> str:
+    available = available_backends()
+    if requested in available:
+        if available[requested]:
+            return requested
+        logger.warning(f"JSON_CODEC={requested} is not installed - falling back")
+    return next(name for name in ("orjson", "msgspec", "json") if available[name])
+
+
+BACKEND = _select_backend(JSON_CODEC)
+dumps, loads = make_codec(BACKEND)
@@ -0,0 +1,122 @@
+"""
+Logging setup for the hunter: records go through a QueueHandler so the crawl
+threads never wait on formatting or I/O, a QueueListener thread writes them
+out (plain text or one JSON object per line), and chatty per-listing events
+are sampled before they are queued.
+
+Tag a log call with an event name to make it sampleable:
+    logger.info("Processing new VIN: %s", vin, extra={"event": "listing.new"})
+"""
+import atexit
+import itertools
+import logging
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+import json_codec
+from config import LOG_LEVEL, LOG_FORMAT, LOG_FILE, LOG_SAMPLE_RATES
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Attributes every LogRecord has; anything else came in through `extra`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener = None
+
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    """"listing.new=0.1,page.fetched=1" -> {"listing.new": 0.1, "page.fetched": 1.0}"""
+    rates = {}
+    for item in spec.split(","):
+        if "=" in item:
+            event, rate = item.split("=", 1)
+            rates[event.strip()] = float(rate)
+    return rates
+
+
+class SamplingFilter(logging.Filter):
+    """Keep 1 in N records of each sampled event (below WARNING); others pass untouched."""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.every = {event: max(1, round(1 / rate)) if rate > 0 else 0 for event, rate in rates.items()}
+        self.counters = {event: itertools.count() for event in rates}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        event = getattr(record, "event", None)
+        if event not in self.every or record.levelno >= logging.WARNING:
+            return True
+        every = self.every[event]
+        if not every:
+            return False
+        if every > 1:
+            record.sample_rate = 1 / every
+        return next(self.counters[event]) % every == 0
+
+
+_IMMUTABLE_ARGS = (str, int, float)
+
+
+class LocalQueueHandler(QueueHandler):
+    """
+    Enqueue the record as is, so message formatting happens on the listener thread -
+    unless it has mutable args (a stats dict, a list), which are formatted now
+    before the caller can change them.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # A lone dict argument becomes record.args itself, so any dict counts as mutable
+        args = record.args
+        if (not isinstance(record.msg, str) or isinstance(args, dict)
+                or (args and not all(isinstance(arg, _IMMUTABLE_ARGS) for arg in args))):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, including any `extra` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json_codec.dumps(entry)
+
+
+def setup_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT, log_file: Optional[str] = LOG_FILE,
+                  sample_rates: str = LOG_SAMPLE_RATES) -> QueueListener:
+    """Route the root logger through a queue to stderr (and log_file). Safe to call more than once."""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    formatter = JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT)
+    handlers = [logging.StreamHandler(sys.stderr)]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = LocalQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(parse_sample_rates(sample_rates)))
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(level.upper())
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
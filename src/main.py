@@ -1,105 +1,443 @@
 #!/usr/bin/env python3
 """VIN-focused 4Runner manual transmission hunter (1984-2002)"""
 import logging
-from typing import Dict, List, Optional
+import os
+import socket
+import time
+from contextlib import ExitStack, contextmanager
+from typing import Dict, List, Optional, Tuple
 from api_client import AutoDevAPI
+from crawl_planner import plan_shards
+from config import (
+    INCREMENTAL_CRAWL, SEEN_VIN_INDEX_BACKEND, DECODE_QUEUE_BATCH_SIZE,
+    DECODE_TASK_LEASE_SECONDS, DECODE_TASK_MAX_ATTEMPTS, DECODE_TASK_RETRY_DELAY_SECONDS,
+    API_DAILY_CALL_BUDGET, AUTOMATIC_DECODE_BUDGET_RESERVE, DECODE_CONFIRMED_AUTOMATICS,
+    VIN_OFFLINE_DB_PATH, API_ARCHIVE_ENABLED, PATTERN_LEARNING_ENABLED, PATTERN_LEARNING_MIN_OBSERVATIONS,
+    PATTERN_SKIP_DECODE_MIN_OBSERVATIONS
+)
 from database import Database
+import json_codec
+from log_setup import setup_logging
+from response_archive import ResponseArchive, ResponseReplay
 from vin_analyzer import Toyota4RunnerVINAnalyzer
+from vin_index import SeenVINIndex
+from vin_offline_decoder import OfflineVINDecoder
+from vin_patterns import learn_patterns
 
 logger = logging.getLogger(__name__)
 
 class FourRunnerHunter:
     """VIN-focused manual transmission hunter (1984-2002)"""
 
-    def __init__(self):
-        self.api_client = AutoDevAPI()
-        self.database = Database()
-        self.vin_analyzer = Toyota4RunnerVINAnalyzer()
+    CRAWL_STATE_NAME = "auto.dev"
+
+    # Decode queue priorities (lower is decoded first)
+    PRIORITY_FIRST_GEN = 0
+    PRIORITY_HIGH_CONFIDENCE_MANUAL = 10
+    PRIORITY_MANUAL_CANDIDATE = 20
+    PRIORITY_UNKNOWN_PATTERN = 30
+    PRIORITY_CONFIRMED_AUTOMATIC = 90
 
-    def search_4runners_vin_focused(self) -> Dict:
+    def __init__(self, replay_run: Optional[str] = None, warm: bool = False,
+                 database: Optional[Database] = None):
         """
-        New VIN-focused search flow (1984-2002):
-        1. Get all 4Runner listings
-        2. Filter to 1984-2002 only (ignore 2003+)
-        3. Collect ALL 1st gen (1984-1989) regardless of transmission
-        4. Analyze 2nd/3rd gen (1990-2002) VINs for manual transmission codes
-        5. Store results and notify
+        replay_run: archived run id (or "latest") to replay instead of calling the API.
+        warm: keep database connections open between runs (long-running processes).
+        database: use this Database instead of the configured one (e.g. a scratch one).
         """
-        logger.info("Starting VIN-focused 4Runner search (1984-2002)...")
-
-        stats = {
+        self.database = database or Database(persistent_connections=warm)
+        offline_decoder = None
+        if VIN_OFFLINE_DB_PATH and os.path.exists(VIN_OFFLINE_DB_PATH):
+            offline_decoder = OfflineVINDecoder(VIN_OFFLINE_DB_PATH)
+        replay = ResponseReplay(replay_run) if replay_run else None
+        self.api_client = AutoDevAPI(cache=self.database, offline_decoder=offline_decoder, replay=replay)
+        self.vin_analyzer = Toyota4RunnerVINAnalyzer()
+        # Only read the stored counts here; crawls and --learn-patterns recount them
+        self.update_pattern_learning(recount=False)
+        self.seen_vins = None
+        # Identifies this process when leasing decode tasks
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        # API calls already written to the daily budget ledger
+        self.api_calls_recorded = 0
+
+    @contextmanager
+    def archived_responses(self):
+        """Archive every API response made inside the block; yields the archive run id (None when off)."""
+        if not API_ARCHIVE_ENABLED or self.api_client.replay or self.api_client.archive:
+            yield None
+            return
+
+        archive = ResponseArchive()
+        self.api_client.archive = archive
+        try:
+            yield archive.run_id
+        finally:
+            self.api_client.archive = None
+            archive.close()
+
+    @staticmethod
+    def new_run_stats() -> Dict:
+        """Counters reported by a search run."""
+        return {
             "total_listings": 0,
             "filtered_out_modern": 0,
+            "invalid_vins_skipped": 0,
             "first_gen_collected": 0,
             "manual_candidates": 0,
             "confirmed_manuals": 0,
             "api_calls_saved": 0,
             "new_manual_finds": 0,
-            "new_first_gen_finds": 0
+            "new_first_gen_finds": 0,
+            "new_listings": 0,
+            "vin_cache_hits": 0,
+            "squish_decodes_shared": 0,
+            "offline_decodes": 0,
+            "listings_refreshed": 0,
+            "listings_unchanged": 0,
+            "decode_tasks_queued": 0,
+            "decode_retries": 0,
+            "decodes_skipped": 0,
+            "learned_decodes_skipped": 0,
+            "budget_exhausted": False,
+            "time_to_alert_seconds": [],
+            "crawl_skipped": False
         }
 
-        # Step 1: Get all listings
-        listings = self.api_client.get_all_4runner_listings()
-        stats["total_listings"] = len(listings)
+    def search_4runners_vin_focused(self, incremental: Optional[bool] = None,
+                                    shard_by: Optional[str] = None) -> Dict:
+        """
+        New VIN-focused search flow (1984-2002):
+        1. Get all 4Runner listings (or only the new ones when incremental)
+        2. Filter to 1984-2002 only (ignore 2003+)
+        3. Collect ALL 1st gen (1984-1989) regardless of transmission
+        4. Analyze 2nd/3rd gen (1990-2002) VINs for manual transmission codes
+        5. Store results and notify
+        Raw API responses of the run are archived (see archived_responses).
+        """
+        with self.archived_responses() as archive_run_id:
+            stats = self._search_vin_focused(incremental, shard_by)
+        stats["archive_run_id"] = archive_run_id
+        return stats
 
-        if not listings:
-            logger.warning("No listings found!")
-            return stats
+    def _search_vin_focused(self, incremental: Optional[bool], shard_by: Optional[str]) -> Dict:
+        logger.info("Starting VIN-focused 4Runner search (1984-2002)...")
+
+        stats = self.new_run_stats()
+
+        # Resume decode work left behind by an interrupted run
+        pending = self.database.count_decode_tasks()
+        if pending:
+            logger.info(f"Resuming queued decode tasks: {pending}")
+            self.drain_decode_queue(stats)
+
+        # Step 1: Get listings - streamed page by page so finds are stored as soon as they arrive
+        if incremental is None:
+            incremental = INCREMENTAL_CRAWL
+
+        crawl_state = None
+        if incremental:
+            listings, crawl_state = self.fetch_new_listings()
+            if crawl_state.get("unchanged"):
+                stats["crawl_skipped"] = True
+                return stats
+            pages = [listings] if listings else []
+        else:
+            pages = self.api_client.iter_4runner_listing_pages(shards=plan_shards(shard_by))
 
-        logger.info(f"Found {len(listings)} total listings")
+        # Load the stored VINs once; kept current as listings are inserted
+        self.seen_vins = SeenVINIndex(self.database, SEEN_VIN_INDEX_BACKEND)
 
-        # Step 2: VIN pattern analysis with year filtering
-        vin_results = self.vin_analyzer.batch_analyze_vins(listings)
+        summary = self.vin_analyzer.new_summary()
+        outside_target_years = []
+        seen_this_run = set()
 
-        manual_candidates = vin_results["manual_candidates"]
-        auto_confirmed = vin_results["automatic_confirmed"]
-        needs_api_verification = vin_results["needs_api_verification"]
-        outside_target_years = vin_results["outside_target_years"]
+        for page_listings in pages:
+            # Steps 2-3: VIN pattern analysis, decode and store for this page
+            self.process_listings(page_listings, stats, summary, outside_target_years, seen_this_run)
 
-        # Update stats
-        stats["filtered_out_modern"] = len(outside_target_years)
-        stats["manual_candidates"] = len(manual_candidates)
-        stats["first_gen_collected"] = vin_results["summary"]["first_gen_collected"]
-        stats["api_calls_saved"] = len(auto_confirmed) + len(outside_target_years)
+        if not stats["total_listings"]:
+            logger.warning("No listings found!")
+            return stats
 
+        logger.info(f"Found {stats['total_listings']} total listings")
         logger.info(f"VIN Analysis Results:")
         logger.info(f"  Total in target years (1984-2002): {stats['total_listings'] - stats['filtered_out_modern']}")
         logger.info(f"  Filtered out (2003+): {stats['filtered_out_modern']}")
         logger.info(f"  1st Gen collected (1984-1989): {stats['first_gen_collected']}")
-        logger.info(f"  Manual candidates (2nd/3rd gen): {len(manual_candidates) - stats['first_gen_collected']}")
-        logger.info(f"  Auto confirmed: {len(auto_confirmed)}")
-        logger.info(f"  Needs API verification: {len(needs_api_verification)}")
+        logger.info(f"  Manual candidates (2nd/3rd gen): {stats['manual_candidates'] - stats['first_gen_collected']}")
+        logger.info(f"  Auto confirmed: {summary['automatic_found']}")
+        logger.info(f"  Needs API verification: {summary['needs_verification']}")
         logger.info(f"  API calls saved: {stats['api_calls_saved']}")
+        if stats["invalid_vins_skipped"]:
+            logger.info(f"  Invalid VINs skipped (bad check digit): {stats['invalid_vins_skipped']}")
+        if stats["vin_cache_hits"]:
+            logger.info(f"  VIN decodes served from cache: {stats['vin_cache_hits']}")
+        if stats["squish_decodes_shared"]:
+            logger.info(f"  VIN decodes shared by squish VIN: {stats['squish_decodes_shared']}")
+        if stats["offline_decodes"]:
+            logger.info(f"  VIN decodes from the offline database: {stats['offline_decodes']}")
+        logger.info(f"  Known listings refreshed: {stats['listings_refreshed']} "
+                    f"(unchanged: {stats['listings_unchanged']})")
+        if stats["time_to_alert_seconds"]:
+            logger.info(f"  Time to alert for new manual finds: max {max(stats['time_to_alert_seconds']):.1f}s")
+        if stats["learned_decodes_skipped"]:
+            logger.info(f"  Decodes skipped on learned patterns: {stats['learned_decodes_skipped']}")
+        if stats["budget_exhausted"]:
+            queued = sum(self.database.count_decode_tasks().values())
+            logger.info(f"  Daily API budget exhausted - {queued} decodes left queued")
+
+        # Step 4: Log filtered vehicles (for debugging)
+        if outside_target_years:
+            logger.info(f"Filtered out {stats['filtered_out_modern']} vehicles from 2003+:")
+            for listing in outside_target_years:
+                year = self.vin_analyzer.decode_year_from_vin(listing.get("vin", ""))
+                logger.info(f"  {listing.get('vin')} ({year}) - Outside target range")
+
+        # Log new finds
+        total_new_finds = stats["new_manual_finds"] + stats["new_first_gen_finds"]
+        if total_new_finds:
+            logger.info(f"Found {total_new_finds} new target 4Runners!")
+            logger.info(f"  Manual transmissions: {stats['new_manual_finds']}")
+            logger.info(f"  1st Gen (any transmission): {stats['new_first_gen_finds']}")
+
+        # Log summary statistics
+        logger.info("VIN Analysis Summary:")
+        for key, value in summary.items():
+            logger.info(f"  {key}: {value}")
+
+        # Only remember the probe once everything it covered has been processed
+        if crawl_state and "fingerprint" in crawl_state:
+            self.database.save_crawl_state(
+                self.CRAWL_STATE_NAME, crawl_state["total_count"], crawl_state["fingerprint"]
+            )
+
+        # Fold this run's decode outcomes into the learned pattern confidences
+        self.update_pattern_learning()
+
+        return stats
+
+    def process_listings(self, listings: List[Dict], stats: Dict, summary: Dict,
+                         outside_target_years: List[Dict], seen_this_run: set):
+        """Classify one batch (page) of listings, decode the new ones and store them."""
+        stats["total_listings"] += len(listings)
+        fetched_at = time.time()
+
+        categories = {
+            "manual_candidates": [],
+            "needs_api_verification": [],
+            "automatic_confirmed": []
+        }
+        for category, listing in self.vin_analyzer.iter_classified_listings(listings):
+            self.vin_analyzer.count_in_summary(summary, category, listing)
+            if category == "outside_target_years":
+                stats["filtered_out_modern"] += 1
+                stats["api_calls_saved"] += 1
+                if len(outside_target_years) < 3:  # Keep first 3 as examples
+                    outside_target_years.append(listing)
+            elif category == "invalid_vins" and listing.get("vin"):
+                # Bad check digit or characters - a decode would only waste quota
+                stats["invalid_vins_skipped"] += 1
+                stats["api_calls_saved"] += 1
+                logger.debug("Skipping invalid VIN %s: %s", listing["vin"], listing["vin_analysis"]["reason"])
+            elif category in categories:
+                categories[category].append(listing)
+
+        stats["manual_candidates"] += len(categories["manual_candidates"])
+        stats["first_gen_collected"] = summary["first_gen_collected"]
 
-        # Step 3: Process ALL listings with VIN decode for complete data
-        new_manual_finds = []
-        new_first_gen_finds = []
-        
         # Combine all listings to process with VIN decode
-        all_listings_to_process = manual_candidates + needs_api_verification + auto_confirmed
-        
+        all_listings_to_process = (categories["manual_candidates"] + categories["needs_api_verification"]
+                                   + categories["automatic_confirmed"])
+        automatic_vins = {listing["vin"] for listing in categories["automatic_confirmed"]}
+
+        # Keep only VINs not already in the database (first occurrence wins);
+        # known VINs just get their price/mileage/last_seen refreshed
+        new_listings = []
+        known_listings = []
+        known_vins = self.seen_vins.known_vins(listing["vin"] for listing in all_listings_to_process)
         for listing in all_listings_to_process:
-            analysis = listing["vin_analysis"]
             vin = listing["vin"]
-            
-            # Check if this VIN already exists in database
-            existing_vins = self.database.get_processed_vins()
-            if vin in existing_vins:
-                logger.debug(f"Skipping existing VIN: {vin}")
+            if vin in seen_this_run:
                 continue
-            
-            logger.info(f"Processing new VIN: {vin} ({analysis['year']}) - {analysis['reason']}")
-            
+            seen_this_run.add(vin)
+            if vin in known_vins:
+                logger.debug("Skipping existing VIN: %s", vin)
+                known_listings.append({
+                    "vin": vin,
+                    "price": self.parse_price(listing.get("price")),
+                    "mileage": self.parse_mileage(listing.get("mileage")),
+                    "raw_listing_data": listing
+                })
+                continue
+            new_listings.append(listing)
+
+        if known_listings:
+            refreshed = self.database.refresh_listings(known_listings)
+            stats["listings_refreshed"] += refreshed
+            stats["listings_unchanged"] += len(known_listings) - refreshed
+
+        self.record_api_usage()
+        if not new_listings:
+            return
+
+        tasks = []
+        pattern_only = []
+        for listing in new_listings:
+            task = {
+                "vin": listing["vin"],
+                "payload": {"listing": listing, "fetched_at": fetched_at},
+                "priority": self.decode_priority(listing["vin_analysis"], listing["vin"] in automatic_vins)
+            }
+            learned_skip = listing["vin_analysis"]["skip_decode"]
+            if learned_skip or (listing["vin"] in automatic_vins and not DECODE_CONFIRMED_AUTOMATICS):
+                # Never spend a decode on a pattern-confirmed automatic or a pattern
+                # with a long perfect decode record
+                task["id"] = None
+                task["payload"]["skip_decode"] = True
+                pattern_only.append(task)
+                if learned_skip:
+                    stats["learned_decodes_skipped"] += 1
+            else:
+                tasks.append(task)
+
+        if pattern_only:
+            # Confirmed automatics are counted here, once, and only when their decode is skipped
+            stats["decodes_skipped"] += len(pattern_only)
+            stats["api_calls_saved"] += len(pattern_only)
+            self.store_decoded_listings([(task, None) for task in pattern_only], stats)
+
+        # Hand new listings to the durable decode queue, then work it off
+        queued = self.database.enqueue_decode_tasks(tasks)
+        stats["decode_tasks_queued"] += queued
+        self.drain_decode_queue(stats)
+
+    def decode_priority(self, analysis: Dict, is_confirmed_automatic: bool) -> int:
+        """Order decode work by expected value: likely manuals first, confirmed automatics last."""
+        if analysis["is_first_gen"]:
+            return self.PRIORITY_FIRST_GEN
+        if is_confirmed_automatic:
+            return self.PRIORITY_CONFIRMED_AUTOMATIC
+        if analysis["is_manual_candidate"]:
+            if analysis["confidence"] >= 90:
+                return self.PRIORITY_HIGH_CONFIDENCE_MANUAL
+            return self.PRIORITY_MANUAL_CANDIDATE
+        return self.PRIORITY_UNKNOWN_PATTERN
+
+    def update_pattern_learning(self, recount: bool = True) -> int:
+        """
+        Recount decode outcomes per VIN pattern (or with recount=False, read the stored
+        counts) and hand the learned confidences to the analyzer. Returns the number of
+        learned patterns.
+        """
+        if not PATTERN_LEARNING_ENABLED:
+            return 0
+        if recount:
+            observations = self.database.refresh_pattern_observations()
+        else:
+            observations = self.database.get_pattern_observations()
+        learned = learn_patterns(observations, PATTERN_LEARNING_MIN_OBSERVATIONS,
+                                 PATTERN_SKIP_DECODE_MIN_OBSERVATIONS)
+        self.vin_analyzer.apply_learned_patterns(learned)
+        if learned:
+            skipping = sum(1 for pattern in learned.values() if pattern.skip_decode)
+            logger.info(f"Learned confidences for {len(learned)} VIN patterns ({skipping} no longer decoded)")
+        return len(learned)
+
+    def remaining_api_budget(self) -> Optional[int]:
+        """API calls left in today's budget, or None when no budget is configured."""
+        if not API_DAILY_CALL_BUDGET:
+            return None
+        return API_DAILY_CALL_BUDGET - self.database.get_api_calls_for_day()
+
+    def record_api_usage(self):
+        """Write API calls made since the last call to the persisted daily ledger."""
+        calls = self.api_client.get_api_calls_count() - self.api_calls_recorded
+        if calls > 0:
+            self.database.record_api_calls(calls)
+            self.api_calls_recorded += calls
+
+    def drain_decode_queue(self, stats: Optional[Dict] = None) -> Dict:
+        """
+        Lease decode tasks in batches until the queue has nothing runnable, decode
+        them concurrently and store the results. Safe to run from several processes.
+        """
+        if stats is None:
+            stats = self.new_run_stats()
+
+        while True:
+            limit = DECODE_QUEUE_BATCH_SIZE
+            max_priority = None
+            budget_left = self.remaining_api_budget()
+            if budget_left is not None:
+                if budget_left <= 0:
+                    logger.warning(f"Daily API budget of {API_DAILY_CALL_BUDGET} calls used - leaving decodes queued")
+                    stats["budget_exhausted"] = True
+                    return stats
+                limit = min(limit, budget_left)
+                if budget_left <= AUTOMATIC_DECODE_BUDGET_RESERVE:
+                    # Save what's left for work that can actually find a manual
+                    max_priority = self.PRIORITY_CONFIRMED_AUTOMATIC - 1
+
+            tasks = self.database.lease_decode_tasks(
+                self.worker_id, limit, DECODE_TASK_LEASE_SECONDS, max_priority=max_priority
+            )
+            if not tasks:
+                return stats
+
             # Always run VIN decode for new listings to get complete data
-            logger.info(f"  Running VIN decode for complete vehicle data...")
-            vin_data = self.api_client.decode_vin(vin)
-            vehicle_info = self.create_vehicle_info_with_decode(listing, analysis, vin_data)
-            
+            logger.info("Running VIN decode for %d queued listings...", len(tasks), extra={"event": "decode.batch"})
+            cache_hits_before = self.api_client.vin_cache_hits
+            shared_before = self.api_client.squish_decodes_shared
+            offline_before = self.api_client.offline_decodes
+            results = self.api_client.decode_vins_with_status(
+                [task["vin"] for task in tasks], retry_failures=True
+            )
+            cache_hits = self.api_client.vin_cache_hits - cache_hits_before
+            shared = self.api_client.squish_decodes_shared - shared_before
+            offline = self.api_client.offline_decodes - offline_before
+            stats["vin_cache_hits"] += cache_hits
+            stats["squish_decodes_shared"] += shared
+            stats["offline_decodes"] += offline
+            stats["api_calls_saved"] += cache_hits + shared + offline
+
+            decoded = []
+            for task, (status, vin_data) in zip(tasks, results):
+                if status == "failure" and task["attempts"] < DECODE_TASK_MAX_ATTEMPTS:
+                    # Transient error - back off and let a later drain retry it
+                    delay = DECODE_TASK_RETRY_DELAY_SECONDS * 2 ** (task["attempts"] - 1)
+                    self.database.retry_decode_task(task["id"], "VIN decode failed", delay)
+                    stats["decode_retries"] += 1
+                    continue
+                decoded.append((task, vin_data))
+
+            self.record_api_usage()
+            self.store_decoded_listings(decoded, stats)
+
+    def store_decoded_listings(self, decoded: List[Tuple[Dict, Optional[Dict]]], stats: Dict):
+        """Build vehicle info for decoded tasks, upsert them in one batch and complete the tasks."""
+        if not decoded:
+            return
+
+        vehicle_infos = []
+        for task, vin_data in decoded:
+            listing = task["payload"]["listing"]
+            analysis = listing["vin_analysis"]
+            vin = listing["vin"]
+
+            logger.info("Processing new VIN: %s (%s) - %s", vin, analysis["year"], analysis["reason"],
+                        extra={"event": "listing.new"})
+            if task["payload"].get("skip_decode"):
+                vehicle_info = self.create_vehicle_info_from_pattern(listing, analysis)
+            else:
+                vehicle_info = self.create_vehicle_info_with_decode(listing, analysis, vin_data)
+
             # Override transmission detection based on VIN patterns for known types
             if analysis["is_first_gen"]:
                 vehicle_info["is_manual"] = True  # 1st gen - collect all
                 vehicle_info["manual_source"] = "FIRST_GEN_COLLECTION"
                 vehicle_info["is_first_gen"] = True
+            elif task["payload"].get("skip_decode"):
+                pass  # Pattern-only result, nothing to confirm against
             elif analysis["confidence"] >= 90 and analysis["is_manual_candidate"]:
                 vehicle_info["is_manual"] = True
                 vehicle_info["manual_source"] = "VIN_PATTERN_CONFIRMED_BY_API"
@@ -108,45 +446,56 @@ class FourRunnerHunter:
                 vehicle_info["manual_source"] = "VIN_PATTERN_AUTO_CONFIRMED_BY_API"
             # For low confidence, rely on API decode data (handled in create_vehicle_info_with_decode)
 
-            # Store in database
-            is_new = self.database.upsert_listing(vehicle_info)
-            if is_new:
+            vehicle_infos.append((vehicle_info, analysis, task["payload"].get("fetched_at")))
+
+        # Store the whole batch in one transaction, then drop the tasks
+        upserted = self.database.bulk_upsert_listings(info for info, _, _ in vehicle_infos)
+        self.database.complete_decode_tasks([task["id"] for task, _ in decoded if task["id"] is not None])
+        inserted_vins = set(upserted["new"])
+        stats["new_listings"] += len(inserted_vins)
+        stored_at = time.time()
+
+        time_to_alert = {}
+        for vehicle_info, analysis, fetched_at in vehicle_infos:
+            if self.seen_vins is not None:
+                self.seen_vins.add(vehicle_info["vin"])
+            if vehicle_info["vin"] in inserted_vins:
                 if vehicle_info.get("is_manual"):
-                    new_manual_finds.append(vehicle_info)
                     stats["new_manual_finds"] += 1
                     stats["confirmed_manuals"] += 1
-                    
+                    if fetched_at:
+                        time_to_alert[vehicle_info["vin"]] = round(stored_at - fetched_at, 3)
+
                 if analysis["is_first_gen"]:
-                    new_first_gen_finds.append(vehicle_info)
                     stats["new_first_gen_finds"] += 1
-                    
+
                 # Log patterns for research
                 if analysis["confidence"] < 80:
                     manual_status = "MANUAL" if vehicle_info.get("is_manual") else "AUTO"
-                    logger.info(f"RESEARCH: Pattern {analysis['model_code']} for year {analysis['year']} = {manual_status}")
-
-        # Step 4: Log filtered vehicles (for debugging)
-        if outside_target_years:
-            sample_filtered = outside_target_years[:3]  # Show first 3 as examples
-            logger.info(f"Filtered out {len(outside_target_years)} vehicles from 2003+:")
-            for listing in sample_filtered:
-                year = self.vin_analyzer.decode_year_from_vin(listing.get("vin", ""))
-                logger.info(f"  {listing.get('vin')} ({year}) - Outside target range")
-
-        # Log new finds
-        total_new_finds = new_manual_finds + new_first_gen_finds
-        if total_new_finds:
-            logger.info(f"Found {len(total_new_finds)} new target 4Runners!")
-            logger.info(f"  Manual transmissions: {len(new_manual_finds)}")
-            logger.info(f"  1st Gen (any transmission): {len(new_first_gen_finds)}")
-
-        # Log summary statistics
-        logger.info("VIN Analysis Summary:")
-        summary = vin_results["summary"]
-        for key, value in summary.items():
-            logger.info(f"  {key}: {value}")
-
-        return stats
+                    logger.info("RESEARCH: Pattern %s for year %s = %s", analysis["model_code"], analysis["year"],
+                                manual_status, extra={"event": "listing.research"})
+
+        if time_to_alert:
+            self.database.set_time_to_alert(time_to_alert)
+            stats["time_to_alert_seconds"].extend(time_to_alert.values())
+
+    def fetch_new_listings(self) -> Tuple[List[Dict], Dict]:
+        """Incremental crawl: fetch newest listings until pages are all known and unchanged."""
+        snapshots = self.database.get_listing_snapshots()
+
+        def is_known(listing: Dict) -> bool:
+            vin = listing.get("vin")
+            if not self.vin_analyzer.extract_vin_components(vin or "")["valid"]:
+                return True  # Outside target years or malformed - never stored, nothing to refresh
+            snapshot = snapshots.get(vin)
+            return snapshot is not None and snapshot == (
+                self.parse_price(listing.get("price")),
+                self.parse_mileage(listing.get("mileage"))
+            )
+
+        return self.api_client.get_new_4runner_listings(
+            is_known, self.database.get_crawl_state(self.CRAWL_STATE_NAME)
+        )
 
     def identify_4runner_engine(self, engine_data: Dict) -> Optional[str]:
         """Identify the Toyota 4Runner engine code from VIN decode data."""
@@ -191,6 +540,18 @@ class FourRunnerHunter:
             "raw_listing_data": listing
         }
 
+    def create_vehicle_info_from_pattern(self, listing: Dict, analysis: Dict) -> Dict:
+        """Create vehicle info from the VIN pattern alone (no decode)"""
+        vehicle_info = self.create_vehicle_info_from_listing(listing, analysis)
+        vehicle_info["is_manual"] = analysis["is_manual_candidate"]
+        if analysis.get("skip_decode") and analysis["is_manual_candidate"]:
+            vehicle_info["manual_source"] = "VIN_PATTERN_LEARNED"
+        else:
+            vehicle_info["manual_source"] = (
+                "VIN_PATTERN_MANUAL" if analysis["is_manual_candidate"] else "VIN_PATTERN_AUTO_CONFIRMED"
+            )
+        return vehicle_info
+
     def create_vehicle_info_with_decode(self, listing: Dict, analysis: Dict, vin_data: Dict) -> Dict:
         """Create vehicle info from listing, VIN analysis, and API decode"""
         vehicle_info = self.create_vehicle_info_from_listing(listing, analysis)
@@ -202,6 +563,7 @@ class FourRunnerHunter:
 
             # Check if API confirms manual
             api_is_manual = "MANUAL" in api_trans_type
+            vehicle_info["decode_source"] = "offline" if vin_data.get("decodeSource") == "offline" else "api"
 
             # Combine VIN pattern and API analysis
             if api_is_manual and analysis["confidence"] >= 50:
@@ -282,9 +644,68 @@ class FourRunnerHunter:
             "total_manual_finds": stats.get("new_manual_finds", 0)
         }
         
-        logger.info(f"Search completed: {combined_stats}")
+        logger.info("Search completed: %s", combined_stats)
         return combined_stats
 
+    def refresh_watched_listings(self) -> Dict:
+        """
+        Re-check only the watched listings: one GET /listings/{id} each, falling back
+        to a VIN-filtered search, then write price and status changes in one batch.
+        """
+        watched = self.database.get_watched_listings()
+        stats = {"watched": len(watched), "refreshed": 0, "price_changes": 0, "removed": 0,
+                 "fallback_searches": 0, "not_found": 0, "failed": 0, "api_calls": 0}
+        if not watched:
+            return stats
+
+        budget = self.remaining_api_budget()
+        if budget is not None and budget < len(watched):
+            logger.warning(f"Skipping watched refresh: {budget} API calls left in today's budget")
+            return stats
+
+        calls_before = self.api_client.get_api_calls_count()
+        refreshed = []
+        removed_vins = []
+        for row in watched:
+            vin = row["vin"]
+            raw_listing = json_codec.loads(row["raw_listing_data"]) if row.get("raw_listing_data") else {}
+            status, record = "failure", None
+            if raw_listing.get("id"):
+                status, record = self.api_client.get_listing(raw_listing["id"])
+            if status in ("not_found", "failure"):
+                stats["fallback_searches"] += 1
+                id_status = status
+                status, record = self.api_client.find_listing_by_vin(vin, row.get("year"))
+                # Gone by its id and not found by VIN either
+                if id_status == "not_found" and status == "not_found":
+                    status = "removed"
+
+            if status == "removed":
+                removed_vins.append(vin)
+                if row.get("listing_status") != "removed":
+                    logger.info(f"Watched {row.get('year')} 4Runner {vin} is no longer listed")
+            elif status == "active":
+                refreshed.append({
+                    "vin": vin,
+                    "price": self.parse_price(record.get("price")),
+                    "mileage": self.parse_mileage(record.get("mileage")),
+                    "raw_listing_data": record
+                })
+                new_price = refreshed[-1]["price"]
+                if new_price and row.get("price") and new_price != row["price"]:
+                    logger.info(f"Watched {row.get('year')} 4Runner {vin}: price "
+                                f"${row['price']:,} -> ${new_price:,}")
+            else:
+                stats["not_found" if status == "not_found" else "failed"] += 1
+
+        result = self.database.apply_watched_refresh(refreshed, removed_vins)
+        self.record_api_usage()
+
+        stats.update(result, refreshed=len(refreshed),
+                     api_calls=self.api_client.get_api_calls_count() - calls_before)
+        logger.info(f"Watched refresh: {stats}")
+        return stats
+
     def parse_price(self, price_str) -> int:
         """Parse price string to integer"""
         if not price_str:
@@ -316,16 +737,60 @@ class FourRunnerHunter:
 
 if __name__ == "__main__":
     # Set up logging
-    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    setup_logging()
 
-    hunter = FourRunnerHunter()
-    
     # Add command line argument support
     import sys
+    replay_run = sys.argv[2] if len(sys.argv) > 2 and sys.argv[1] == "--replay" else None
+    daemon = len(sys.argv) > 1 and sys.argv[1] == "--daemon"
+    hunter = FourRunnerHunter(replay_run=replay_run, warm=daemon)
+
+    # Runs never overlap the daemon or the web app's /refresh (the daemon locks each of
+    # its runs itself); decode workers only keep crawls out, not each other
+    locks = ExitStack()
+    if not daemon and sys.argv[1:2] != ["--learn-patterns"]:
+        from scheduler import crawl_lock
+        if not locks.enter_context(crawl_lock(shared=sys.argv[1:2] == ["--decode-worker"])):
+            logger.error("Another search holds the crawl lock - exiting")
+            sys.exit(1)
+
     if len(sys.argv) > 1 and sys.argv[1] == "--craigslist-only":
         stats = hunter.search_craigslist_4runners()
     elif len(sys.argv) > 1 and sys.argv[1] == "--auto-dev-only":
         stats = hunter.search_4runners_vin_focused()
+    elif len(sys.argv) > 1 and sys.argv[1] == "--incremental":
+        stats = hunter.search_4runners_vin_focused(incremental=True)
+    elif len(sys.argv) > 2 and sys.argv[1] == "--sharded":
+        # e.g. --sharded year,zip
+        stats = hunter.search_4runners_vin_focused(shard_by=sys.argv[2])
+    elif replay_run:
+        # Feed an archived run (id or "latest") through the full pipeline without the network
+        stats = hunter.search_4runners_vin_focused()
+        replay = hunter.api_client.replay
+        logger.info(f"Replayed run {replay.run_id}: {replay.served} responses served "
+                    f"({replay.squish_served} VIN decodes by squish VIN), {replay.missing} missing")
+    elif daemon:
+        # Run searches on an adaptive schedule until stopped
+        from scheduler import HunterScheduler
+        HunterScheduler(hunter).run_forever()
+        stats = None
+    elif len(sys.argv) > 1 and sys.argv[1] == "--refresh-watched":
+        # Re-check watched listings only
+        with hunter.archived_responses():
+            stats = hunter.refresh_watched_listings()
+    elif len(sys.argv) > 1 and sys.argv[1] == "--learn-patterns":
+        # Show what decode outcomes say about each VIN pattern
+        hunter.update_pattern_learning()
+        for (model_code, year), pattern in sorted(hunter.vin_analyzer.rules.learned.items()):
+            logger.info(f"{model_code} {year}: {pattern.manual_count} manual / {pattern.automatic_count} auto -> "
+                        f"{'manual' if pattern.is_manual else 'automatic'} {pattern.confidence}%"
+                        f"{' (skip decode)' if pattern.skip_decode else ''}")
+        stats = None
+    elif len(sys.argv) > 1 and sys.argv[1] == "--decode-worker":
+        # Work off the shared decode queue only (several may run at once)
+        with hunter.archived_responses():
+            stats = hunter.drain_decode_queue()
     else:
         # Default: search all sources
         stats = hunter.search_all_sources()
+    locks.close()
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Append-only archive of raw API responses, and replay from it.
+
+Each run writes its responses to compressed JSONL segments under
+<archive dir>/<run id>/ (zstd when the zstandard package is installed and
+requested, gzip otherwise), and appends a summary line to <archive dir>/index.jsonl. Runs beyond the newest
+API_ARCHIVE_KEEP_RUNS are deleted when a run is closed.
+ResponseReplay serves a recorded run back to AutoDevAPI so the whole
+analyze/decode/persist pipeline can run without the network. A VIN decode that
+was not archived (live, it came from the cache or a squish VIN share) is served
+from an archived decode of the same squish VIN.
+
+Usage:
+    python response_archive.py list
+"""
+import gzip
+import io
+import logging
+import os
+import shutil
+import sys
+import threading
+import uuid
+from collections import defaultdict, deque
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import json_codec
+from database import squish_vin
+from config import API_ARCHIVE_DIR, API_ARCHIVE_COMPRESSION, API_ARCHIVE_SEGMENT_RECORDS, API_ARCHIVE_KEEP_RUNS
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "index.jsonl"
+
+
+def new_run_id() -> str:
+    """Sortable and unique, even for several runs in one second from one process."""
+    return f"{datetime.now().strftime('%Y%m%dT%H%M%S.%f')}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+
+def request_key(endpoint: str, params: Optional[Dict]) -> str:
+    """Canonical form of a request, used to match replayed responses."""
+    return f"{endpoint}?{json_codec.dumps(params or {}, sort_keys=True)}"
+
+
+def _open_segment(path: Path, mode: str):
+    """Open a segment for text reading or writing, by file extension."""
+    if path.suffix == ".zst":
+        if zstandard is None:
+            raise RuntimeError(f"{path} is zstd-compressed but the zstandard package is not installed")
+        if "w" in mode:
+            return io.TextIOWrapper(zstandard.ZstdCompressor().stream_writer(open(path, "wb")), encoding="utf-8")
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(path, "rb")), encoding="utf-8")
+    return gzip.open(path, mode + "t", encoding="utf-8")
+
+
+class ResponseArchive:
+    """Writes one run's API responses to rolling compressed JSONL segments."""
+
+    def __init__(self, directory: str = API_ARCHIVE_DIR, run_id: Optional[str] = None,
+                 compression: str = API_ARCHIVE_COMPRESSION,
+                 segment_records: int = API_ARCHIVE_SEGMENT_RECORDS, keep_runs: int = API_ARCHIVE_KEEP_RUNS):
+        self.directory = Path(directory)
+        self.keep_runs = keep_runs
+        self.run_id = run_id or new_run_id()
+        self.run_dir = self.directory / self.run_id
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Never append to (and overwrite the segments of) another run
+        self.run_dir.mkdir()
+        if compression == "zstd" and zstandard is None:
+            logger.warning("zstandard is not installed - archiving API responses with gzip")
+            compression = "gzip"
+        self.extension = ".jsonl.zst" if compression == "zstd" else ".jsonl.gz"
+        self.segment_records = max(1, segment_records)
+        self.started_at = datetime.now().isoformat()
+        self.records = 0
+        self.segments = []
+        self._segment = None
+        self._segment_count = 0
+        self._lock = threading.Lock()
+
+    def record(self, method: str, endpoint: str, params: Optional[Dict], status_code: Optional[int],
+               body: Optional[Dict]):
+        """Append one response to the current segment."""
+        line = json_codec.dumps({
+            "ts": datetime.now().isoformat(),
+            "method": method,
+            "endpoint": endpoint,
+            "params": params,
+            "status": status_code,
+            "body": body
+        })
+        with self._lock:
+            if self._segment is None or self._segment_count >= self.segment_records:
+                self._roll_segment()
+            self._segment.write(line + "\n")
+            self._segment_count += 1
+            self.records += 1
+
+    def _roll_segment(self):
+        if self._segment is not None:
+            self._segment.close()
+        path = self.run_dir / f"segment-{len(self.segments) + 1:05d}{self.extension}"
+        self._segment = _open_segment(path, "w")
+        self._segment_count = 0
+        self.segments.append(path.name)
+
+    def close(self):
+        """Finish the last segment and add this run to the archive index."""
+        with self._lock:
+            if self._segment is not None:
+                self._segment.close()
+                self._segment = None
+            if not self.records:
+                return
+            with open(self.directory / INDEX_FILE, "a") as index:
+                index.write(json_codec.dumps({
+                    "run_id": self.run_id,
+                    "started_at": self.started_at,
+                    "finished_at": datetime.now().isoformat(),
+                    "records": self.records,
+                    "segments": self.segments
+                }) + "\n")
+            if self.keep_runs > 0:
+                prune_runs(self.directory, self.keep_runs)
+        logger.info(f"Archived {self.records} API responses to {self.run_dir}")
+
+
+def list_runs(directory: str = API_ARCHIVE_DIR) -> List[Dict]:
+    """Archived runs, oldest first."""
+    index_path = Path(directory) / INDEX_FILE
+    if not index_path.exists():
+        return []
+    with open(index_path) as index:
+        return [json_codec.loads(line) for line in index if line.strip()]
+
+
+def prune_runs(directory: str, keep_runs: int) -> int:
+    """Delete all but the newest keep_runs archived runs. Returns the number deleted."""
+    runs = list_runs(directory)
+    if len(runs) <= keep_runs:
+        return 0
+    expired, kept = runs[:-keep_runs], runs[-keep_runs:]
+    index_path = Path(directory) / INDEX_FILE
+    # Rewrite the index first so a half-finished prune never lists a deleted run
+    temp_path = index_path.with_suffix(".tmp")
+    with open(temp_path, "w") as index:
+        for run in kept:
+            index.write(json_codec.dumps(run) + "\n")
+    os.replace(temp_path, index_path)
+    for run in expired:
+        shutil.rmtree(Path(directory) / run["run_id"], ignore_errors=True)
+    logger.info(f"Pruned {len(expired)} archived runs (keeping the newest {keep_runs})")
+    return len(expired)
+
+
+def iter_run_records(run_id: str, directory: str = API_ARCHIVE_DIR) -> Iterator[Dict]:
+    """Every archived response of a run, in the order it was recorded."""
+    run_dir = Path(directory) / run_id
+    if not run_dir.is_dir():
+        raise FileNotFoundError(f"No archived run {run_id} in {directory}")
+    for path in sorted(run_dir.glob("segment-*")):
+        with _open_segment(path, "r") as segment:
+            for line in segment:
+                if line.strip():
+                    yield json_codec.loads(line)
+
+
+class ResponseReplay:
+    """Serves the responses of an archived run in place of the API."""
+
+    def __init__(self, run_id: str, directory: str = API_ARCHIVE_DIR):
+        if run_id == "latest":
+            runs = list_runs(directory)
+            if not runs:
+                raise FileNotFoundError(f"No archived runs in {directory}")
+            run_id = runs[-1]["run_id"]
+        self.run_id = run_id
+        self.responses = defaultdict(deque)
+        # Listing pages can also be matched on page number alone, so a replay
+        # still works after search parameters change
+        self.pages = defaultdict(deque)
+        # Successful /vin decodes by squish VIN (identically configured vehicles)
+        self.squish_decodes = {}
+        self.served = 0
+        self.squish_served = 0
+        self.missing = 0
+        self._lock = threading.Lock()
+
+        count = 0
+        for record in iter_run_records(run_id, directory):
+            response = (record["body"], record["status"])
+            self.responses[request_key(record["endpoint"], record["params"])].append(response)
+            if record["endpoint"] == "/listings" and record["params"]:
+                self.pages[(record["params"].get("page"), record["params"].get("sort_filter"))].append(response)
+            elif record["endpoint"].startswith("/vin/") and record["status"] == 200 and record["body"]:
+                self.squish_decodes.setdefault(squish_vin(record["endpoint"][len("/vin/"):]), record["body"])
+            count += 1
+        logger.info(f"Loaded {count} archived API responses from run {run_id}")
+
+    def response(self, method: str, endpoint: str, params: Optional[Dict]) -> Tuple[Optional[Dict], Optional[int]]:
+        """The recorded (body, status) for a request; (None, None) when it wasn't archived."""
+        with self._lock:
+            queue = self.responses.get(request_key(endpoint, params))
+            if not queue and endpoint == "/listings" and params:
+                queue = self.pages.get((params.get("page"), params.get("sort_filter")))
+            if not queue and endpoint.startswith("/vin/"):
+                vin = endpoint[len("/vin/"):]
+                shared = self.squish_decodes.get(squish_vin(vin))
+                if shared:
+                    self.served += 1
+                    self.squish_served += 1
+                    body = dict(shared)
+                    if "vin" in body:
+                        body["vin"] = vin
+                    return body, 200
+            if not queue:
+                self.missing += 1
+                logger.warning(f"No archived response for {method} {endpoint} {params or ''}")
+                return None, None
+            self.served += 1
+            # Repeated requests get successive recordings; the last one keeps serving
+            return queue.popleft() if len(queue) > 1 else queue[0]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "list":
+        for run in list_runs():
+            print(f"{run['run_id']}  {run['records']:>6} responses  {len(run['segments'])} segments  "
+                  f"(started {run['started_at']})")
+    else:
+        print(__doc__)
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Long-running scheduler for the 4Runner hunter.
+
+Keeps one warm FourRunnerHunter (HTTP session, database connections) and runs
+a search every interval. The interval adapts to how many new listings recent
+runs found - shorter while the market is active, longer while it is quiet - and
+gets random jitter. A lock file keeps scheduled runs, other daemons and the web
+app's /refresh from crawling at the same time. Watched listings are re-checked
+on their own, shorter interval (WATCHED_REFRESH_INTERVAL_MINUTES), and edits to
+the VIN pattern rule file are picked up without a restart.
+
+Usage:
+    python scheduler.py          (or: python main.py --daemon)
+"""
+import logging
+import os
+import random
+import signal
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+import schedule
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from config import (
+    SEARCH_INTERVAL_MINUTES, SCHEDULER_MIN_INTERVAL_MINUTES, SCHEDULER_MAX_INTERVAL_MINUTES,
+    SCHEDULER_JITTER, SCHEDULER_TARGET_NEW_PER_RUN, CRAWL_LOCK_PATH, WATCHED_REFRESH_INTERVAL_MINUTES
+)
+
+logger = logging.getLogger(__name__)
+
+# Weight of the latest run in the new-listing rate average
+RATE_SMOOTHING = 0.3
+
+
+@contextmanager
+def crawl_lock(path: str = CRAWL_LOCK_PATH, shared: bool = False):
+    """
+    Hold the crawl lock for the block; yields False (without waiting) if someone else has it.
+    shared: several shared holders (decode workers) may run together, but never with a crawl.
+    """
+    with open(path, "a+") as lock_file:
+        if not _try_lock(lock_file, shared):
+            yield False
+            return
+        try:
+            if not shared:
+                lock_file.seek(0)
+                lock_file.truncate()
+                lock_file.write(f"{os.getpid()}\n")
+                lock_file.flush()
+            yield True
+        finally:
+            _unlock(lock_file)
+
+
+def _try_lock(lock_file, shared: bool) -> bool:
+    if fcntl:
+        try:
+            fcntl.flock(lock_file, (fcntl.LOCK_SH if shared else fcntl.LOCK_EX) | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        return True
+    # msvcrt has no shared locks, so on Windows shared holders take turns too
+    lock_file.seek(0)
+    try:
+        msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+def _unlock(lock_file):
+    if fcntl:
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+    else:
+        lock_file.seek(0)
+        msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class AdaptiveInterval:
+    """Picks the next crawl interval from a smoothed rate of new listings per hour."""
+
+    def __init__(self, base_minutes: float = SEARCH_INTERVAL_MINUTES,
+                 min_minutes: float = SCHEDULER_MIN_INTERVAL_MINUTES,
+                 max_minutes: float = SCHEDULER_MAX_INTERVAL_MINUTES,
+                 target_new_per_run: float = SCHEDULER_TARGET_NEW_PER_RUN,
+                 jitter: float = SCHEDULER_JITTER):
+        self.min_minutes = min_minutes
+        self.max_minutes = max(min_minutes, max_minutes)
+        self.target_new_per_run = target_new_per_run
+        self.jitter = jitter
+        self.minutes = self._clamp(base_minutes)
+        self.rate_per_hour = None
+
+    def _clamp(self, minutes: float) -> float:
+        return min(self.max_minutes, max(self.min_minutes, minutes))
+
+    def observe(self, new_listings: int, hours_covered: float) -> float:
+        """Record a run's new listings over the time since the previous run; returns the new interval."""
+        if hours_covered > 0:
+            rate = new_listings / hours_covered
+            if self.rate_per_hour is None:
+                self.rate_per_hour = rate
+            else:
+                self.rate_per_hour = RATE_SMOOTHING * rate + (1 - RATE_SMOOTHING) * self.rate_per_hour
+
+        if self.rate_per_hour is None:
+            # Nothing measured yet (first run) - keep the base interval
+            return self.minutes
+        if self.rate_per_hour:
+            # Aim for about target_new_per_run new listings per crawl
+            self.minutes = self._clamp(60 * self.target_new_per_run / self.rate_per_hour)
+        else:
+            self.minutes = self._clamp(self.minutes * 1.5)
+        return self.minutes
+
+    def next_delay_seconds(self) -> float:
+        """The current interval with +/- jitter applied."""
+        return self.minutes * 60 * (1 + random.uniform(-self.jitter, self.jitter))
+
+
+class HunterScheduler:
+    """Runs searches on an adaptive schedule with a single warm hunter."""
+
+    JOB_TAG = "crawl"
+    WATCHED_JOB_TAG = "watched"
+
+    def __init__(self, hunter=None, interval: Optional[AdaptiveInterval] = None,
+                 watched_interval_minutes: float = WATCHED_REFRESH_INTERVAL_MINUTES):
+        if hunter is None:
+            from main import FourRunnerHunter
+            hunter = FourRunnerHunter(warm=True)
+        self.hunter = hunter
+        self.interval = interval or AdaptiveInterval()
+        self.watched_interval_minutes = watched_interval_minutes
+        self.last_run_at = None
+        self.runs = 0
+        self.stopping = False
+
+    def run_search(self) -> Optional[Dict]:
+        """One locked search; reschedules the next one. Returns the run stats (None if skipped)."""
+        stats = None
+        with crawl_lock() as acquired:
+            if not acquired:
+                logger.info("Another search holds the crawl lock - skipping this run")
+            else:
+                started = time.time()
+                try:
+                    stats = self.hunter.search_4runners_vin_focused()
+                except Exception as e:
+                    logger.exception(f"Scheduled search failed: {e}")
+                else:
+                    hours = (started - self.last_run_at) / 3600 if self.last_run_at else 0
+                    self.interval.observe(stats.get("new_listings", 0), hours)
+                    self.last_run_at = started
+                    self.runs += 1
+                    rate = self.interval.rate_per_hour
+                    logger.info(f"Run {self.runs}: {stats.get('new_listings', 0)} new listings in "
+                                f"{time.time() - started:.0f}s - new-listing rate "
+                                f"{'n/a' if rate is None else f'{rate:.2f}/h'}, "
+                                f"next interval {self.interval.minutes:.0f} min")
+
+        self._schedule_next()
+        return stats
+
+    def refresh_watched(self) -> Optional[Dict]:
+        """Re-check watched listings unless a search holds the crawl lock. Returns the refresh stats."""
+        with crawl_lock() as acquired:
+            if not acquired:
+                logger.debug("Search in progress - skipping watched refresh")
+                return None
+            try:
+                return self.hunter.refresh_watched_listings()
+            except Exception as e:
+                logger.exception(f"Watched refresh failed: {e}")
+                return None
+
+    def _schedule_next(self):
+        schedule.clear(self.JOB_TAG)
+        delay = self.interval.next_delay_seconds()
+        schedule.every(max(1, int(delay))).seconds.do(self.run_search).tag(self.JOB_TAG)
+        logger.info(f"Next search in {delay / 60:.1f} minutes")
+
+    def stop(self, *_):
+        logger.info("Stopping scheduler after the current run")
+        self.stopping = True
+
+    def run_forever(self, run_now: bool = True):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        self.hunter.vin_analyzer.watch_patterns()
+
+        if self.watched_interval_minutes > 0:
+            schedule.every(max(1, int(self.watched_interval_minutes * 60))).seconds.do(
+                self.refresh_watched).tag(self.WATCHED_JOB_TAG)
+
+        if run_now:
+            self.run_search()
+        else:
+            self._schedule_next()
+
+        while not self.stopping:
+            schedule.run_pending()
+            idle = schedule.idle_seconds()
+            time.sleep(min(max(idle or 1, 0.1), 5))
+
+        schedule.clear(self.JOB_TAG)
+        schedule.clear(self.WATCHED_JOB_TAG)
+        self.hunter.vin_analyzer.stop_watching_patterns()
+
+
+if __name__ == "__main__":
+    from log_setup import setup_logging
+    setup_logging()
+    HunterScheduler().run_forever()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Benchmark a full crawl against the local auto.dev stand-in (fake_auto_dev.py).
+
+Starts the stand-in on a free port, points the hunter at it with a scratch
+database, runs one VIN-focused search and prints wall time, throughput and
+run stats. Nothing touches the real API, the real database or other repo files.
+
+Usage:
+    python bench_crawl.py [--listings 2000] [--latency-ms 150] [--error-rate 0.02]
+                          [--rate-limit-rate 0.01] [--page-workers 4] [--decode-workers 4]
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append('..')
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.serving import make_server
+
+import fake_auto_dev
+
+
+def start_server(args):
+    """Run the stand-in on a background thread; returns its base URL."""
+    fake_auto_dev.configure(args.listings, args.fixtures, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                            error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate,
+                            retry_after=args.retry_after)
+    server = make_server("127.0.0.1", 0, fake_auto_dev.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark a crawl against the local auto.dev stand-in")
+    parser.add_argument("--listings", type=int, default=2000)
+    parser.add_argument("--fixtures", help="recorded fixture file instead of synthetic data")
+    parser.add_argument("--latency-ms", type=float, default=100.0)
+    parser.add_argument("--jitter-ms", type=float, default=30.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--page-workers", type=int, default=4)
+    parser.add_argument("--decode-workers", type=int, default=4)
+    parser.add_argument("--rate-limit", type=int, default=100000, help="client-side requests per minute")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)  # per-request access log
+
+    scratch = tempfile.mkdtemp(prefix="4runner_bench_")
+    # config reads the environment at import time, so set it before importing the hunter
+    os.environ.update({
+        "API_BASE_URL": start_server(args),
+        "DATABASE_PATH": os.path.join(scratch, "bench.db"),
+        "API_ARCHIVE_DIR": os.path.join(scratch, "api_archive"),
+        "CRAWL_LOCK_PATH": os.path.join(scratch, ".crawl.lock"),
+        "API_RATE_LIMIT_STATE_PATH": "",
+        "API_RATE_LIMIT_REQUESTS": str(args.rate_limit),
+        "API_RETRY_DELAY_SECONDS": "0",
+        "VIN_OFFLINE_DB_PATH": "",
+        "PAGE_FETCH_WORKERS": str(args.page_workers),
+        "VIN_DECODE_WORKERS": str(args.decode_workers),
+    })
+    from main import FourRunnerHunter
+
+    hunter = FourRunnerHunter()
+    started = time.monotonic()
+    stats = hunter.search_4runners_vin_focused()
+    elapsed = time.monotonic() - started
+
+    print("=" * 60)
+    print(f"Listings:        {stats['total_listings']} in {elapsed:.2f}s "
+          f"({stats['total_listings'] / elapsed:.1f} listings/s)")
+    print(f"API calls:       {hunter.api_client.get_api_calls_count()}")
+    print(f"Server requests: {fake_auto_dev.stats}")
+    print(f"Manual finds:    {stats['new_manual_finds']} (first gen: {stats['new_first_gen_finds']})")
+    print(f"Calls saved:     {stats['api_calls_saved']}")
+    print(f"Scratch DB:      {os.environ['DATABASE_PATH']}")
+
+
+if __name__ == "__main__":
+    main()
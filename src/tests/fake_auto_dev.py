@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the auto.dev API, for offline crawl benchmarks.
+
+Serves /listings (paginated, year/VIN-filtered), /listings/<id> and /vin/<vin> from synthetic
+fixtures or a recorded fixture file, and can inject latency, 429s with
+Retry-After and 5xx errors. Point the hunter at it with
+API_BASE_URL=http://127.0.0.1:8099
+
+Usage:
+    python fake_auto_dev.py [--port 8099] [--listings 2000] [--fixtures recorded.json]
+                            [--latency-ms 150] [--jitter-ms 50]
+                            [--error-rate 0.02] [--rate-limit-rate 0.01] [--retry-after 2]
+
+Fault settings can also be read and changed at runtime via GET/POST /_faults,
+and request counters are available at /_stats.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from flask import Flask, jsonify, request
+
+app = Flask(__name__)
+
+# Synthetic models: (positions 4-8, first year, last year, share of manuals, engine)
+SYNTHETIC_MODELS = [
+    ("RN60W", 1984, 1989, 0.7, {"cylinder": 4, "size": 2.4, "configuration": "I"}),
+    ("VN62W", 1988, 1989, 0.5, {"cylinder": 6, "size": 3.0, "configuration": "V"}),
+    ("VN39W", 1990, 1995, 0.8, {"cylinder": 6, "size": 3.0, "configuration": "V"}),
+    ("RN37W", 1990, 1995, 0.8, {"cylinder": 4, "size": 2.4, "configuration": "I"}),
+    ("VZN13", 1990, 1995, 0.4, {"cylinder": 6, "size": 3.0, "configuration": "V"}),
+    ("HN87R", 1996, 2002, 0.0, {"cylinder": 6, "size": 3.4, "configuration": "V"}),
+    ("GN86R", 1996, 2002, 0.0, {"cylinder": 6, "size": 3.4, "configuration": "V"}),
+    ("VZN18", 1996, 2002, 0.3, {"cylinder": 6, "size": 3.4, "configuration": "V"}),
+    ("RZN18", 1996, 2002, 0.4, {"cylinder": 4, "size": 2.7, "configuration": "I"}),
+    ("BU17R", 2003, 2009, 0.0, {"cylinder": 8, "size": 4.7, "configuration": "V"}),
+]
+
+YEAR_CODES = "ABCDEFGHJKLMNPRSTVWXY123456789"  # position 10, from 1980
+TRANSLITERATION = dict(zip("ABCDEFGHJKLMNPRSTUVWXYZ", [1, 2, 3, 4, 5, 6, 7, 8, 1, 2, 3, 4, 5, 7, 9, 2, 3, 4, 5, 6, 7, 8, 9]))
+WEIGHTS = [8, 7, 6, 5, 4, 3, 2, 10, 0, 9, 8, 7, 6, 5, 4, 3, 2]
+CITIES = [("Denver", "CO"), ("Boise", "ID"), ("Bozeman", "MT"), ("Portland", "OR"), ("Austin", "TX")]
+COLORS = ["White", "Black", "Red", "Blue", "Green", "Silver"]
+
+faults = {
+    "latency_ms": 0.0,
+    "jitter_ms": 0.0,
+    "error_rate": 0.0,        # share of requests answered with a 5xx
+    "rate_limit_rate": 0.0,   # share of requests answered with a 429
+    "retry_after": 1,         # Retry-After seconds sent with 429s
+}
+stats = {"listings": 0, "listing": 0, "vin": 0, "429": 0, "5xx": 0}
+fixtures = {"listings": [], "vins": {}}
+_lock = threading.Lock()
+_random = random.Random(0)
+
+
+def with_check_digit(vin: str) -> str:
+    """Replace position 9 with the correct check digit."""
+    total = sum((int(c) if c.isdigit() else TRANSLITERATION[c]) * w for c, w in zip(vin, WEIGHTS))
+    check = total % 11
+    return vin[:8] + ("X" if check == 10 else str(check)) + vin[9:]
+
+
+def synthetic_fixtures(count: int, seed: int = 1) -> Dict:
+    """Deterministic listings and matching VIN decodes."""
+    rng = random.Random(seed)
+    listings = []
+    vins = {}
+    created = datetime(2025, 1, 1)
+    for serial in range(count):
+        code, first_year, last_year, manual_share, engine = rng.choice(SYNTHETIC_MODELS)
+        year = rng.randint(first_year, last_year)
+        vin = with_check_digit(f"JT3{code}0{YEAR_CODES[(year - 1980) % 30]}0{serial:06d}")
+        city, state = rng.choice(CITIES)
+        listings.append({
+            "id": serial + 1,
+            "vin": vin,
+            "year": year,
+            "make": "Toyota",
+            "model": "4Runner",
+            "price": f"${rng.randint(3, 40) * 500:,}",
+            "mileage": f"{rng.randint(40, 350) * 1000:,} Miles",
+            "city": city,
+            "state": state,
+            "dealerName": f"{city} Motors",
+            "displayColor": rng.choice(COLORS),
+            "createdAt": (created + timedelta(minutes=serial)).isoformat(),
+        })
+        manual = rng.random() < manual_share
+        vins[vin] = {
+            "vin": vin,
+            "make": {"name": "Toyota"},
+            "model": {"name": "4Runner"},
+            "years": [{"year": year}],
+            "engine": dict(engine, fuelType="gasoline"),
+            "transmission": {
+                "transmissionType": "MANUAL" if manual else "AUTOMATIC",
+                "numberOfSpeeds": "5" if manual else "4"
+            },
+        }
+    return {"listings": listings, "vins": vins}
+
+
+def load_fixtures(path: str) -> Dict:
+    """Recorded fixtures: {"listings": [...], "vins": {vin: decode}}."""
+    with open(path) as f:
+        data = json.load(f)
+    return {"listings": data.get("listings", []), "vins": data.get("vins", {})}
+
+
+def injected_fault():
+    """Sleep for the configured latency, then maybe return a 429 or 5xx response."""
+    with _lock:
+        latency = max(0.0, faults["latency_ms"] + _random.uniform(-1, 1) * faults["jitter_ms"])
+        roll = _random.random()
+    if latency:
+        time.sleep(latency / 1000)
+
+    if roll < faults["rate_limit_rate"]:
+        with _lock:
+            stats["429"] += 1
+        response = jsonify({"error": "Too Many Requests"})
+        response.status_code = 429
+        response.headers["Retry-After"] = str(faults["retry_after"])
+        return response
+    if roll < faults["rate_limit_rate"] + faults["error_rate"]:
+        with _lock:
+            stats["5xx"] += 1
+        response = jsonify({"error": "Service Unavailable"})
+        response.status_code = 503
+        return response
+    return None
+
+
+def filter_listings(args) -> List[Dict]:
+    listings = fixtures["listings"]
+    year_min = args.get("year_min", type=int)
+    year_max = args.get("year_max", type=int)
+    if year_min:
+        listings = [listing for listing in listings if listing.get("year", 0) >= year_min]
+    if year_max:
+        listings = [listing for listing in listings if listing.get("year", 0) <= year_max]
+    if args.get("vin"):
+        listings = [listing for listing in listings if listing.get("vin") == args["vin"].upper()]
+    if args.get("sort_filter", "").endswith(":desc"):
+        listings = sorted(listings, key=lambda listing: listing.get("createdAt", ""), reverse=True)
+    return listings
+
+
+@app.route("/listings")
+def listings():
+    fault = injected_fault()
+    if fault:
+        return fault
+    with _lock:
+        stats["listings"] += 1
+
+    page = request.args.get("page", 1, type=int)
+    per_page = request.args.get("per_page", 20, type=int)
+    matching = filter_listings(request.args)
+    start = (page - 1) * per_page
+    return jsonify({"totalCount": len(matching), "records": matching[start:start + per_page]})
+
+
+@app.route("/listings/<int:listing_id>")
+def listing(listing_id):
+    fault = injected_fault()
+    if fault:
+        return fault
+    with _lock:
+        stats["listing"] += 1
+
+    record = next((listing for listing in fixtures["listings"] if listing.get("id") == listing_id), None)
+    if not record:
+        return jsonify({"error": f"Listing {listing_id} not found"}), 404
+    return jsonify(record)
+
+
+@app.route("/vin/<vin>")
+def decode_vin(vin):
+    fault = injected_fault()
+    if fault:
+        return fault
+    with _lock:
+        stats["vin"] += 1
+
+    decode = fixtures["vins"].get(vin.upper())
+    if not decode:
+        return jsonify({"error": f"VIN {vin} not found"}), 404
+    return jsonify(decode)
+
+
+@app.route("/_faults", methods=["GET", "POST"])
+def fault_settings():
+    if request.method == "POST":
+        with _lock:
+            for key, value in (request.get_json(silent=True) or {}).items():
+                if key in faults:
+                    faults[key] = type(faults[key])(value)
+    return jsonify(faults)
+
+
+@app.route("/_stats")
+def request_stats():
+    return jsonify(dict(stats, listings_available=len(fixtures["listings"])))
+
+
+def configure(listing_count: int = 2000, fixtures_path: str = None, seed: int = 1, **fault_settings):
+    """Load fixtures and set fault injection (keys of `faults`)."""
+    fixtures.update(load_fixtures(fixtures_path) if fixtures_path else synthetic_fixtures(listing_count, seed))
+    _random.seed(seed)
+    for key, value in fault_settings.items():
+        if key in faults and value is not None:
+            faults[key] = type(faults[key])(value)
+    for key in stats:
+        stats[key] = 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the auto.dev API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--listings", type=int, default=2000, help="number of synthetic listings")
+    parser.add_argument("--fixtures", help="recorded fixture file instead of synthetic data")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=int, default=1)
+    args = parser.parse_args()
+
+    configure(args.listings, args.fixtures, args.seed, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+              error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after)
+    print(f"Serving {len(fixtures['listings'])} listings at http://{args.host}:{args.port}")
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
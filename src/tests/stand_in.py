@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Helpers for tests against the local auto.dev stand-in (fake_auto_dev.py).
+
+start() serves the stand-in on a free port in this process and points the API
+client at it; new_client() / new_hunter() build clients without the shared,
+rate-limited bucket and hunters on a scratch database, so nothing touches the
+real API, database or rate limit state.
+"""
+import logging
+import os
+import sys
+import tempfile
+import threading
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.serving import make_server
+
+import api_client
+import fake_auto_dev
+from api_client import AutoDevAPI, RateLimiter
+from database import Database
+
+# No shared rate limit state file next to the real one
+api_client.API_RATE_LIMIT_STATE_PATH = ""
+NO_FAULTS = {"latency_ms": 0, "jitter_ms": 0, "error_rate": 0, "rate_limit_rate": 0, "retry_after": 1}
+_server = None
+
+
+def start(listings: int = 200, **fault_settings) -> str:
+    """(Re)configure the stand-in and make sure it is serving; returns its base URL."""
+    global _server
+    fake_auto_dev.configure(listings, **{**NO_FAULTS, **fault_settings})
+    if _server is None:
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)  # per-request access log
+        _server = make_server("127.0.0.1", 0, fake_auto_dev.app, threaded=True)
+        threading.Thread(target=_server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{_server.server_port}"
+    api_client.API_BASE_URL = base_url
+    api_client.API_RETRY_DELAY_SECONDS = 0
+    return base_url
+
+
+def scratch_database() -> Database:
+    return Database(os.path.join(tempfile.mkdtemp(prefix="4runner_test_"), "test.db"))
+
+
+def new_client(cache=None, replay=None) -> AutoDevAPI:
+    client = AutoDevAPI(cache=cache, replay=replay)
+    client.rate_limiter = RateLimiter(100000, 60)
+    return client
+
+
+def new_hunter(database: Database = None, replay=None):
+    from main import FourRunnerHunter
+    hunter = FourRunnerHunter(database=database or scratch_database())
+    hunter.api_client = new_client(cache=hunter.database, replay=replay)
+    return hunter
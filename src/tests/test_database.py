@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""Test listing writes: bulk upserts (new vs updated VINs, duplicates, batching), known-listing refreshes and content hashes"""
+import json
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json_codec
+from database import Database, listing_content_hash
+
+
+def new_database():
+    return Database(os.path.join(tempfile.mkdtemp(prefix="4runner_test_"), "test.db"))
+
+
+def listing(vin, price):
+    return {"vin": vin, "year": 1998, "price": price, "raw_listing_data": {"vin": vin, "price": price}}
+
+
+def test_new_and_updated():
+    database = new_database()
+    first = database.bulk_upsert_listings([listing("VIN_A", 5000), listing("VIN_B", 6000)])
+    print(f"First upsert: {first}")
+    assert first == {"new": ["VIN_A", "VIN_B"], "updated": []}
+
+    # A VIN twice in one batch is reported once; its last occurrence is stored
+    second = database.bulk_upsert_listings([listing("VIN_B", 6500), listing("VIN_C", 7000), listing("VIN_C", 7100)])
+    print(f"Second upsert: {second}")
+    assert second == {"new": ["VIN_C"], "updated": ["VIN_B"]}
+    prices = {vin: price for vin, (price, _) in database.get_listing_snapshots().items()}
+    assert prices == {"VIN_A": 5000, "VIN_B": 6500, "VIN_C": 7100}
+
+    assert database.upsert_listing(listing("VIN_D", 8000)) is True
+    assert database.upsert_listing(listing("VIN_D", 8100)) is False
+
+
+def test_batches():
+    database = new_database()
+    database.upsert_listing(listing("VIN_004", 4000))
+    result = database.bulk_upsert_listings((listing(f"VIN_{i:03d}", 1000 + i) for i in range(7)), batch_size=3)
+    print(f"Across 3 batches: {len(result['new'])} new, updated {result['updated']}")
+    assert result["new"] == ["VIN_000", "VIN_001", "VIN_002", "VIN_003", "VIN_005", "VIN_006"]
+    assert result["updated"] == ["VIN_004"]
+    assert database.count_listings() == 7
+
+
+def refreshed(vin, price, mileage, raw_price=None):
+    """A known listing as process_listings hands it to refresh_listings"""
+    return {"vin": vin, "price": price, "mileage": mileage,
+            "raw_listing_data": {"vin": vin, "price": raw_price if raw_price is not None else price}}
+
+
+def stored_prices(database, vin):
+    with database.get_connection() as conn:
+        return tuple(conn.execute("SELECT price, previous_price, mileage FROM listings WHERE vin = ?", (vin,)).fetchone())
+
+
+def test_refresh_listings():
+    database = new_database()
+    database.upsert_listing(dict(listing("VIN_A", 5000), mileage=150000))
+
+    # Same content within LAST_SEEN_TOUCH_HOURS: nothing is written
+    assert database.refresh_listings([refreshed("VIN_A", 5000, 150000)]) == 0
+    assert stored_prices(database, "VIN_A") == (5000, None, 150000)
+
+    assert database.refresh_listings([refreshed("VIN_A", 4500, 151000)]) == 1
+    print(f"After a price drop: (price, previous_price, mileage) = {stored_prices(database, 'VIN_A')}")
+    assert stored_prices(database, "VIN_A") == (4500, 5000, 151000)
+
+    # A missing or unparseable price/mileage (parsed to 0) keeps the stored values
+    assert database.refresh_listings([refreshed("VIN_A", 0, 0, raw_price="Call for price")]) == 1
+    print(f"After 'Call for price': {stored_prices(database, 'VIN_A')}")
+    assert stored_prices(database, "VIN_A") == (4500, 5000, 151000)
+
+
+def test_content_hash_ignores_codec_backend():
+    raw = {"vin": "VIN_A", "price": "$5,000", "lat": 45.6769, "dealerName": "Café Motors", "photos": ["a", "b"]}
+    expected = listing_content_hash(raw)
+    assert listing_content_hash(dict(reversed(list(raw.items())), vin_analysis={"confidence": 90})) == expected
+
+    backend_dumps = json_codec.dumps
+    try:
+        for backend, available in json_codec.available_backends().items():
+            if available:
+                json_codec.dumps = json_codec.make_codec(backend)[0]
+                assert listing_content_hash(raw) == expected, backend
+        # A backend with its own whitespace and escaping
+        json_codec.dumps = lambda obj, sort_keys=False: json.dumps(obj, sort_keys=sort_keys, indent=1)
+        assert listing_content_hash(raw) == expected
+    finally:
+        json_codec.dumps = backend_dumps
+    print(f"Content hash {expected[:12]}... under every available json_codec backend")
+
+
+if __name__ == "__main__":
+    test_new_and_updated()
+    test_batches()
+    test_refresh_listings()
+    test_content_hash_ignores_codec_backend()
+    print("\nAll database checks passed")
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""Test the durable decode queue: priorities, leases, lease expiry and retries"""
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+
+
+def new_queue():
+    database = Database(os.path.join(tempfile.mkdtemp(prefix="4runner_test_"), "test.db"))
+    queued = database.enqueue_decode_tasks([
+        {"vin": "VIN_AUTOMATIC", "payload": {"n": 1}, "priority": 90},
+        {"vin": "VIN_MANUAL", "payload": {"n": 2}, "priority": 10},
+        {"vin": "VIN_UNKNOWN", "payload": {"n": 3}, "priority": 30},
+        {"vin": "VIN_MANUAL", "payload": {"n": 4}, "priority": 10},  # already queued
+    ])
+    assert queued == 3
+    return database
+
+
+def test_priority_and_leases():
+    database = new_queue()
+
+    first = database.lease_decode_tasks("worker-1", limit=2, lease_seconds=300)
+    print(f"worker-1 leased: {[(task['vin'], task['attempts']) for task in first]}")
+    assert [task["vin"] for task in first] == ["VIN_MANUAL", "VIN_UNKNOWN"]
+    assert first[0]["payload"] == {"n": 2} and first[0]["attempts"] == 1
+
+    # Live leases are not handed out again; max_priority keeps low-value work queued
+    assert database.lease_decode_tasks("worker-2", limit=10, lease_seconds=300, max_priority=89) == []
+    second = database.lease_decode_tasks("worker-2", limit=10, lease_seconds=300)
+    assert [task["vin"] for task in second] == ["VIN_AUTOMATIC"]
+
+    database.complete_decode_tasks([task["id"] for task in first + second])
+    assert database.count_decode_tasks() == {}
+
+
+def test_expired_lease_is_reclaimed():
+    database = new_queue()
+    crashed = database.lease_decode_tasks("crashed-worker", limit=1, lease_seconds=-1)
+    reclaimed = database.lease_decode_tasks("worker-2", limit=1, lease_seconds=300)
+    print(f"Expired lease on {crashed[0]['vin']} reclaimed with attempts={reclaimed[0]['attempts']}")
+    assert reclaimed[0]["id"] == crashed[0]["id"] and reclaimed[0]["attempts"] == 2
+    assert database.count_decode_tasks() == {"leased": 1, "pending": 2}
+
+
+def test_retry_waits_for_its_delay():
+    database = new_queue()
+    task = database.lease_decode_tasks("worker-1", limit=1, lease_seconds=300)[0]
+
+    database.retry_decode_task(task["id"], "VIN decode failed", retry_delay_seconds=3600)
+    later = database.lease_decode_tasks("worker-1", limit=10, lease_seconds=300)
+    assert task["vin"] not in [leased["vin"] for leased in later]
+
+    database.complete_decode_tasks([leased["id"] for leased in later])
+    database.retry_decode_task(task["id"], "VIN decode failed", retry_delay_seconds=-1)
+    retried = database.lease_decode_tasks("worker-1", limit=10, lease_seconds=300)
+    print(f"Retried {retried[0]['vin']}: attempts={retried[0]['attempts']}")
+    assert [leased["vin"] for leased in retried] == [task["vin"]] and retried[0]["attempts"] == 2
+
+
+if __name__ == "__main__":
+    test_priority_and_leases()
+    test_expired_lease_is_reclaimed()
+    test_retry_waits_for_its_delay()
+    print("\nAll decode queue checks passed")
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""Test listing pagination against the local stand-in: parallel pages, stopping early, incremental and sharded crawls"""
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import stand_in
+import api_client
+import fake_auto_dev
+from config import TARGET_YEARS
+from crawl_planner import plan_shards
+
+
+def target_vins():
+    return {listing["vin"] for listing in fake_auto_dev.fixtures["listings"]
+            if TARGET_YEARS["min"] <= listing["year"] <= TARGET_YEARS["max"]}
+
+
+def test_parallel_pages_cover_every_listing():
+    stand_in.start(listings=300, latency_ms=20, jitter_ms=15)
+    vins = [listing["vin"] for listing in stand_in.new_client().get_all_4runner_listings(parallel=True)]
+    print(f"Parallel crawl: {len(vins)} listings in {fake_auto_dev.stats['listings']} page requests")
+    assert len(vins) == len(set(vins)) and set(vins) == target_vins()
+
+
+def test_early_stop_cancels_pending_pages():
+    stand_in.start(listings=1000, latency_ms=100)
+    total_pages = (len(target_vins()) + api_client.LISTINGS_PER_PAGE - 1) // api_client.LISTINGS_PER_PAGE
+    workers = api_client.PAGE_FETCH_WORKERS
+    api_client.PAGE_FETCH_WORKERS = 2
+    try:
+        pages = stand_in.new_client().iter_4runner_listing_pages(parallel=True)
+        next(pages)
+        next(pages)
+        pages.close()  # the consumer has seen enough
+    finally:
+        api_client.PAGE_FETCH_WORKERS = workers
+
+    time.sleep(0.5)  # let fetches already in flight finish
+    fetched = fake_auto_dev.stats["listings"]
+    time.sleep(0.5)
+    print(f"Stopped after 2 of {total_pages} pages: {fetched} pages fetched")
+    # Page 1, and per worker the page it finished plus the one it had started; nothing after that
+    assert fetched <= 1 + 2 * 2 < total_pages
+    assert fake_auto_dev.stats["listings"] == fetched
+
+
+def test_incremental_stops_after_known_pages():
+    stand_in.start(listings=1000)
+    newest_first = sorted((listing for listing in fake_auto_dev.fixtures["listings"] if listing["vin"] in target_vins()),
+                          key=lambda listing: listing["createdAt"], reverse=True)
+    new_vins = {listing["vin"] for listing in newest_first[:30]}  # page 1 and half of page 2
+    client = stand_in.new_client()
+
+    listings, state = client.get_new_4runner_listings(lambda listing: listing["vin"] not in new_vins,
+                                                      stop_after_known_pages=2)
+    print(f"Incremental crawl: {len(listings)} listings from {fake_auto_dev.stats['listings']} pages")
+    # Page 2 still has new listings, so pages 3 and 4 are the two known pages in a row
+    assert fake_auto_dev.stats["listings"] == 4
+    assert [listing["vin"] for listing in listings] == [listing["vin"] for listing in newest_first[:80]]
+
+    # Same first page as last time: nothing past page 1 is fetched
+    listings, state = client.get_new_4runner_listings(lambda listing: False, previous_state=state)
+    assert state["unchanged"] and listings == [] and fake_auto_dev.stats["listings"] == 5
+
+
+def test_shards_cover_every_listing_once():
+    shards = plan_shards(shard_by="year", years_per_shard=3)
+    years = [year for shard in shards for year in range(shard["year_min"], shard["year_max"] + 1)]
+    assert years == list(range(TARGET_YEARS["min"], TARGET_YEARS["max"] + 1))
+
+    stand_in.start(listings=600, latency_ms=10, jitter_ms=10)
+    # The stand-in ignores zip, so every origin returns the same listings - all overlap
+    shards = plan_shards(shard_by="year,zip", years_per_shard=3, origin_zips=["80202", "83702"])
+    pages = list(stand_in.new_client().iter_4runner_listing_pages(shards=shards))
+    vins = [listing["vin"] for listings in pages for listing in listings]
+    print(f"Sharded crawl: {len(shards)} shards, {fake_auto_dev.stats['listings']} page requests, {len(vins)} listings")
+    assert len(vins) == len(set(vins)) and set(vins) == target_vins()
+
+
+if __name__ == "__main__":
+    test_parallel_pages_cover_every_listing()
+    test_early_stop_cancels_pending_pages()
+    test_incremental_stops_after_known_pages()
+    test_shards_cover_every_listing_once()
+    print("\nAll listing page checks passed")
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""Test learned VIN pattern confidences: counting decode outcomes and overriding rules"""
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+from vin_analyzer import Toyota4RunnerVINAnalyzer, vin_check_digit
+from vin_patterns import learn_patterns
+
+
+def make_vin(model_code, year_code, serial, plant="0"):
+    """A check-digit-valid 4Runner VIN"""
+    vin = f"JT3{model_code}0{year_code}{plant}{serial}"
+    return vin[:8] + vin_check_digit(vin) + vin[9:]
+
+
+def decoded_listing(vin, model_code, year, api_transmission_type, decode_source="api"):
+    return {
+        "vin": vin, "year": year, "model_code": model_code,
+        "api_transmission_type": api_transmission_type, "decode_source": decode_source,
+    }
+
+
+def test_observations_count_squish_vins_once():
+    database = Database(os.path.join(tempfile.mkdtemp(prefix="4runner_test_"), "test.db"))
+
+    # One real decode shared by 30 identically configured VINs (same squish VIN)
+    shared = [make_vin("VZN18", "W", f"{serial:06d}") for serial in range(30)]
+    # 3 more squish VINs (other plant codes), one of them decoded offline
+    others = [make_vin("VZN18", "W", "000100", plant=plant) for plant in "123"]
+    listings = [decoded_listing(vin, "VZN18", 1998, "MANUAL") for vin in shared + others[:2]]
+    listings.append(decoded_listing(others[2], "VZN18", 1998, "AUTOMATIC", decode_source="offline"))
+    database.bulk_upsert_listings(listings)
+
+    observations = database.refresh_pattern_observations()
+    print(f"Observations: {observations}")
+    assert observations == [{"model_code": "VZN18", "year": 1998, "manual_count": 3, "automatic_count": 0}]
+    assert database.get_pattern_observations() == observations
+
+
+def test_learned_verdict_overrides_rule_unless_pinned():
+    analyzer = Toyota4RunnerVINAnalyzer()
+    rz_vin = make_vin("RZN18", "W", "012345")
+    hn_vin = make_vin("HN86R", "W", "012345")
+
+    before = analyzer.classify_vin(rz_vin)
+    print(f"Rule verdict for {rz_vin}: manual={before.is_manual} confidence={before.confidence}")
+    assert before.is_manual and before.confidence == 85
+
+    observations = [
+        {"model_code": "RZN18", "year": 1998, "manual_count": 0, "automatic_count": 60},
+        {"model_code": "HN86R", "year": 1998, "manual_count": 60, "automatic_count": 0},
+    ]
+    analyzer.apply_learned_patterns(learn_patterns(observations, min_observations=20, skip_decode_after=50))
+
+    learned = analyzer.classify_vin(rz_vin)
+    print(f"Learned verdict for {rz_vin}: {learned.reason} (skip decode: {learned.skip_decode})")
+    assert not learned.is_manual and learned.confidence > 90 and learned.skip_decode
+
+    # HN86R has "learn": false - the API decodes it wrongly, so the rule stays
+    pinned = analyzer.classify_vin(hn_vin)
+    print(f"Pinned verdict for {hn_vin}: {pinned.reason}")
+    assert not pinned.is_manual and pinned.confidence == 95 and not pinned.skip_decode
+
+
+if __name__ == "__main__":
+    test_observations_count_squish_vins_once()
+    test_learned_verdict_overrides_rule_unless_pinned()
+    print("\nAll pattern learning checks passed")
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""Test the token-bucket rate limiter: shared budget and server feedback (Retry-After, RateLimit headers)"""
+import os
+import sys
+import tempfile
+import time
+from email.utils import formatdate
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api_client import RateLimiter
+
+
+def take(limiter):
+    """Try to take a token without sleeping; returns the seconds the caller would have to wait."""
+    return limiter._update(limiter._take_token)
+
+
+def test_token_bucket():
+    limiter = RateLimiter(5, 60)
+    waits = [take(limiter) for _ in range(6)]
+    print(f"Waits for 6 requests at 5/min: {[round(wait, 1) for wait in waits]}")
+    assert waits[:5] == [0] * 5
+    assert 11 < waits[5] <= 12  # one token refills every 12s
+
+
+def test_shared_bucket():
+    path = os.path.join(tempfile.mkdtemp(prefix="4runner_test_"), "rate_limit_state.db")
+    first, second = RateLimiter(5, 60, shared_state_path=path), RateLimiter(5, 60, shared_state_path=path)
+    for _ in range(3):
+        assert take(first) == 0
+    waits = [take(second) for _ in range(3)]
+    print(f"Second process after the first took 3 of 5: {[round(wait, 1) for wait in waits]}")
+    assert waits[:2] == [0, 0] and waits[2] > 0
+
+    # A Retry-After seen by one process pauses the other too
+    assert second.update_from_response(429, {"Retry-After": "30"}) == 30
+    wait = take(first)
+    print(f"Wait in the first process after a 429 with Retry-After: 30 -> {wait:.1f}s")
+    assert 29 < wait <= 30
+
+
+def test_server_feedback():
+    limiter = RateLimiter(100, 60)
+    retry_at = formatdate(time.time() + 45, usegmt=True)
+    pause = limiter.update_from_response(429, {"Retry-After": retry_at})
+    print(f"Retry-After as HTTP date: paused {pause:.1f}s")
+    assert 43 < pause <= 45
+
+    # 429 without Retry-After falls back to the reset header
+    limiter = RateLimiter(100, 60)
+    assert limiter.update_from_response(429, {"X-RateLimit-Reset": "20"}) == 20
+
+    # Remaining caps the local bucket; none left means waiting for the reset
+    limiter = RateLimiter(100, 60)
+    assert limiter.update_from_response(200, {"X-RateLimit-Remaining": "2"}) is None
+    assert [take(limiter) for _ in range(2)] == [0, 0] and take(limiter) > 0
+    limiter = RateLimiter(100, 60)
+    assert limiter.update_from_response(200, {"RateLimit-Remaining": "0", "RateLimit-Reset": "15"}) == 15
+    print("RateLimit-Remaining/Reset handled")
+
+
+if __name__ == "__main__":
+    test_token_bucket()
+    test_shared_bucket()
+    test_server_feedback()
+    print("\nAll rate limiter checks passed")
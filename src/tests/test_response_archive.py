@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""Test recording a crawl's API responses and replaying them into a fresh database"""
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import stand_in
+from response_archive import ResponseArchive, ResponseReplay, list_runs
+
+
+def stored_listings(database):
+    with database.get_connection() as conn:
+        return {row[0]: (row[1], row[2]) for row in conn.execute("SELECT vin, is_manual, manual_source FROM listings")}
+
+
+def decode_state(database):
+    with database.get_connection() as conn:
+        failures = conn.execute("SELECT COUNT(*) FROM vin_decode_cache WHERE status != 'hit'").fetchone()[0]
+        queued = conn.execute("SELECT COUNT(*) FROM decode_tasks").fetchone()[0]
+    return failures, queued
+
+
+def record_run(directory):
+    stand_in.start(listings=150)
+    hunter = stand_in.new_hunter()
+    archive = hunter.api_client.archive = ResponseArchive(directory)
+    hunter.search_4runners_vin_focused()
+    hunter.api_client.archive = None
+    archive.close()
+    return hunter.database, archive.run_id
+
+
+def test_round_trip():
+    directory = tempfile.mkdtemp(prefix="4runner_archive_")
+    live_database, run_id = record_run(directory)
+    assert [run["run_id"] for run in list_runs(directory)] == [run_id]
+
+    replay = ResponseReplay("latest", directory)
+    hunter = stand_in.new_hunter(replay=replay)
+    hunter.search_4runners_vin_focused()
+    print(f"Replayed {replay.served} responses ({replay.squish_served} decodes by squish VIN), "
+          f"{replay.missing} missing")
+
+    # Live decodes served by the cache or a squish share were never archived
+    assert replay.squish_served > 0 and replay.missing == 0
+    assert stored_listings(hunter.database) == stored_listings(live_database)
+    assert decode_state(hunter.database) == (0, 0)
+
+
+def test_replay_miss_is_not_cached_or_retried():
+    directory = tempfile.mkdtemp(prefix="4runner_archive_")
+    _, run_id = record_run(directory)
+
+    replay = ResponseReplay(run_id, directory)
+    for key in [key for key in replay.responses if key.startswith("/vin/")]:
+        del replay.responses[key]
+    replay.squish_decodes.clear()
+    hunter = stand_in.new_hunter(replay=replay)
+    stats = hunter.search_4runners_vin_focused()
+    print(f"Replay without decodes: {replay.missing} missing, {stats['new_listings']} listings stored")
+    assert replay.missing > 0
+    assert decode_state(hunter.database) == (0, 0)
+
+
+if __name__ == "__main__":
+    test_round_trip()
+    test_replay_miss_is_not_cached_or_retried()
+    print("\nAll response archive checks passed")
@@ -1,8 +1,9 @@
 #!/usr/bin/env python3
 """Test the VIN analyzer with some sample VINs"""
+import os
 import sys
-sys.path.append('..')
-from vin_analyzer import VINAnalyzer
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from vin_analyzer import Toyota4RunnerVINAnalyzer as VINAnalyzer, has_valid_check_digit
 
 def test_vin_analyzer():
     analyzer = VINAnalyzer()
@@ -24,5 +25,25 @@ def test_vin_analyzer():
         print(f"  Year: {analysis['year']}")
         print(f"  Transmission: {analysis['transmission_type']}")
 
+def test_check_digit():
+    analyzer = VINAnalyzer()
+
+    valid_vin = "JT3LN1303L0012345"       # 1990 LN130, check digit 3
+    transposed_vin = "JT3LN1303L0012354"  # last two serial digits swapped
+
+    print(f"\nTesting check digit: {valid_vin} / {transposed_vin}")
+    assert has_valid_check_digit(valid_vin)
+    assert not has_valid_check_digit(transposed_vin)
+
+    analysis = analyzer.analyze_manual_probability(transposed_vin)
+    print(f"  Transposed VIN: {analysis['reason']}")
+    assert analysis["confidence"] == 0 and not analysis["is_manual_candidate"]
+
+    results = analyzer.batch_analyze_vins([{"vin": valid_vin}, {"vin": transposed_vin}])
+    print(f"  Summary: {results['summary']}")
+    assert [listing["vin"] for listing in results["invalid_vins"]] == [transposed_vin]
+    assert [listing["vin"] for listing in results["manual_candidates"]] == [valid_vin]
+
 if __name__ == "__main__":
     test_vin_analyzer()
+    test_check_digit()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""Test parallel VIN decoding against the local stand-in: input order, failure isolation, the decode cache and squish VIN sharing"""
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import stand_in
+import api_client
+import fake_auto_dev
+from database import squish_vin
+
+
+def listed_vins(count):
+    return [listing["vin"] for listing in fake_auto_dev.fixtures["listings"][:count]]
+
+
+def test_order_and_failure_isolation():
+    stand_in.start(listings=40, latency_ms=20, jitter_ms=15, error_rate=0.5)
+    database = stand_in.scratch_database()
+    client = stand_in.new_client(cache=database)
+    unknown = fake_auto_dev.with_check_digit("JT3VZN180W0999999")  # well-formed, but the API has no decode
+    vins = listed_vins(30)
+    vins[3:3] = ["JT3SHORT", unknown]
+
+    # Every injected 5xx becomes a failure, and each VIN has to go to the API
+    settings = api_client.API_RETRY_MAX_ATTEMPTS, api_client.SQUISH_VIN_SHARING
+    api_client.API_RETRY_MAX_ATTEMPTS, api_client.SQUISH_VIN_SHARING = 1, False
+    try:
+        results = client.decode_vins_with_status(vins, max_workers=8)
+
+        statuses = [status for status, _ in results]
+        print(f"Decoded {len(vins)} VINs: {statuses.count('hit')} hits, {statuses.count('failure')} failures, "
+              f"{statuses.count('miss')} misses")
+        assert len(results) == len(vins)
+        # Results line up with the input, however the workers finished
+        for vin, (status, data) in zip(vins, results):
+            if status == "hit":
+                assert data["vin"] == vin
+            else:
+                assert data is None
+        assert results[3] == ("miss", None) and results[4][0] in ("miss", "failure")
+        # A failed decode doesn't take its neighbours with it
+        assert "failure" in statuses and statuses.count("hit") > 0
+
+        # Failures are cached briefly and handed back until retried
+        fake_auto_dev.faults["error_rate"] = 0
+        failed = [vin for vin, status in zip(vins, statuses) if status == "failure" and vin != unknown]
+        before = fake_auto_dev.stats["vin"]
+        assert all(status == "failure" for status, _ in client.decode_vins_with_status(failed, max_workers=8))
+        assert fake_auto_dev.stats["vin"] == before
+        retried = client.decode_vins_with_status(failed, max_workers=8, retry_failures=True)
+        assert [data["vin"] for _, data in retried] == failed
+        assert fake_auto_dev.stats["vin"] == before + len(failed)
+    finally:
+        api_client.API_RETRY_MAX_ATTEMPTS, api_client.SQUISH_VIN_SHARING = settings
+
+
+def test_cache_hits_skip_the_api():
+    stand_in.start(listings=20)
+    database = stand_in.scratch_database()
+    vins = listed_vins(10)
+    stand_in.new_client(cache=database).decode_vins_with_status(vins, max_workers=4)
+
+    client = stand_in.new_client(cache=database)
+    before = fake_auto_dev.stats["vin"]
+    results = client.decode_vins_with_status(vins, max_workers=4)
+    print(f"Second decode of {len(vins)} VINs: {client.vin_cache_hits} cache hits, "
+          f"{fake_auto_dev.stats['vin'] - before} API calls")
+    assert [data["vin"] for _, data in results] == vins
+    assert client.vin_cache_hits == len(vins) and fake_auto_dev.stats["vin"] == before
+
+
+def test_squish_vin_sharing():
+    stand_in.start(listings=40)
+    by_squish = {}
+    for vin in listed_vins(40):
+        by_squish.setdefault(squish_vin(vin), []).append(vin)
+    first, second, third = next(vins for vins in by_squish.values() if len(vins) >= 3)[:3]
+    client = stand_in.new_client(cache=stand_in.scratch_database())
+    client.decode_vin(first)
+
+    before = fake_auto_dev.stats["vin"]
+    data = client.decode_vin(second)
+    print(f"{second} decoded from {first} (same squish VIN {squish_vin(second)})")
+    assert data["vin"] == second and fake_auto_dev.stats["vin"] == before
+    assert client.squish_decodes_shared == 1
+
+    sharing = api_client.SQUISH_VIN_SHARING
+    api_client.SQUISH_VIN_SHARING = False
+    try:
+        assert client.decode_vin(third)["vin"] == third
+    finally:
+        api_client.SQUISH_VIN_SHARING = sharing
+    assert fake_auto_dev.stats["vin"] == before + 1
+
+
+if __name__ == "__main__":
+    test_order_and_failure_isolation()
+    test_cache_hits_skip_the_api()
+    test_squish_vin_sharing()
+    print("\nAll VIN decode checks passed")
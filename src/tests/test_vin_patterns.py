@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""Test VIN pattern rules: precedence, manual-wins ties and hot reloading of the rule file"""
+import json
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vin_analyzer import Toyota4RunnerVINAnalyzer, vin_check_digit
+from vin_patterns import LearnedPattern, PatternRule, PatternRules
+
+
+def compile_rules(specs):
+    return PatternRules([PatternRule(spec, order) for order, spec in enumerate(specs)])
+
+
+def rule(pattern, transmission, confidence, **qualifiers):
+    return dict(pattern=pattern, transmission=transmission, confidence=confidence,
+                year_min=1996, year_max=2002, **qualifiers)
+
+
+def write_rules(path, specs, version):
+    with open(path, "w") as f:
+        json.dump({"version": version, "rules": specs}, f)
+
+
+def test_precedence():
+    rules = compile_rules([
+        rule("VZN1*", "manual", 80),
+        rule("VZN18", "automatic", 70),
+        rule("VZN18", "manual", 99, plants="0", serial_min=100000, serial_max=199999),
+    ])
+
+    # More fixed positions beat a wildcard, whatever the file order
+    assert rules.match("VZN18", 1998).confidence == 70
+    assert rules.match("VZN17", 1998).confidence == 80
+    assert rules.match("VZN18", 1995) is None
+
+    # Plant/serial qualified rules outrank unqualified ones, but only for VINs they accept
+    assert rules.match("VZN18", 1998, plant="0", serial="150000").confidence == 99
+    assert rules.match("VZN18", 1998, plant="1", serial="150000").confidence == 70
+    assert rules.match("VZN18", 1998, plant="0", serial="250000").confidence == 70
+    print("Precedence: qualifiers, then fixed positions")
+
+
+def test_manual_wins_tie():
+    rules = compile_rules([rule("RZN18", "automatic", 95), rule("RZN18", "manual", 60)])
+    verdict = rules.match("RZN18", 1998)
+    assert verdict.is_manual and verdict.confidence == 60
+
+    # Same transmission: file order decides
+    rules = compile_rules([rule("RZN18", "manual", 85), rule("RZN18", "manual", 95)])
+    assert rules.match("RZN18", 1998).confidence == 85
+
+    # The shipped rule file has manual and automatic VZN18 rules
+    analyzer = Toyota4RunnerVINAnalyzer()
+    vin = "JT3VZN180W0012345"
+    result = analyzer.classify_vin(vin[:8] + vin_check_digit(vin) + vin[9:])
+    print(f"Shipped rules, VZN18 1998: {result.reason} ({result.confidence}%)")
+    assert result.is_manual and result.confidence == 85
+
+
+def test_reload_keeps_rules_on_a_broken_file():
+    path = os.path.join(tempfile.mkdtemp(prefix="4runner_test_"), "vin_patterns.json")
+    write_rules(path, [rule("VZN18", "manual", 85)], version=1)
+    analyzer = Toyota4RunnerVINAnalyzer(patterns_path=path)
+    learned = {("HN87R", 1998): LearnedPattern(0, 30, False, 88, False)}
+    analyzer.apply_learned_patterns(learned)
+    assert not analyzer.reload_patterns()  # unchanged file
+
+    write_rules(path, [rule("VZN18", "manual", 85), rule("VZN1*", "automatic", 75)], version=2)
+    assert analyzer.reload_patterns()
+    assert analyzer.rules.version == 2 and analyzer.rules.match("VZN17", 1998).confidence == 75
+    assert analyzer.rules.learned == learned  # learned confidences survive a reload
+
+    with open(path, "w") as f:
+        f.write('{"version": 3, "rules": [{"pattern": "VZN1"')  # truncated mid-write
+    assert not analyzer.reload_patterns()
+    print(f"Broken file: still on rules v{analyzer.rules.version}")
+    assert analyzer.rules.version == 2
+
+    write_rules(path, [rule("VZN18", "sometimes", 50)], version=4)  # parses, but invalid
+    assert not analyzer.reload_patterns()
+    assert analyzer.rules.version == 2
+
+
+if __name__ == "__main__":
+    test_precedence()
+    test_manual_wins_tie()
+    test_reload_keeps_rules_on_a_broken_file()
+    print("\nAll VIN pattern rule checks passed")
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""Test the watched-listing refresh against the local stand-in: per-id fetches, the VIN search fallback and removals"""
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import stand_in
+import fake_auto_dev
+
+
+def watch(database, listing, listing_id, price):
+    database.upsert_listing({"vin": listing["vin"], "year": listing["year"], "price": price,
+                             "raw_listing_data": dict(listing, id=listing_id)})
+    database.mark_as_watched(listing["vin"])
+
+
+def listing_state(database, vin):
+    with database.get_connection() as conn:
+        return tuple(conn.execute("SELECT price, listing_status FROM listings WHERE vin = ?", (vin,)).fetchone())
+
+
+def test_fallback_and_removal():
+    stand_in.start(listings=50)
+    hunter = stand_in.new_hunter()
+    database = hunter.database
+    by_id, relisted, gone = [listing for listing in fake_auto_dev.fixtures["listings"] if listing["year"] <= 2002][:3]
+    price = hunter.parse_price(by_id["price"])
+    watch(database, by_id, by_id["id"], price + 500)
+    watch(database, relisted, 9999, 1000)  # stale id: 404, but the VIN is still listed
+    watch(database, gone, 9998, 1000)
+    fake_auto_dev.fixtures["listings"].remove(gone)  # 404 by id and not found by VIN
+
+    stats = hunter.refresh_watched_listings()
+    print(f"Watched refresh: {stats}")
+    assert fake_auto_dev.stats["listing"] == 3 and fake_auto_dev.stats["listings"] == 2
+    assert stats["refreshed"] == 2 and stats["fallback_searches"] == 2
+    assert stats["price_changes"] == 2 and stats["removed"] == 1 and stats["failed"] == 0
+    assert listing_state(database, by_id["vin"]) == (price, "active")
+    assert listing_state(database, relisted["vin"]) == (hunter.parse_price(relisted["price"]), "active")
+    assert listing_state(database, gone["vin"])[1] == "removed"
+
+
+def test_failed_fetch_keeps_the_listing():
+    stand_in.start(listings=50)
+    hunter = stand_in.new_hunter()
+    listing = next(listing for listing in fake_auto_dev.fixtures["listings"] if listing["year"] <= 2002)
+    watch(hunter.database, listing, listing["id"], 1000)
+
+    fake_auto_dev.faults["error_rate"] = 1.0  # every request fails
+    try:
+        stats = hunter.refresh_watched_listings()
+    finally:
+        fake_auto_dev.faults["error_rate"] = 0
+    print(f"Refresh with the API down: {stats}")
+    assert stats["failed"] == 1 and stats["removed"] == 0
+    assert listing_state(hunter.database, listing["vin"]) == (1000, "active")
+
+
+if __name__ == "__main__":
+    test_fallback_and_removal()
+    test_failed_fetch_keeps_the_listing()
+    print("\nAll watched refresh checks passed")
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""Micro-benchmark of per-row JSON cost for each available json_codec backend"""
+import json
+import sys
+import timeit
+sys.path.append('..')
+from json_codec import BACKEND, available_backends, make_codec
+
+# A realistic auto.dev listing record and VIN decode, as stored per row
+RAW_LISTING = {
+    "id": 418827331, "vin": "JT3VN39W0S0123456", "year": 1995, "make": "Toyota", "model": "4Runner",
+    "trim": "SR5 V6", "bodyType": "SUV", "bodyStyle": "suv", "condition": "used", "price": "$8,995",
+    "priceUnformatted": 8995, "mileage": "187,240 Miles", "mileageUnformatted": 187240,
+    "city": "Bozeman", "state": "MT", "lat": 45.6769, "lon": -111.0429, "distanceFromOrigin": 212,
+    "dealerName": "Gallatin Valley Motors", "displayColor": "Emerald Green Pearl", "interiorColor": "Gray",
+    "createdAt": "2025-03-14T18:22:07.000Z", "updatedAt": "2025-03-18T09:01:44.000Z",
+    "clickoffUrl": "https://example.com/listing/418827331?utm_source=auto.dev&utm_medium=api",
+    "primaryPhotoUrl": "https://images.example.com/418827331/1.jpg",
+    "photoUrls": [f"https://images.example.com/418827331/{n}.jpg" for n in range(1, 13)],
+    "active": True, "certified": False, "isHot": False, "recentPriceDrop": True, "priceHistory": [
+        {"date": "2025-03-14", "price": 9495}, {"date": "2025-03-17", "price": 8995}
+    ],
+}
+RAW_VIN_DATA = {
+    "vin": "JT3VN39W0S0123456", "squishVin": "JT3VN39WS0",
+    "make": {"id": 200003381, "name": "Toyota", "niceName": "toyota"},
+    "model": {"id": "Toyota_4Runner", "name": "4Runner", "niceName": "4runner"},
+    "engine": {"id": "200017539", "name": "Engine", "equipmentType": "ENGINE", "availability": "STANDARD",
+               "compressionRatio": 9.0, "cylinder": 6, "size": 3.0, "displacement": 2958,
+               "configuration": "V", "fuelType": "regular unleaded", "horsepower": 150, "torque": 180,
+               "totalValves": 12, "type": "gas", "code": "3VZE", "compressorType": "NA"},
+    "transmission": {"id": "200017541", "name": "5M", "equipmentType": "TRANSMISSION",
+                     "availability": "STANDARD", "transmissionType": "MANUAL", "numberOfSpeeds": "5"},
+    "drivenWheels": "four wheel drive", "numOfDoors": "4",
+    "colors": [{"category": "Exterior", "options": [{"id": "1", "name": "Emerald Green Pearl"}]}],
+    "years": [{"id": 100537293, "year": 1995, "styles": [{"id": 100537294, "name": "SR5 V6 4dr SUV 4WD",
+                                                          "submodel": {"body": "SUV"}, "trim": "SR5 V6"}]}],
+    "categories": {"market": "N/A", "EPAClass": "Standard Sport Utility Vehicle 4WD", "vehicleSize": "Midsize",
+                   "primaryBodyType": "SUV", "vehicleStyle": "4dr SUV", "vehicleType": "SUV"},
+}
+
+
+def per_row_microseconds(func, number: int) -> float:
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e6
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    stored_listing = json.dumps(RAW_LISTING)
+    stored_vin_data = json.dumps(RAW_VIN_DATA)
+    payload = f'{{"totalCount": 1, "records": [{stored_listing}]}}'.encode()
+
+    # Baseline: what the code did before json_codec
+    baseline = {
+        "upsert (2x dumps)": lambda: (json.dumps(RAW_LISTING), json.dumps(RAW_VIN_DATA)),
+        "web row (2x loads)": lambda: (json.loads(stored_listing), json.loads(stored_vin_data)),
+        "API page loads": lambda: json.loads(payload),
+    }
+
+    print(f"Per-row cost in microseconds ({number} iterations, best of 5); json_codec default: {BACKEND}")
+    print(f"{'operation':<22}{'stdlib before':>15}" + "".join(
+        f"{name:>12}" for name, ok in available_backends().items() if ok))
+
+    codecs = {name: make_codec(name) for name, ok in available_backends().items() if ok}
+    for operation, before in baseline.items():
+        cells = [f"{per_row_microseconds(before, number):>15.2f}"]
+        for name, (dumps, loads) in codecs.items():
+            after = {
+                "upsert (2x dumps)": lambda: (dumps(RAW_LISTING), dumps(RAW_VIN_DATA)),
+                "web row (2x loads)": lambda: (loads(stored_listing), loads(stored_vin_data)),
+                "API page loads": lambda: loads(payload),
+            }[operation]
+            cells.append(f"{per_row_microseconds(after, number):>12.2f}")
+        print(f"{operation:<22}" + "".join(cells))
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,7 @@ def reset_database():
     """Remove old database and create new one with updated schema"""
 
     # Remove existing database
+    backup_name = None
     if os.path.exists(DATABASE_PATH):
         backup_name = DATABASE_PATH.replace('.db', '_backup.db')
         print(f"Backing up existing database to {backup_name}")
@@ -19,6 +20,11 @@ def reset_database():
     print("Creating new database with VIN analysis schema...")
     db = Database()
     print(f"New database created at {DATABASE_PATH}")
+
+    # Carry VIN decodes over so re-processing costs no API calls
+    if backup_name:
+        imported = db.import_vin_decode_cache(backup_name)
+        print(f"Carried over {imported} cached VIN decodes from the backup")
     print("Ready for VIN-focused manual transmission hunting!")
 
 if __name__ == "__main__":
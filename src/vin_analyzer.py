@@ -1,39 +1,116 @@
 #!/usr/bin/env python3
 """VIN-based manual transmission detection for Toyota 4Runners (1984-2002)"""
+import logging
 import re
-from typing import Dict, List, Tuple, Optional
+import threading
+from typing import Dict, Iterable, Iterator, List, Sequence, Tuple, Optional
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from config import VIN_PATTERNS_PATH, VIN_PATTERNS_RELOAD_SECONDS
+from vin_patterns import LearnedPattern, PatternRules, PatternVerdict, file_signature, load_pattern_rules
+
+logger = logging.getLogger(__name__)
+
+# VIN check digit (position 9): letters transliterate to numbers (I, O and Q are
+# not allowed), each position is weighted, and the weighted sum mod 11 is the digit ('X' for 10)
+VIN_TRANSLITERATION = dict(zip("0123456789", range(10)))
+VIN_TRANSLITERATION.update(zip("ABCDEFGH", range(1, 9)))
+VIN_TRANSLITERATION.update(zip("JKLMN", range(1, 6)))
+VIN_TRANSLITERATION.update({"P": 7, "R": 9})
+VIN_TRANSLITERATION.update(zip("STUVWXYZ", range(2, 10)))
+VIN_WEIGHTS = (8, 7, 6, 5, 4, 3, 2, 10, 0, 9, 8, 7, 6, 5, 4, 3, 2)
+CHECK_DIGITS = "0123456789X"
+
+
+def vin_check_digit(vin: str) -> Optional[str]:
+    """Expected position-9 check digit of a 17-character VIN, or None if it has illegal characters"""
+    total = 0
+    for char, weight in zip(vin, VIN_WEIGHTS):
+        value = VIN_TRANSLITERATION.get(char)
+        if value is None:
+            return None
+        total += value * weight
+    return CHECK_DIGITS[total % 11]
+
+
+def has_valid_check_digit(vin: str) -> bool:
+    """True if a 17-character VIN's position 9 matches its check digit"""
+    return len(vin) == 17 and vin_check_digit(vin) == vin[8]
+
+
+if np is not None:
+    _VALUE_LUT = np.full(256, -1, dtype=np.int16)
+    for _char, _value in VIN_TRANSLITERATION.items():
+        _VALUE_LUT[ord(_char)] = _value
+    _WEIGHT_ARRAY = np.array(VIN_WEIGHTS, dtype=np.int16)
+    _CHECK_DIGIT_BYTES = np.frombuffer(CHECK_DIGITS.encode(), dtype=np.uint8)
+
+
+def check_digit_mask(vin_bytes):
+    """Vectorized has_valid_check_digit over an (n, 17) uint8 array of VIN bytes (needs NumPy)"""
+    values = _VALUE_LUT[vin_bytes]
+    legal = (values >= 0).all(axis=1)
+    expected = _CHECK_DIGIT_BYTES[(values * _WEIGHT_ARRAY).sum(axis=1) % 11]
+    return legal & (vin_bytes[:, 8] == expected)
+
+
+def valid_check_digits(vins: Sequence[str]) -> List[bool]:
+    """has_valid_check_digit for a batch of VINs - vectorized when NumPy is installed"""
+    if np is None:
+        return [bool(vin) and has_valid_check_digit(vin) for vin in vins]
+
+    full_length = [i for i, vin in enumerate(vins) if vin and len(vin) == 17]
+    valid = np.zeros(len(vins), dtype=bool)
+    if full_length:
+        # One byte per character so every VIN stays exactly 17 bytes wide
+        packed = "".join(vins[i] for i in full_length).encode("latin-1", "replace")
+        vin_bytes = np.frombuffer(packed, dtype="S17").view(np.uint8).reshape(-1, 17)
+        valid[full_length] = check_digit_mask(vin_bytes)
+    return valid.tolist()
+
+
+class VINClassification:
+    """Result of classify_vin: the parsed VIN plus its verdict"""
+    __slots__ = ("valid", "invalid_vin", "year", "model_code", "is_first_gen", "is_manual", "confidence",
+                 "transmission_type", "reason", "skip_decode", "components")
+
+    def __init__(self, components: Dict, verdict: Optional[PatternVerdict] = None):
+        self.components = components
+        self.valid = components["valid"]
+        self.invalid_vin = components.get("invalid_vin", False)
+        self.year = components.get("year")
+        self.model_code = components.get("model_code")
+        self.is_first_gen = components.get("is_first_gen", False)
+        if verdict is None:
+            self.is_manual, self.confidence, self.transmission_type = False, 0, "Unknown"
+            self.reason = components["reason"]
+            self.skip_decode = False
+        else:
+            self.is_manual = verdict.is_manual
+            self.confidence = verdict.confidence
+            self.transmission_type = verdict.transmission_type
+            self.reason = verdict.reason
+            self.skip_decode = verdict.skip_decode
+
+    @property
+    def needs_api_check(self) -> bool:
+        return self.valid and self.confidence < 80 and not self.is_first_gen  # 1st gen doesn't need API check
+
 
 class Toyota4RunnerVINAnalyzer:
     """Analyze Toyota 4Runner VINs for manual transmission patterns (1984-2002)"""
 
-    def __init__(self):
-        # Toyota 4Runner VIN Patterns - Positions 4-8 Analysis (1984-2002)
-        self.manual_patterns = {
-            "VN39W": {"years": [1990, 1991, 1992, 1993, 1994, 1995], "trans": "5-Speed Manual", "confidence": 90},
-            "VN39J": {"years": [1990, 1991, 1992, 1993, 1994, 1995], "trans": "5-Speed Manual", "confidence": 90},
-            "VN29V": {"years": [1995], "trans": "5-Speed Manual", "confidence": 85},
-            "RN37W": {"years": [1990, 1991, 1992, 1993, 1994, 1995], "trans": "5-Speed Manual", "confidence": 90},
-            "LN130": {"years": [1990, 1991, 1992, 1993, 1994, 1995], "trans": "5-Speed Manual", "confidence": 95},
-            "RZN13": {"years": [1990, 1991, 1992, 1993, 1994, 1995], "trans": "5-Speed Manual", "confidence": 95},
-            "VZN13": {"years": [1990, 1991, 1992, 1993, 1994, 1995], "trans": "5-Speed Manual", "confidence": 95},
-            "RZN18": {"years": [1996, 1997, 1998, 1999, 2000, 2001, 2002], "trans": "5-Speed Manual", "confidence": 85},
-            "VZN18": {"years": [1996, 1997, 1998, 1999, 2000, 2001, 2002], "trans": "5-Speed Manual", "confidence": 85},
-        }
-
-        self.automatic_patterns = {
-            # 1990-1995 Generation 2 Automatic Patterns
-            "LN130": {"years": [1990, 1991, 1992, 1993, 1994, 1995], "trans": "4-Speed Auto", "confidence": 85},  # Some LN130 were auto
-            "VZN13": {"years": [1990, 1991, 1992, 1993, 1994, 1995], "trans": "4-Speed Auto", "confidence": 85},  # Some VZN13 were auto
-
-            # 1996-2002 Generation 3 Automatic Patterns
-            "HN87R": {"years": [1996, 1997, 1998, 1999, 2000, 2001, 2002], "trans": "4-Speed Auto", "confidence": 95},
-            "HN86R": {"years": [1996, 1997, 1998, 1999, 2000, 2001, 2002], "trans": "4-Speed Auto", "confidence": 95},  # API data is wrong - these are automatics!
-            "GN86R": {"years": [1996, 1997, 1998, 1999, 2000, 2001, 2002], "trans": "4-Speed Auto", "confidence": 95},
-            "GN87R": {"years": [1996, 1997, 1998, 1999, 2000, 2001, 2002], "trans": "4-Speed Auto", "confidence": 95},
-            # GM84R removed - it's actually mixed manual/auto with no clear pattern!
-            "VZN18": {"years": [1996, 1997, 1998, 1999, 2000, 2001, 2002], "trans": "4-Speed Auto", "confidence": 70},  # Some VZN18 were auto
-            "RZN18": {"years": [1996, 1997, 1998, 1999, 2000, 2001, 2002], "trans": "4-Speed Auto", "confidence": 70},  # Some RZN18 were auto
-        }
+    def __init__(self, patterns_path: str = VIN_PATTERNS_PATH):
+        # Transmission rules for VIN positions 4-8 (1990-2002), see vin_patterns.json
+        self.patterns_path = patterns_path
+        self.patterns_signature = file_signature(patterns_path)
+        self.rules = load_pattern_rules(patterns_path)
+        self._watcher = None
+        self._rules_lock = threading.Lock()  # Serializes rule swaps; lookups never take it
 
         # Year decoding map
         self.year_map = {
@@ -49,6 +126,57 @@ class Toyota4RunnerVINAnalyzer:
         self.MAX_YEAR = 2002
         self.FIRST_GEN_MAX_YEAR = 1989  # 1984-1989 = collect all regardless of transmission
 
+        # 1st gen verdicts depend on the year only
+        self.first_gen_verdicts = {
+            year: PatternVerdict(True, 100, "Any (1st Gen Collection)",
+                                 f"1st Gen 4Runner ({year}) - collecting all regardless of transmission")
+            for year in range(self.MIN_YEAR, self.FIRST_GEN_MAX_YEAR + 1)
+        }
+
+    def reload_patterns(self) -> bool:
+        """
+        Reload the rule file if it changed. The new rules are compiled completely
+        and then swapped in; a broken file is logged and the current rules stay.
+        Returns True if new rules were loaded.
+        """
+        signature = file_signature(self.patterns_path)
+        if signature is None or signature == self.patterns_signature:
+            return False
+        try:
+            rules = load_pattern_rules(self.patterns_path)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.error(f"Keeping VIN pattern rules v{self.rules.version}: {self.patterns_path} is invalid - {e}")
+            self.patterns_signature = signature  # Don't retry until the file changes again
+            return False
+        with self._rules_lock:
+            self.rules = rules.with_learned(self.rules.learned)
+        self.patterns_signature = signature
+        logger.info(f"Loaded VIN pattern rules v{rules.version} ({len(rules.rules)} rules) from {self.patterns_path}")
+        return True
+
+    def apply_learned_patterns(self, learned: Dict[Tuple[str, int], LearnedPattern]):
+        """Use confidences learned from decode outcomes (see vin_patterns.learn_patterns)"""
+        with self._rules_lock:
+            self.rules = self.rules.with_learned(learned)
+
+    def watch_patterns(self, interval_seconds: float = VIN_PATTERNS_RELOAD_SECONDS):
+        """Reload the rule file in a background thread whenever it changes (long-running processes)"""
+        if self._watcher or interval_seconds <= 0:
+            return
+
+        def watch():
+            while not stop.wait(interval_seconds):
+                self.reload_patterns()
+
+        stop = threading.Event()
+        self._watcher = stop
+        threading.Thread(target=watch, name="vin-pattern-watcher", daemon=True).start()
+
+    def stop_watching_patterns(self):
+        if self._watcher:
+            self._watcher.set()
+            self._watcher = None
+
     def decode_year_from_vin(self, vin: str) -> Optional[int]:
         """Decode model year from VIN position 10 (index 9)"""
         if len(vin) < 10:
@@ -80,6 +208,14 @@ class Toyota4RunnerVINAnalyzer:
         if year < self.MIN_YEAR:
             return {"valid": False, "reason": f"Year {year} is before 4Runner production started"}
 
+        # Typo'd or garbled VINs never get decoded
+        check_digit = vin_check_digit(vin)
+        if check_digit is None:
+            return {"valid": False, "invalid_vin": True, "reason": "VIN contains an illegal character"}
+        if check_digit != vin[8]:
+            return {"valid": False, "invalid_vin": True,
+                    "reason": f"Invalid check digit '{vin[8]}' (expected '{check_digit}')"}
+
         # Extract components
         wmi = vin[0:3]          # World Manufacturer ID
         model_code = vin[3:8]   # Model/Engine/Trans code
@@ -100,65 +236,66 @@ class Toyota4RunnerVINAnalyzer:
             "is_first_gen": year <= self.FIRST_GEN_MAX_YEAR
         }
 
-    def is_manual_transmission(self, vin: str) -> Tuple[bool, int, str]:
-        """
-        Check if VIN indicates manual transmission
-        Returns: (is_manual, confidence, reason)
-        """
+    def classify_vin(self, vin: str, rules: Optional[PatternRules] = None) -> VINClassification:
+        """Parse the VIN once and look its verdict up in the pattern rules (default: the current ones)"""
         components = self.extract_vin_components(vin)
-
         if not components["valid"]:
-            return False, 0, components["reason"]
+            return VINClassification(components)
 
-        model_code = components["model_code"]
         year = components["year"]
-        is_first_gen = components["is_first_gen"]
+        model_code = components["model_code"]
 
         # RULE 1: All 1st gen 4Runners (1984-1989) are collected regardless of transmission
-        if is_first_gen:
-            return True, 100, f"1st Gen 4Runner ({year}) - collecting all regardless of transmission"
-
-        # RULE 2: Check against known manual patterns for 2nd/3rd gen
-        for pattern, info in self.manual_patterns.items():
-            if model_code == pattern and year in info["years"]:
-                return True, info["confidence"], f"Pattern '{pattern}' matches {info['trans']}"
+        if components["is_first_gen"]:
+            return VINClassification(components, self.first_gen_verdicts[year])
 
-        # RULE 3: Check if it's a known automatic pattern
-        for pattern, info in self.automatic_patterns.items():
-            if model_code == pattern and year in info["years"]:
-                return False, info["confidence"], f"Pattern '{pattern}' is {info['trans']}"
+        # RULES 2-3: Most specific matching rule (manual preferred on a tie) for 2nd/3rd gen
+        verdict = (rules or self.rules).match(model_code, year, components["plant_code"], components["serial"])
+        if verdict is None:
+            # RULE 4: Unknown pattern for 2nd/3rd gen - needs API verification
+            verdict = PatternVerdict(False, 25, "Unknown",
+                                     f"Unknown pattern '{model_code}' for year {year} - needs API verification")
+        return VINClassification(components, verdict)
 
-        # RULE 4: Unknown pattern for 2nd/3rd gen - needs API verification
-        return False, 25, f"Unknown pattern '{model_code}' for year {year} - needs API verification"
+    def is_manual_transmission(self, vin: str) -> Tuple[bool, int, str]:
+        """
+        Check if VIN indicates manual transmission
+        Returns: (is_manual, confidence, reason)
+        """
+        result = self.classify_vin(vin)
+        return result.is_manual, result.confidence, result.reason
 
     def analyze_manual_probability(self, vin: str) -> Dict:
         """Analyze VIN for manual transmission probability"""
-        is_manual, confidence, reason = self.is_manual_transmission(vin)
-        components = self.extract_vin_components(vin)
+        result = self.classify_vin(vin)
 
-        if not components["valid"]:
+        if not result.valid:
             return {
                 "is_manual_candidate": False,
                 "confidence": 0,
-                "reason": reason,
+                "reason": result.reason,
                 "transmission_type": "Unknown",
                 "year": None,
                 "needs_api_check": False,
+                "skip_decode": False,
                 "is_first_gen": False,
-                "outside_target_years": True
+                "invalid_vin": result.invalid_vin,
+                "outside_target_years": not result.invalid_vin
             }
 
         return {
-            "is_manual_candidate": is_manual,
-            "confidence": confidence,
-            "reason": reason,
-            "transmission_type": self._get_transmission_type(components["model_code"], components["year"]),
-            "year": components["year"],
-            "model_code": components["model_code"],
-            "needs_api_check": confidence < 80 and not components["is_first_gen"],  # 1st gen doesn't need API check
-            "is_first_gen": components["is_first_gen"],
+            "is_manual_candidate": result.is_manual,
+            "confidence": result.confidence,
+            "reason": result.reason,
+            "transmission_type": result.transmission_type,
+            "year": result.year,
+            "model_code": result.model_code,
+            "needs_api_check": result.needs_api_check,
+            "skip_decode": result.skip_decode,
+            "is_first_gen": result.is_first_gen,
+            "invalid_vin": False,
             "outside_target_years": False,
-            "vin_components": components
+            "vin_components": result.components
         }
 
     def _get_transmission_type(self, model_code: str, year: int) -> str:
@@ -167,17 +304,70 @@ class Toyota4RunnerVINAnalyzer:
         if year <= self.FIRST_GEN_MAX_YEAR:
             return "Any (1st Gen Collection)"
 
-        # Check manual patterns first
-        for pattern, info in self.manual_patterns.items():
-            if model_code == pattern and year in info["years"]:
-                return info["trans"]
+        verdict = self.rules.lookup(model_code, year)[0]
+        return verdict.transmission_type if verdict else "Unknown"
+
+    # Summary counter bumped for each batch_analyze_vins category
+    SUMMARY_KEYS = {
+        "manual_candidates": "manual_found",
+        "automatic_confirmed": "automatic_found",
+        "needs_api_verification": "needs_verification",
+        "invalid_vins": "invalid",
+        "outside_target_years": "outside_target_years",
+    }
+
+    def classify_listing(self, listing: Dict) -> str:
+        """Analyze one listing (sets listing["vin_analysis"]) and return its category"""
+        vin = listing.get("vin")
+        if not vin:
+            return "invalid_vins"
+
+        analysis = self.analyze_manual_probability(vin)
+        listing["vin_analysis"] = analysis
+
+        # Malformed VIN (bad check digit or characters) - skipped before any decode
+        if analysis["invalid_vin"]:
+            return "invalid_vins"
+
+        # Filter out vehicles outside target years (2001+)
+        if analysis["outside_target_years"]:
+            return "outside_target_years"
+
+        # Categorize based on analysis
+        if analysis["is_manual_candidate"] and analysis["confidence"] >= 80:
+            return "manual_candidates"
+        elif analysis["needs_api_check"]:
+            return "needs_api_verification"
+        return "automatic_confirmed"
+
+    def iter_classified_listings(self, listings: Iterable[Dict]) -> Iterator[Tuple[str, Dict]]:
+        """Streaming classifier: yield (category, listing) as listings arrive"""
+        for listing in listings:
+            yield self.classify_listing(listing), listing
+
+    @staticmethod
+    def new_summary() -> Dict:
+        """Empty summary counters, as returned by batch_analyze_vins"""
+        return {
+            "total_processed": 0,
+            "manual_found": 0,
+            "automatic_found": 0,
+            "needs_verification": 0,
+            "invalid": 0,
+            "first_gen_collected": 0,
+            "outside_target_years": 0
+        }
 
-        # Check automatic patterns
-        for pattern, info in self.automatic_patterns.items():
-            if model_code == pattern and year in info["years"]:
-                return info["trans"]
+    def count_in_summary(self, summary: Dict, category: str, listing: Dict):
+        """Update summary counters for one classified listing"""
+        summary[self.SUMMARY_KEYS[category]] += 1
+        if category == "invalid_vins":
+            return
 
-        return "Unknown"
+        summary["total_processed"] += 1
+        # Track 1st gen separately
+        if category == "manual_candidates" and listing["vin_analysis"]["is_first_gen"]:
+            summary["first_gen_collected"] += 1
 
     def batch_analyze_vins(self, listings: List[Dict]) -> Dict:
         """Analyze a batch of listings for manual candidates (1984-2000 only)"""
@@ -185,66 +375,23 @@ class Toyota4RunnerVINAnalyzer:
             "manual_candidates": [],          # High confidence manuals + all 1st gen
             "automatic_confirmed": [],       # High confidence automatics
             "needs_api_verification": [],    # Unknown patterns needing API check
-            "invalid_vins": [],             # Bad VINs
+            "invalid_vins": [],             # Missing VINs, bad check digits
             "outside_target_years": [],     # 2001+ vehicles (filtered out)
-            "summary": {
-                "total_processed": 0,
-                "manual_found": 0,
-                "automatic_found": 0,
-                "needs_verification": 0,
-                "invalid": 0,
-                "first_gen_collected": 0,
-                "outside_target_years": 0
-            }
+            "summary": self.new_summary()
         }
 
-        for listing in listings:
-            vin = listing.get("vin")
-            if not vin:
-                results["invalid_vins"].append(listing)
-                results["summary"]["invalid"] += 1
-                continue
-
-            analysis = self.analyze_manual_probability(vin)
-            listing["vin_analysis"] = analysis
-            results["summary"]["total_processed"] += 1
-
-            # Filter out vehicles outside target years (2001+)
-            if analysis["outside_target_years"]:
-                results["outside_target_years"].append(listing)
-                results["summary"]["outside_target_years"] += 1
-                continue
-
-            # Categorize based on analysis
-            if analysis["is_manual_candidate"] and analysis["confidence"] >= 80:
-                results["manual_candidates"].append(listing)
-                results["summary"]["manual_found"] += 1
-
-                # Track 1st gen separately
-                if analysis["is_first_gen"]:
-                    results["summary"]["first_gen_collected"] += 1
-
-            elif analysis["needs_api_check"]:
-                results["needs_api_verification"].append(listing)
-                results["summary"]["needs_verification"] += 1
-            else:
-                results["automatic_confirmed"].append(listing)
-                results["summary"]["automatic_found"] += 1
+        for category, listing in self.iter_classified_listings(listings):
+            results[category].append(listing)
+            self.count_in_summary(results["summary"], category, listing)
 
         return results
 
     def get_pattern_statistics(self) -> Dict:
         """Get statistics about known VIN patterns"""
-        total_manual_years = sum(len(info["years"]) for info in self.manual_patterns.values())
-        total_auto_years = sum(len(info["years"]) for info in self.automatic_patterns.values())
-
         return {
             "target_years": f"{self.MIN_YEAR}-{self.MAX_YEAR}",
             "first_gen_years": f"{self.MIN_YEAR}-{self.FIRST_GEN_MAX_YEAR}",
-            "manual_patterns": len(self.manual_patterns),
-            "automatic_patterns": len(self.automatic_patterns),
-            "manual_year_combinations": total_manual_years,
-            "automatic_year_combinations": total_auto_years,
+            **self.rules.statistics(),
             "last_manual_year": self.MAX_YEAR,
             "collect_all_first_gen": True
         }
@@ -256,9 +403,9 @@ if __name__ == "__main__":
     # Test VINs representing different scenarios
     test_vins = [
         "JT3VN39W4N8043298",  # 2022 - should be filtered out
-        "JT3RN60L0F0123456",  # 1985 - 1st gen, should be collected
+        "JT3RN60L5F0123456",  # 1985 - 1st gen, should be collected
         "JT3HN87R3T0043862",  # 1996 - should be automatic
-        "JT3LN130XL0012345",  # 1990 - could be manual
+        "JT3LN1303L0012345",  # 1990 - could be manual
     ]
 
     print("Toyota 4Runner VIN Analysis Results (1984-2000 Only):")
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""In-memory index of VINs already stored in the listings table"""
+import hashlib
+import logging
+import math
+from typing import Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+VIN_LENGTH = 17
+
+
+class BloomFilter:
+    """Compact probabilistic set: no false negatives, tunable false-positive rate"""
+
+    def __init__(self, expected_items: int, false_positive_rate: float = 0.001):
+        expected_items = max(expected_items, 1000)
+        self.size = int(-expected_items * math.log(false_positive_rate) / (math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / expected_items * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        # Double hashing from one 128-bit digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hash_count):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, item: str):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class SortedVINArray:
+    """VINs packed into one sorted bytes buffer (17 bytes each), binary searched"""
+
+    def __init__(self, vins: Iterable[str]):
+        packed = sorted(vin.encode() for vin in vins if vin and len(vin) == VIN_LENGTH)
+        self.data = b"".join(packed)
+        self.count = len(packed)
+        self.recent = set()  # VINs added after load
+
+    def _vin_at(self, index: int) -> bytes:
+        start = index * VIN_LENGTH
+        return self.data[start:start + VIN_LENGTH]
+
+    def add(self, vin: str):
+        self.recent.add(vin)
+
+    def __contains__(self, vin: str) -> bool:
+        if vin in self.recent:
+            return True
+        if not vin or len(vin) != VIN_LENGTH:
+            return False
+        key = vin.encode()
+        # Manual bisect_left (bisect's key= argument needs Python 3.10)
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._vin_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo < self.count and self._vin_at(lo) == key
+
+    def __len__(self) -> int:
+        return self.count + len(self.recent)
+
+
+class SeenVINIndex:
+    """
+    Set of VINs already in the database, loaded once per run and kept current
+    with add() as listings are inserted.
+
+    Backends:
+      set    - plain Python set (fastest, most memory)
+      sorted - sorted packed byte array, ~17 bytes per VIN
+      bloom  - Bloom filter, ~2 bytes per VIN; positives are confirmed
+               against the database so a new VIN is never skipped
+
+    Check a page of VINs with known_vins() - with the bloom backend that is one
+    confirming query for the page instead of one per positive.
+    """
+
+    BACKENDS = ("set", "sorted", "bloom")
+
+    def __init__(self, database, backend: str = "set"):
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Unknown seen-VIN index backend '{backend}' (expected one of {self.BACKENDS})")
+        self.database = database
+        self.backend = backend
+        self._members = None
+        self.load()
+
+    def load(self):
+        """(Re)load the index from the listings table."""
+        vins = self.database.iter_processed_vins()
+        if self.backend == "set":
+            self._members = set(vins)
+        elif self.backend == "sorted":
+            self._members = SortedVINArray(vins)
+        else:
+            self._members = BloomFilter(self.database.count_listings() * 2)
+            for vin in vins:
+                self._members.add(vin)
+        logger.info(f"Loaded seen-VIN index ({self.backend})")
+
+    def add(self, vin: str):
+        """Record a VIN that has just been stored."""
+        self._members.add(vin)
+
+    def __contains__(self, vin: Optional[str]) -> bool:
+        if not vin:
+            return False
+        if vin not in self._members:
+            return False
+        if self.backend == "bloom":
+            return self.database.vin_exists(vin)
+        return True
+
+    def known_vins(self, vins: Iterable[str]) -> set:
+        """The subset of vins already stored."""
+        candidates = {vin for vin in vins if vin and vin in self._members}
+        if self.backend == "bloom" and candidates:
+            return self.database.existing_vins(candidates)
+        return candidates
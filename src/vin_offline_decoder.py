@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Local VIN decode backend.
+
+Decode attributes (engine, transmission, drive, ...) are keyed by VIN prefix in
+a small SQLite database imported from a vPIC-style CSV export, so a VIN can be
+decoded without a network round trip or API quota. Patterns are written in VIN
+positions; the check digit (position 9) is ignored, so keys are prefixes of the
+squish VIN (positions 1-8 and 10-11). When several patterns match, longer
+(more specific) ones win per attribute.
+
+Usage:
+    python vin_offline_decoder.py import patterns.csv [--replace]
+    python vin_offline_decoder.py decode JT3VN39W0S0123456
+"""
+import csv
+import logging
+import sqlite3
+import sys
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from config import VIN_OFFLINE_DB_PATH
+
+logger = logging.getLogger(__name__)
+
+# Model year codes (VIN position 10), repeating every 30 years from 1980
+YEAR_CODES = "ABCDEFGHJKLMNPRSTVWXY123456789"
+
+ATTRIBUTE_COLUMNS = (
+    "make", "model", "trim", "body_class", "engine_cylinders", "engine_size",
+    "engine_configuration", "fuel_type", "transmission_type", "transmission_speeds", "drive_type"
+)
+
+# CSV header -> column. Accepts our own names and the vPIC variable names.
+HEADER_ALIASES = {
+    "pattern": "pattern", "vin_pattern": "pattern", "vin pattern": "pattern",
+    "wmi": "wmi", "keys": "keys",
+    "model_year": "model_year", "model year": "model_year", "year": "model_year",
+    "make": "make",
+    "model": "model",
+    "trim": "trim",
+    "body_class": "body_class", "body class": "body_class",
+    "engine_cylinders": "engine_cylinders", "engine number of cylinders": "engine_cylinders",
+    "engine_size": "engine_size", "displacement (l)": "engine_size",
+    "engine_configuration": "engine_configuration", "engine configuration": "engine_configuration",
+    "fuel_type": "fuel_type", "fuel type - primary": "fuel_type",
+    "transmission_type": "transmission_type", "transmission style": "transmission_type",
+    "transmission_speeds": "transmission_speeds", "transmission speeds": "transmission_speeds",
+    "drive_type": "drive_type", "drive type": "drive_type",
+}
+
+MIN_KEY_LENGTH = 3  # WMI
+
+
+def pattern_key(pattern: str) -> Optional[str]:
+    """Turn a VIN-position pattern into a squish VIN prefix, or None if it can't be a prefix key."""
+    pattern = pattern.strip().upper().rstrip("*?_")
+    if len(pattern) > 8:
+        pattern = pattern[:8] + pattern[9:]  # drop the check digit
+    pattern = pattern[:10]
+    if len(pattern) < MIN_KEY_LENGTH or any(c in "*?_[" for c in pattern):
+        return None
+    return pattern
+
+
+def normalize_transmission(value: str) -> Optional[str]:
+    """Map vPIC transmission styles ("Manual/Standard", "Automatic", ...) onto auto.dev's values."""
+    value = (value or "").strip()
+    if not value:
+        return None
+    lowered = value.lower()
+    if "manual" in lowered or "standard" in lowered:
+        return "MANUAL"
+    if "auto" in lowered:
+        return "AUTOMATIC"
+    return value.upper()
+
+
+class OfflineVINDecoder:
+    """SQLite-backed VIN prefix -> decode attributes lookup."""
+
+    def __init__(self, db_path: str = VIN_OFFLINE_DB_PATH):
+        self.db_path = db_path
+        # One connection for the life of the decoder - lookups are the hot path
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        self.initialize_database()
+
+    def initialize_database(self):
+        """Create the pattern table if it doesn't exist."""
+        with self._lock:
+            self._conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS vin_patterns (
+                    id INTEGER PRIMARY KEY,
+                    vin_key TEXT NOT NULL,
+                    year_code TEXT,
+                    model_year INTEGER,
+                    {", ".join(f"{column} TEXT" for column in ATTRIBUTE_COLUMNS)},
+                    source TEXT,
+                    imported_at DATETIME
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_vin_patterns_key ON vin_patterns(vin_key, year_code)")
+            self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+    def count_patterns(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM vin_patterns").fetchone()[0]
+
+    def import_csv(self, csv_path: str, replace: bool = False) -> Dict:
+        """
+        Import decode patterns from a CSV file.
+
+        Each row needs either a 'pattern' column (VIN positions from 1) or vPIC's
+        'WMI' + 'Keys' columns, plus any of the attribute columns (our names or
+        the vPIC variable names). Patterns with wildcards before their last
+        position can't be prefix keys and are skipped.
+        Returns {'imported', 'skipped'}.
+        """
+        rows = []
+        skipped = 0
+        now = datetime.now().isoformat()
+
+        with open(csv_path, newline="", encoding="utf-8") as f:
+            reader = csv.DictReader(f)
+            for raw in reader:
+                row = {}
+                for header, value in raw.items():
+                    column = HEADER_ALIASES.get((header or "").strip().lower())
+                    if column and value not in (None, ""):
+                        row[column] = value.strip()
+
+                pattern = row.get("pattern") or (row.get("wmi", "") + row.get("keys", ""))
+                key = pattern_key(pattern)
+                if not key:
+                    skipped += 1
+                    continue
+
+                model_year = int(row["model_year"]) if row.get("model_year", "").isdigit() else None
+                year_code = YEAR_CODES[(model_year - 1980) % 30] if model_year and model_year >= 1980 else None
+                if "transmission_type" in row:
+                    row["transmission_type"] = normalize_transmission(row["transmission_type"])
+
+                rows.append(
+                    (key, year_code, model_year)
+                    + tuple(row.get(column) for column in ATTRIBUTE_COLUMNS)
+                    + (csv_path, now)
+                )
+
+        columns = ("vin_key", "year_code", "model_year") + ATTRIBUTE_COLUMNS + ("source", "imported_at")
+        with self._lock:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                if replace:
+                    self._conn.execute("DELETE FROM vin_patterns")
+                self._conn.executemany(
+                    f"INSERT INTO vin_patterns ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                    rows
+                )
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+
+        logger.info(f"Imported {len(rows)} VIN decode patterns from {csv_path} ({skipped} skipped)")
+        return {"imported": len(rows), "skipped": skipped}
+
+    def lookup(self, vin: str) -> Optional[Dict]:
+        """Merged attributes of every pattern matching the VIN (most specific first), or None."""
+        if not vin or len(vin) != 17:
+            return None
+        vin = vin.upper()
+        squish = vin[:8] + vin[9:11]
+        keys = [squish[:length] for length in range(len(squish), MIN_KEY_LENGTH - 1, -1)]
+
+        with self._lock:
+            rows = self._conn.execute(f"""
+                SELECT * FROM vin_patterns
+                WHERE vin_key IN ({", ".join("?" * len(keys))}) AND (year_code IS NULL OR year_code = ?)
+                ORDER BY length(vin_key) DESC, year_code IS NULL, id DESC
+            """, keys + [vin[9]]).fetchall()
+
+        if not rows:
+            return None
+
+        attributes = {}
+        for row in rows:
+            for column in ATTRIBUTE_COLUMNS + ("model_year",):
+                if column not in attributes and row[column] is not None:
+                    attributes[column] = row[column]
+        return attributes
+
+    def decode(self, vin: str) -> Optional[Dict]:
+        """
+        Decode a VIN into an auto.dev-shaped response.
+
+        Returns None unless the transmission type is known - a decode without it
+        would read as an automatic downstream.
+        """
+        attributes = self.lookup(vin)
+        if not attributes or not attributes.get("transmission_type"):
+            return None
+        return self.to_auto_dev_format(vin, attributes)
+
+    @staticmethod
+    def to_auto_dev_format(vin: str, attributes: Dict) -> Dict:
+        """Shape merged pattern attributes like an auto.dev /vin response."""
+        engine = {}
+        if attributes.get("engine_cylinders"):
+            engine["cylinder"] = int(float(attributes["engine_cylinders"]))
+        if attributes.get("engine_size"):
+            engine["size"] = float(attributes["engine_size"])
+        if attributes.get("engine_configuration"):
+            engine["configuration"] = attributes["engine_configuration"]
+        if attributes.get("fuel_type"):
+            engine["fuelType"] = attributes["fuel_type"]
+
+        transmission = {"transmissionType": attributes["transmission_type"]}
+        if attributes.get("transmission_speeds"):
+            transmission["numberOfSpeeds"] = attributes["transmission_speeds"]
+
+        data = {
+            "vin": vin,
+            "engine": engine,
+            "transmission": transmission,
+            "decodeSource": "offline"
+        }
+        if attributes.get("make"):
+            data["make"] = {"name": attributes["make"]}
+        if attributes.get("model"):
+            data["model"] = {"name": attributes["model"]}
+        if attributes.get("model_year"):
+            data["years"] = [{"year": int(attributes["model_year"])}]
+        if attributes.get("trim"):
+            data["trim"] = attributes["trim"]
+        if attributes.get("drive_type"):
+            data["drivenWheels"] = attributes["drive_type"]
+        if attributes.get("body_class"):
+            data["categories"] = {"vehicleStyle": attributes["body_class"]}
+        return data
+
+
+def main(argv: List[str]):
+    if len(argv) >= 2 and argv[0] == "import":
+        decoder = OfflineVINDecoder(VIN_OFFLINE_DB_PATH)
+        result = decoder.import_csv(argv[1], replace="--replace" in argv)
+        print(f"Imported {result['imported']} patterns ({result['skipped']} skipped) into {decoder.db_path}")
+        print(f"Patterns in database: {decoder.count_patterns()}")
+    elif len(argv) >= 2 and argv[0] == "decode":
+        decoder = OfflineVINDecoder(VIN_OFFLINE_DB_PATH)
+        print(decoder.decode(argv[1]) or f"No offline decode for {argv[1]}")
+    else:
+        print(__doc__)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main(sys.argv[1:])
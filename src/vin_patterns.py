@@ -0,0 +1,254 @@
+"""
+VIN transmission rules loaded from a versioned JSON file (vin_patterns.json).
+
+Rules are compiled into a prefix trie over VIN positions 4-8, where '*' matches
+any character. A rule can also be limited to plant codes (position 11) and a
+serial range (positions 12-17). Lookups memoize per (model_code, year), so the
+trie is walked once per distinct code/year; only rules with plant/serial
+qualifiers are checked per VIN. A compiled PatternRules is never modified -
+reloading builds a new one and swaps it in.
+
+Confidences learned from decode outcomes (learn_patterns) override the rule
+verdict for a (model_code, year) unless the rule sets "learn": false.
+"""
+import logging
+import math
+import os
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import json_codec
+
+logger = logging.getLogger(__name__)
+
+WILDCARD = "*"
+PATTERN_CHARACTERS = set("ABCDEFGHJKLMNPRSTUVWXYZ0123456789" + WILDCARD)
+TRANSMISSIONS = ("manual", "automatic")
+
+
+class PatternVerdict:
+    """Answer of one rule: transmission verdict, label, confidence and reason"""
+    __slots__ = ("is_manual", "confidence", "transmission_type", "reason", "skip_decode")
+
+    def __init__(self, is_manual: bool, confidence: int, transmission_type: str, reason: str,
+                 skip_decode: bool = False):
+        self.is_manual = is_manual
+        self.confidence = confidence
+        self.transmission_type = transmission_type
+        self.reason = reason
+        self.skip_decode = skip_decode
+
+
+class LearnedPattern:
+    """Decode outcomes of one (model_code, year) and the verdict derived from them"""
+    __slots__ = ("manual_count", "automatic_count", "is_manual", "confidence", "skip_decode")
+
+    def __init__(self, manual_count: int, automatic_count: int, is_manual: bool, confidence: int,
+                 skip_decode: bool):
+        self.manual_count = manual_count
+        self.automatic_count = automatic_count
+        self.is_manual = is_manual
+        self.confidence = confidence
+        self.skip_decode = skip_decode
+
+    @property
+    def total(self) -> int:
+        return self.manual_count + self.automatic_count
+
+
+class PatternRule:
+    """One entry of the rule file"""
+    __slots__ = ("pattern", "is_manual", "year_min", "year_max", "plants", "serial_min", "serial_max",
+                 "learn", "verdict", "precedence")
+
+    def __init__(self, spec: Dict, order: int):
+        pattern = str(spec.get("pattern", "")).upper()
+        if len(pattern) != 5 or not set(pattern) <= PATTERN_CHARACTERS:
+            raise ValueError(f"rule {order}: pattern must be 5 VIN characters or '*', got {pattern!r}")
+        if spec.get("transmission") not in TRANSMISSIONS:
+            raise ValueError(f"rule {order}: transmission must be one of {TRANSMISSIONS}")
+        confidence = int(spec.get("confidence", 0))
+        if not 0 <= confidence <= 100:
+            raise ValueError(f"rule {order}: confidence must be 0-100")
+
+        self.pattern = pattern
+        self.is_manual = spec["transmission"] == "manual"
+        self.year_min = int(spec["year_min"])
+        self.year_max = int(spec.get("year_max", self.year_min))
+        if self.year_min > self.year_max:
+            raise ValueError(f"rule {order}: year_min is after year_max")
+        self.plants = str(spec["plants"]).upper() if spec.get("plants") else None
+        self.serial_min = int(spec["serial_min"]) if spec.get("serial_min") is not None else None
+        self.serial_max = int(spec["serial_max"]) if spec.get("serial_max") is not None else None
+        # False pins the rule: decode outcomes never override it (e.g. patterns the API decodes wrongly)
+        self.learn = bool(spec.get("learn", True))
+
+        trans = spec.get("trans") or ("Manual" if self.is_manual else "Automatic")
+        if self.is_manual:
+            reason = f"Pattern '{pattern}' matches {trans}"
+        else:
+            reason = f"Pattern '{pattern}' is {trans}"
+        self.verdict = PatternVerdict(self.is_manual, confidence, trans, reason)
+
+        # Sorts ascending: more qualifiers, more fixed positions, manual before automatic, file order
+        qualifiers = (self.plants is not None) + (self.serial_min is not None or self.serial_max is not None)
+        self.precedence = (-qualifiers, pattern.count(WILDCARD), not self.is_manual, order)
+
+    @property
+    def qualified(self) -> bool:
+        return self.precedence[0] < 0
+
+    def accepts(self, plant: Optional[str], serial: Optional[str]) -> bool:
+        """Check the plant/serial qualifiers for one VIN"""
+        if self.plants is not None and (not plant or plant not in self.plants):
+            return False
+        if self.serial_min is not None or self.serial_max is not None:
+            if not serial or not serial.isdigit():
+                return False
+            number = int(serial)
+            if self.serial_min is not None and number < self.serial_min:
+                return False
+            if self.serial_max is not None and number > self.serial_max:
+                return False
+        return True
+
+
+class PatternRules:
+    """Compiled rule set: a trie of PatternRules with per (model_code, year) memoized lookups"""
+
+    def __init__(self, rules: List[PatternRule], version=None, source: Optional[str] = None,
+                 learned: Optional[Dict[Tuple[str, int], LearnedPattern]] = None, trie: Optional[Dict] = None):
+        self.rules = rules
+        self.version = version
+        self.source = source
+        self.learned = learned or {}
+        if trie is None:
+            trie = {}
+            for rule in rules:
+                node = trie
+                for char in rule.pattern:
+                    node = node.setdefault(char, {})
+                node.setdefault(None, []).append(rule)
+        self._trie = trie
+        self._lookups = {}
+
+    def with_learned(self, learned: Dict[Tuple[str, int], LearnedPattern]) -> "PatternRules":
+        """The same rules with other learned patterns (a new object; this one is unchanged)"""
+        return PatternRules(self.rules, self.version, self.source, learned, self._trie)
+
+    def _candidates(self, model_code: str) -> List[PatternRule]:
+        nodes = [self._trie]
+        for char in model_code:
+            nodes = [child for node in nodes for child in (node.get(char), node.get(WILDCARD)) if child]
+            if not nodes:
+                return []
+        return [rule for node in nodes for rule in node.get(None, ())]
+
+    def lookup(self, model_code: str, year: int) -> Tuple[Optional[PatternVerdict], Tuple[PatternRule, ...]]:
+        """
+        (verdict of the best unqualified rule - or the learned one - and the qualified
+        rules that outrank it in order) for a model code and year. Memoized.
+        """
+        key = (model_code, year)
+        entry = self._lookups.get(key)
+        if entry is None:
+            matching = sorted(
+                (rule for rule in self._candidates(model_code) if rule.year_min <= year <= rule.year_max),
+                key=lambda rule: rule.precedence
+            )
+            qualified = tuple(rule for rule in matching if rule.qualified)
+            winner = next((rule for rule in matching if not rule.qualified), None)
+            verdict = winner.verdict if winner else None
+            learned = self.learned.get(key)
+            if learned and (winner is None or winner.learn):
+                verdict = self._learned_verdict(model_code, year, learned, winner)
+            entry = self._lookups[key] = (verdict, qualified)
+        return entry
+
+    @staticmethod
+    def _learned_verdict(model_code: str, year: int, learned: LearnedPattern,
+                         rule: Optional[PatternRule]) -> PatternVerdict:
+        if rule is not None and rule.is_manual == learned.is_manual:
+            transmission_type = rule.verdict.transmission_type
+        else:
+            transmission_type = "Manual" if learned.is_manual else "Automatic"
+        agreeing = learned.manual_count if learned.is_manual else learned.automatic_count
+        reason = (f"Pattern '{model_code}' ({year}): {agreeing}/{learned.total} decodes were "
+                  f"{'manual' if learned.is_manual else 'automatic'} (learned)")
+        return PatternVerdict(learned.is_manual, learned.confidence, transmission_type, reason,
+                              learned.skip_decode)
+
+    def match(self, model_code: str, year: int, plant: Optional[str] = None,
+              serial: Optional[str] = None) -> Optional[PatternVerdict]:
+        """Verdict of the winning rule for a VIN's model code, year, plant and serial (None if no rule)"""
+        verdict, qualified = self.lookup(model_code, year)
+        for rule in qualified:
+            if rule.accepts(plant, serial):
+                return rule.verdict
+        return verdict
+
+    def statistics(self) -> Dict:
+        manual = [rule for rule in self.rules if rule.is_manual]
+        automatic = [rule for rule in self.rules if not rule.is_manual]
+        return {
+            "rules_version": self.version,
+            "manual_patterns": len({rule.pattern for rule in manual}),
+            "automatic_patterns": len({rule.pattern for rule in automatic}),
+            "manual_year_combinations": sum(rule.year_max - rule.year_min + 1 for rule in manual),
+            "automatic_year_combinations": sum(rule.year_max - rule.year_min + 1 for rule in automatic),
+            "learned_patterns": len(self.learned),
+            "learned_skip_decode": sum(1 for learned in self.learned.values() if learned.skip_decode),
+        }
+
+
+def load_pattern_rules(path: str) -> PatternRules:
+    """Read and compile a rule file. Raises OSError or ValueError; nothing is half-loaded."""
+    with open(path, "rb") as f:
+        data = json_codec.loads(f.read())
+    if not isinstance(data, dict) or not isinstance(data.get("rules"), list):
+        raise ValueError(f"{path}: expected an object with a 'rules' list")
+    rules = [PatternRule(spec, order) for order, spec in enumerate(data["rules"])]
+    return PatternRules(rules, version=data.get("version"), source=path)
+
+
+def wilson_lower_bound(successes: int, total: int, z: float = 1.96) -> float:
+    """Lower end of the Wilson score interval for a success share"""
+    if not total:
+        return 0.0
+    share = successes / total
+    centre = share + z * z / (2 * total)
+    margin = z * math.sqrt(share * (1 - share) / total + z * z / (4 * total * total))
+    return (centre - margin) / (1 + z * z / total)
+
+
+def learn_patterns(observations: Iterable[Dict], min_observations: int,
+                   skip_decode_after: int) -> Dict[Tuple[str, int], LearnedPattern]:
+    """
+    Learned verdicts from per (model_code, year) decode counts
+    ({'model_code', 'year', 'manual_count', 'automatic_count'}).
+    Patterns with at least min_observations decodes get the majority transmission
+    with the Wilson lower bound of its share as confidence (capped at 99); those
+    with skip_decode_after decodes and no counterexample also skip decoding.
+    """
+    learned = {}
+    for row in observations:
+        manual, automatic = int(row["manual_count"] or 0), int(row["automatic_count"] or 0)
+        total = manual + automatic
+        if total < max(1, min_observations):
+            continue
+        is_manual = manual >= automatic
+        agreeing = manual if is_manual else automatic
+        confidence = min(99, int(100 * wilson_lower_bound(agreeing, total)))
+        skip_decode = agreeing == total and total >= skip_decode_after
+        learned[(row["model_code"], int(row["year"]))] = LearnedPattern(
+            manual, automatic, is_manual, confidence, skip_decode
+        )
+    return learned
+
+
+def file_signature(path: str) -> Optional[Tuple[int, int]]:
+    """(mtime_ns, size) of the rule file, None if it is missing"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
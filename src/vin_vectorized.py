@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Vectorized VIN classification for large corpora (e.g. re-classifying every
+stored VIN after the pattern tables change).
+
+VINs are packed into a fixed-width S17 NumPy array. The year comes from a
+256-entry lookup table indexed by byte position 9. The model code (positions
+4-8) and year code are reduced to distinct keys, each key is looked up once in
+the analyzer's pattern rules, and the result is spread back over all VINs to
+give their batch_analyze_vins category. VINs failing the check digit are
+invalid_vins. Keys with plant/serial-qualified rules are classified per VIN.
+Without NumPy the analyzer's per-VIN path is used instead.
+
+Usage:
+    python vin_vectorized.py [--check]
+        Classify every VIN in the database and print the summary;
+        --check also runs batch_analyze_vins and compares the results.
+"""
+import sys
+import time
+from typing import Dict, List, Optional, Sequence
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from vin_analyzer import Toyota4RunnerVINAnalyzer, check_digit_mask
+
+# Category codes, in batch_analyze_vins category names
+CATEGORIES = ("invalid_vins", "outside_target_years", "manual_candidates",
+              "automatic_confirmed", "needs_api_verification")
+INVALID, OUTSIDE, MANUAL, AUTOMATIC, NEEDS_API = range(len(CATEGORIES))
+
+
+def _verdict_category(is_manual: bool, confidence: int) -> int:
+    """Same decision as Toyota4RunnerVINAnalyzer.classify_listing for a 2nd/3rd gen verdict."""
+    if is_manual and confidence >= 80:
+        return MANUAL
+    if confidence < 80:
+        return NEEDS_API
+    return AUTOMATIC
+
+
+class VectorizedVINClassifier:
+    """Classify many VINs at once with the rules of a Toyota4RunnerVINAnalyzer."""
+
+    def __init__(self, analyzer: Optional[Toyota4RunnerVINAnalyzer] = None):
+        self.analyzer = analyzer or Toyota4RunnerVINAnalyzer()
+
+    def _year_lut(self):
+        year_lut = np.zeros(256, dtype=np.int16)
+        for code, year in self.analyzer.year_map.items():
+            year_lut[ord(code)] = year
+        return year_lut
+
+    def _key_category(self, rules, model_code: str, year: int) -> Optional[int]:
+        """Category of every VIN with this model code and year, None if it depends on plant/serial."""
+        if year <= self.analyzer.FIRST_GEN_MAX_YEAR:
+            return MANUAL
+        verdict, qualified = rules.lookup(model_code, year)
+        if qualified:
+            return None
+        if verdict is None:
+            return NEEDS_API  # Unknown pattern
+        return _verdict_category(verdict.is_manual, verdict.confidence)
+
+    def classify_vins(self, vins: Sequence[Optional[str]]):
+        """
+        Category code (index into CATEGORIES) for every VIN, plus a first gen mask.
+        Returns (categories, is_first_gen) as NumPy arrays.
+        """
+        analyzer = self.analyzer
+        count = len(vins)
+        categories = np.full(count, OUTSIDE, dtype=np.int8)
+        is_first_gen = np.zeros(count, dtype=bool)
+        categories[[i for i, vin in enumerate(vins) if not vin]] = INVALID
+
+        full_length = np.fromiter((i for i, vin in enumerate(vins) if vin and len(vin) == 17), dtype=np.intp)
+        if not len(full_length):
+            return categories, is_first_gen
+
+        # One byte per character so every VIN stays exactly 17 bytes wide
+        packed = "".join(vins[i] for i in full_length).encode("latin-1", "replace")
+        vin_array = np.frombuffer(packed, dtype="S17")
+        vin_bytes = vin_array.view(np.uint8).reshape(-1, 17)
+
+        years = self._year_lut()[vin_bytes[:, 9]]
+        in_range = ((vin_bytes[:, 0] == ord("J")) & (vin_bytes[:, 1] == ord("T")) & (vin_bytes[:, 2] == ord("3"))
+                    & (years >= analyzer.MIN_YEAR) & (years <= analyzer.MAX_YEAR))
+        malformed = in_range & ~check_digit_mask(vin_bytes)
+        categories[full_length[malformed]] = INVALID
+        in_range &= ~malformed
+
+        selected = full_length[in_range]
+        if not len(selected):
+            return categories, is_first_gen
+
+        # Positions 4-8 plus the year code: one rule lookup per distinct key
+        keys = np.ascontiguousarray(vin_bytes[in_range][:, [3, 4, 5, 6, 7, 9]]).view("S6").ravel()
+        unique_keys, key_ids = np.unique(keys, return_inverse=True)
+        rules = analyzer.rules  # One rule set for the whole batch, even if it is reloaded meanwhile
+        key_categories = np.empty(len(unique_keys), dtype=np.int8)
+        per_vin = np.zeros(len(unique_keys), dtype=bool)
+        for i, key in enumerate(unique_keys.tolist()):
+            category = self._key_category(rules, key[:5].decode("latin-1"), analyzer.year_map[chr(key[5])])
+            if category is None:
+                per_vin[i] = True
+            else:
+                key_categories[i] = category
+
+        categories[selected] = key_categories[key_ids]
+        is_first_gen[selected] = years[in_range] <= analyzer.FIRST_GEN_MAX_YEAR
+
+        # Keys with plant/serial qualified rules
+        for index in selected[per_vin[key_ids]].tolist():
+            result = analyzer.classify_vin(vins[index], rules)
+            categories[index] = _verdict_category(result.is_manual, result.confidence)
+        return categories, is_first_gen
+
+    def summarize(self, categories, is_first_gen) -> Dict:
+        """Summary counters as in batch_analyze_vins."""
+        counts = np.bincount(categories, minlength=len(CATEGORIES))
+        summary = self.analyzer.new_summary()
+        for code, category in enumerate(CATEGORIES):
+            summary[self.analyzer.SUMMARY_KEYS[category]] = int(counts[code])
+        summary["total_processed"] = int(len(categories) - counts[INVALID])
+        summary["first_gen_collected"] = int(np.count_nonzero(is_first_gen & (categories == MANUAL)))
+        return summary
+
+    def batch_analyze_vins(self, listings: List[Dict]) -> Dict:
+        """
+        Same categories and summary as Toyota4RunnerVINAnalyzer.batch_analyze_vins,
+        without the per-listing vin_analysis annotation.
+        """
+        if np is None:
+            return self.analyzer.batch_analyze_vins(listings)
+
+        categories, is_first_gen = self.classify_vins([listing.get("vin") for listing in listings])
+        results = {category: [] for category in CATEGORIES}
+        for listing, code in zip(listings, categories.tolist()):
+            results[CATEGORIES[code]].append(listing)
+        results["summary"] = self.summarize(categories, is_first_gen)
+        return results
+
+
+def main(argv: List[str]):
+    if argv and argv[0] not in ("--check",):
+        print(__doc__)
+        return
+
+    from database import Database
+    listings = [{"vin": vin} for vin in Database().iter_processed_vins()]
+    classifier = VectorizedVINClassifier()
+
+    started = time.perf_counter()
+    summary = classifier.batch_analyze_vins(listings)["summary"]
+    print(f"Classified {len(listings)} VINs in {time.perf_counter() - started:.3f}s "
+          f"({'NumPy' if np is not None else 'per-VIN fallback'})")
+    for key, value in summary.items():
+        print(f"  {key}: {value}")
+
+    if "--check" in argv:
+        started = time.perf_counter()
+        expected = classifier.analyzer.batch_analyze_vins(listings)["summary"]
+        print(f"batch_analyze_vins took {time.perf_counter() - started:.3f}s - "
+              f"{'same summary' if expected == summary else f'DIFFERENT: {expected}'}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
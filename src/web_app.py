@@ -3,6 +3,7 @@
 from flask import Flask, render_template, jsonify, request
 import sqlite3
 import json
+import json_codec
 import logging
 from datetime import datetime
 from pathlib import Path
@@ -136,8 +137,8 @@ def index():
             # Parse the raw listing data
             listing_data = {}
             if row['raw_listing_data']:
-                listing_data = json.loads(row['raw_listing_data'])
-        except (json.JSONDecodeError, TypeError):
+                listing_data = json_codec.loads(row['raw_listing_data'])
+        except (json_codec.DecodeError, TypeError):
             listing_data = {}
 
         # Determine vehicle category (with safe column access)
@@ -213,6 +214,7 @@ def index():
             # User tracking
             'is_seen': row['is_seen'] if 'is_seen' in row.keys() else False,
             'is_watched': row['is_watched'] if 'is_watched' in row.keys() else False,
+            'listing_status': row['listing_status'] if 'listing_status' in row.keys() else 'active',
             
             # Additional data
             'distance_from_origin': row['distance_from_origin'] if 'distance_from_origin' in row.keys() else None,
@@ -359,10 +361,18 @@ def refresh():
     """Run a new search"""
     try:
         from main import FourRunnerHunter
-        app.logger.info("Starting new 4Runner search...")
+        from scheduler import crawl_lock
 
-        hunter = FourRunnerHunter()
-        stats = hunter.search_all_sources()  # Search Auto.dev
+        with crawl_lock() as acquired:
+            if not acquired:
+                return jsonify({
+                    'success': False,
+                    'message': "A search is already running. Try again in a few minutes."
+                }), 409
+
+            app.logger.info("Starting new 4Runner search...")
+            hunter = FourRunnerHunter()
+            stats = hunter.search_all_sources()  # Search Auto.dev
 
         app.logger.info(f"Search completed: {stats}")
         
@@ -409,9 +419,9 @@ def vehicle_detail(vin):
 
     # Parse raw data
     try:
-        listing_data = json.loads(row['raw_listing_data']) if row['raw_listing_data'] else {}
-        vin_data = json.loads(row['raw_vin_data']) if 'raw_vin_data' in row.keys() and row['raw_vin_data'] else {}
-    except (json.JSONDecodeError, TypeError):
+        listing_data = json_codec.loads(row['raw_listing_data']) if row['raw_listing_data'] else {}
+        vin_data = json_codec.loads(row['raw_vin_data']) if 'raw_vin_data' in row.keys() and row['raw_vin_data'] else {}
+    except (json_codec.DecodeError, TypeError):
         listing_data = {}
         vin_data = {}
     